@@ -0,0 +1,67 @@
+# benchmarks/bench_flatten.py
+"""
+Micro-benchmark: flatten_measurement (por registro) vs flatten_page (columnar).
+
+    python -m benchmarks.bench_flatten --records 1000 --pages 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from src.api.measurements_structure import flatten_measurement, flatten_page
+
+
+def _fake_page(n: int) -> list[dict]:
+    page = []
+    for i in range(n):
+        ts = f"2025-08-01T{i % 24:02d}:00:00Z"
+        page.append({
+            "value": random.random() * 100,
+            "parameter": {"id": 2, "name": "pm25", "units": "µg/m³"},
+            "date": {"utc": ts, "local": ts.replace("Z", "-04:00")},
+            "period": {
+                "label": "raw", "interval": "01:00:00",
+                "datetimeFrom": {"utc": ts, "local": ts}, "datetimeTo": {"utc": ts, "local": ts},
+            },
+            "coverage": {
+                "expectedCount": 1, "expectedInterval": "01:00:00",
+                "observedCount": 1, "observedInterval": "01:00:00",
+                "percentComplete": 100.0, "percentCoverage": 100.0,
+                "datetimeFrom": {"utc": ts, "local": ts}, "datetimeTo": {"utc": ts, "local": ts},
+            },
+        })
+    return page
+
+
+def _time(fn, pages) -> float:
+    t0 = time.perf_counter()
+    for page in pages:
+        fn(page)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000, help="registros por página")
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = [_fake_page(args.records) for _ in range(args.pages)]
+    # mismo punto de llegada para ambos: un DataFrame por página
+    legacy = _time(lambda p: pd.DataFrame([flatten_measurement(m) for m in p]), pages)
+    columnar = _time(lambda p: flatten_page(p).to_pandas(), pages)
+    arrow_only = _time(flatten_page, pages)
+
+    total = args.records * args.pages
+    print(f"records={total}")
+    print(f"flatten_measurement + DataFrame : {legacy:.3f}s ({total / legacy:,.0f} rec/s)")
+    print(f"flatten_page + to_pandas        : {columnar:.3f}s ({total / columnar:,.0f} rec/s)  x{legacy / columnar:.1f}")
+    print(f"flatten_page (pa.Table)         : {arrow_only:.3f}s ({total / arrow_only:,.0f} rec/s)  x{legacy / arrow_only:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_preprocess.py
+"""
+Benchmark de la cadena QC → unidades → agregación horaria: motor pandas vs arrow.
+Cada motor corre en un proceso nuevo para medir su pico de memoria (maxrss).
+
+    python -m benchmarks.bench_preprocess --rows 2000000
+"""
+from __future__ import annotations
+
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def _fake_partition(n: int, path: str) -> None:
+    rng = np.random.default_rng(0)
+    params = ["pm25", "pm10", "pm1", "no2", "o3", "so2", "co", "relativehumidity", "temperature", "um003"]
+    ts = pd.Timestamp("2025-08-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 24 * 3600, n), unit="s")
+    table = pa.table({
+        "location_id": rng.integers(1, 300, n),
+        "sensor_id": rng.integers(1, 3000, n),
+        "location_name": pa.array(rng.choice(["A", "B", "C"], n)).dictionary_encode(),
+        "parameter": rng.choice(params, n),
+        "unit": rng.choice(["µg/m³", "ppm", "°C"], n),
+        "value": rng.normal(20, 10, n),
+        "datetime_from_utc": pa.array(ts, type=pa.timestamp("us", tz="UTC")),
+        "datetime_to_utc": pa.array(ts, type=pa.timestamp("us", tz="UTC")),
+    })
+    pq.write_table(table, path)
+
+
+def _run(engine: str, path: str) -> None:
+    from src.data import preprocess as pre
+
+    t0 = time.perf_counter()
+    table = pre._load_concat_table([path], columns=pre.READ_COLUMNS, parameters=pre.PARAMETERS)
+    if engine == "arrow":
+        from src.data import preprocess_arrow
+
+        long = preprocess_arrow.hourly_long(
+            table, pre.PARAMETERS, pre.POLLUTANTS, pre._unit_table
+        )
+        wide = pre._wide_from_long(long)
+    else:
+        df = table.to_pandas(ignore_metadata=True)
+        del table
+        wide = pre._resample_hourly_pivot(pre._ensure_date_utc(pre._normalize_units(pre._basic_qc(df))))
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{engine:7s}: {elapsed:.2f}s  peak RSS {peak_mb:,.0f} MB  ({len(wide)} horas)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--path", default="/tmp/bench_preprocess.parquet")
+    parser.add_argument("--engine", choices=["pandas", "arrow"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        _run(args.engine, args.path)
+        return
+    _fake_partition(args.rows, args.path)
+    print(f"rows={args.rows}")
+    for engine in ("pandas", "arrow"):
+        cmd = [sys.executable, "-m", "benchmarks.bench_preprocess", "--engine", engine, "--path", args.path]
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == "__main__":
+    main()
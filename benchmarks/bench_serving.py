@@ -0,0 +1,90 @@
+# benchmarks/bench_serving.py
+"""
+Latencia del servicio de predicción (src/serving/app.py) en proceso, vía
+TestClient: GET /predict/{location_id} y GET /predict (todas las estaciones)
+con un HistGradientBoosting del tamaño del de src.models.train (la
+predicción crece con TRAIN_HGB_MAX_ITER; --max-iter para comparar).
+
+Objetivo: p99 < TARGET_P99_MS. Medido en 1 CPU, 300 estaciones: con el modelo
+default (300 árboles) /predict/<id> cumple (~8ms) pero /predict de todas NO
+(~19ms, dominado por predict_proba); con --max-iter 100 ambos cumplen (~4 / ~8ms).
+
+    python -m benchmarks.bench_serving --locations 300 --requests 2000 [--max-iter 100]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+
+def _raw(locations: int, hours: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = locations * hours * 2
+    ts = pd.Timestamp("2025-08-01", tz="UTC") + pd.to_timedelta(np.repeat(np.arange(hours), locations * 2), unit="h")
+    return pd.DataFrame({
+        "sensor_id": np.tile(np.arange(locations * 2), hours),
+        "location_id": np.tile(np.repeat(np.arange(locations), 2), hours),
+        "parameter": np.tile(["pm25", "no2"], locations * hours),
+        "unit": "µg/m³",
+        "value": rng.uniform(5, 50, n),
+        "datetime_from_utc": ts,
+    })
+
+
+TARGET_P99_MS = 10.0
+
+
+def _percentiles(samples: list[float]) -> str:
+    ms = np.array(samples) * 1000
+    p99 = np.percentile(ms, 99)
+    verdict = "ok" if p99 < TARGET_P99_MS else f"NO cumple el objetivo p99 < {TARGET_P99_MS:g}ms"
+    return f"p50={np.percentile(ms, 50):.2f}ms p99={p99:.2f}ms ({verdict})"
+
+
+def main(locations: int, requests: int, max_iter: int | None = None) -> None:
+    from fastapi.testclient import TestClient
+
+    from src.data import preprocess as pre
+    from src.models import train
+    from src.serving import app as serving
+    from src.serving.online_features import OnlineFeatureStore
+
+    raw = _raw(locations, 12)
+    with patch.object(pre, "PANEL", True):
+        wide = pre._resample_hourly_pivot(pre._ensure_date_utc(raw))
+        feats = pre._add_target(pre._add_lags_and_rolls(pre._add_calendar_features(wide)))
+    X, y, _, features = train._training_frame(feats.assign(**{train.LABEL: (feats["pm25"] > 25).astype("Int8")}))
+    with patch.object(train, "HGB_MAX_ITER", max_iter or train.HGB_MAX_ITER):
+        model = train._fit("hgb", X, y)
+    bundle = {"model": model, "kind": "hgb", "features": features, "threshold": 0.5,
+              "granularity": "location", "version": "bench"}
+
+    with patch.object(train, "load_latest", return_value=bundle), patch.object(serving, "WARM_DAYS", 0), \
+         TestClient(serving.app) as client:
+        store: OnlineFeatureStore = serving.app.state.store
+        store.ingest(raw)
+        single, batch = [], []
+        for i in range(requests):
+            t0 = time.perf_counter()
+            client.get(f"/predict/{i % locations}")
+            single.append(time.perf_counter() - t0)
+        for _ in range(max(1, requests // 20)):
+            t0 = time.perf_counter()
+            client.get("/predict")
+            batch.append(time.perf_counter() - t0)
+    print(f"[bench] {len(features)} features, {model.max_iter} árboles, {locations} estaciones")
+    print(f"[bench] /predict/<id>  {_percentiles(single)}")
+    print(f"[bench] /predict (todas) {_percentiles(batch)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de latencia del servicio de predicción")
+    parser.add_argument("--locations", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-iter", type=int, default=None, help="default: TRAIN_HGB_MAX_ITER")
+    args = parser.parse_args()
+    main(args.locations, args.requests, args.max_iter)
@@ -0,0 +1,169 @@
+# src/api/catalog.py
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from src.api.locations import fetch_locations
+from src.utils.io import read_json, write_json
+
+UTC = timezone.utc
+
+CATALOG_TTL_HOURS = float(os.getenv("SENSOR_CATALOG_TTL_HOURS", "24"))
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(UTC).isoformat().replace("+00:00", "Z")
+
+
+@dataclass
+class SensorCatalog:
+    """
+    Catálogo persistente de locations/sensores de OpenAQ para un área.
+    Índices en memoria: by_location, by_sensor y by_parameter.
+    """
+
+    sensors: list[dict]
+    fetched_at: datetime
+    coordinates: tuple[float, float]
+    radius_meters: int
+    etag: str | None = None
+    last_modified: str | None = None
+    by_location: dict = field(default_factory=dict, init=False, repr=False)
+    by_sensor: dict = field(default_factory=dict, init=False, repr=False)
+    by_parameter: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.coordinates = tuple(float(c) for c in self.coordinates)
+        self._build_index()
+
+    def _build_index(self) -> None:
+        self.by_location, self.by_sensor, self.by_parameter = {}, {}, {}
+        for loc in self.sensors:
+            self.by_location[loc.get("id")] = loc
+            for s in loc.get("sensors", []):
+                param = (s.get("parameter") or {}).get("name")
+                self.by_sensor[s.get("id")] = {
+                    "sensor_id": s.get("id"),
+                    "parameter": param,
+                    "location_id": loc.get("id"),
+                    "location_name": loc.get("name", "Unnamed"),
+                }
+                self.by_parameter.setdefault(param, []).append(s.get("id"))
+
+    def is_fresh(self, now: datetime, ttl: timedelta) -> bool:
+        return now - self.fetched_at < ttl
+
+    def matches(self, coordinates: tuple, radius_meters: int) -> bool:
+        return self.coordinates == tuple(float(c) for c in coordinates) and self.radius_meters == radius_meters
+
+    def sensor_doc(self) -> dict:
+        """Mismo formato que sensors_metadata.json (lo que consume FetchSensorData)."""
+        return {"sensors": self.sensors}
+
+    def to_doc(self) -> dict:
+        return {
+            "metadata": {
+                "fetched_at": _iso(self.fetched_at),
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "center_coordinates": list(self.coordinates),
+                "radius_meters": self.radius_meters,
+                "total_sensors": len(self.sensors),
+            },
+            "sensors": self.sensors,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "SensorCatalog":
+        meta = doc["metadata"]
+        return cls(
+            sensors=doc["sensors"],
+            fetched_at=datetime.fromisoformat(meta["fetched_at"].replace("Z", "+00:00")),
+            coordinates=tuple(meta["center_coordinates"]),
+            radius_meters=int(meta["radius_meters"]),
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+        )
+
+
+# cache en proceso: path → catálogo (evita releer el JSON en cada run/ciudad)
+_MEMO: dict[str, SensorCatalog] = {}
+_MEMO_LOCK = threading.Lock()
+
+
+def load_sensor_catalog(
+    path: str,
+    coordinates: tuple,
+    radius_meters: int,
+    api_key: str | None = None,
+    ttl_hours: float = CATALOG_TTL_HOURS,
+    force_refresh: bool = False,
+    now: datetime | None = None,
+) -> SensorCatalog:
+    """
+    Devuelve el catálogo de sensores para (coordinates, radius_meters):
+
+    1. En memoria o en `path` y dentro del TTL → cero llamadas a /locations.
+    2. Vencido → revalida con ETag / If-Modified-Since; un 304 sólo renueva fetched_at.
+    3. Sin catálogo (o cambió el área) → descarga completa y persiste en `path`.
+
+    Si la revalidación falla y hay un catálogo viejo, se usa el viejo.
+    """
+    now = now or datetime.now(UTC)
+    ttl = timedelta(hours=ttl_hours)
+
+    with _MEMO_LOCK:
+        catalog = _MEMO.get(path)
+    if catalog is None:
+        try:
+            catalog = SensorCatalog.from_doc(read_json(path))
+        except FileNotFoundError:
+            catalog = None
+        except Exception as e:
+            print(f"[catalog] warning: catálogo ilegible en {path} ({e}); se descarga de nuevo")
+            catalog = None
+    if catalog is not None and not catalog.matches(coordinates, radius_meters):
+        print(f"[catalog] área distinta a la del catálogo en {path}; se descarga de nuevo")
+        catalog = None
+
+    if catalog is not None and not force_refresh and catalog.is_fresh(now, ttl):
+        print(f"[catalog] hit ({len(catalog.by_sensor)} sensors, fetched_at={_iso(catalog.fetched_at)})")
+        with _MEMO_LOCK:
+            _MEMO[path] = catalog
+        return catalog
+
+    try:
+        resp = fetch_locations(
+            coordinates,
+            radius_meters,
+            API_KEY_OVERRIDE=api_key,
+            etag=catalog.etag if catalog and not force_refresh else None,
+            last_modified=catalog.last_modified if catalog and not force_refresh else None,
+        )
+    except Exception as e:
+        if catalog is None:
+            raise
+        print(f"[catalog] warning: revalidación falló ({e}); usando catálogo vencido")
+        return catalog
+
+    if resp["not_modified"]:
+        print("[catalog] 304 not modified; renovando TTL")
+        catalog.fetched_at = now
+    else:
+        catalog = SensorCatalog(
+            sensors=resp["sensors"],
+            fetched_at=now,
+            coordinates=coordinates,
+            radius_meters=radius_meters,
+            etag=resp["etag"],
+            last_modified=resp["last_modified"],
+        )
+        print(f"[catalog] refreshed: {len(catalog.sensors)} locations")
+
+    write_json(catalog.to_doc(), path)
+    with _MEMO_LOCK:
+        _MEMO[path] = catalog
+    return catalog
@@ -0,0 +1,148 @@
+# src/api/client.py
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.api.ratelimit import TokenBucket, get_limiter
+
+URL_BASE = "https://api.openaq.org/v3"
+
+POOL_SIZE = int(os.getenv("OPENAQ_POOL_SIZE", "10"))
+MAX_RETRIES = int(os.getenv("OPENAQ_MAX_RETRIES", "5"))
+BACKOFF_BASE_S = float(os.getenv("OPENAQ_BACKOFF_BASE_S", "1.0"))
+BACKOFF_MAX_S = float(os.getenv("OPENAQ_BACKOFF_MAX_S", "60"))
+
+# Sólo estos códigos se reintentan; 401/403/404/422 fallan de inmediato
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenAQClient:
+    """
+    Cliente HTTP reutilizable para la API v3 de OpenAQ.
+
+    - Una `requests.Session` con pool de conexiones (keep-alive, sin TLS por página).
+    - Todas las requests pasan por el token bucket compartido.
+    - Lee `x-ratelimit-remaining`/`x-ratelimit-reset`: si la cuota se agotó espera
+      al reset; si queda cuota no duerme.
+    - Backoff exponencial con jitter SOLO para 429/5xx y errores de conexión,
+      respetando `Retry-After`. Los 4xx restantes se propagan sin reintentar.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str = URL_BASE,
+        pool_size: int = POOL_SIZE,
+        max_retries: int = MAX_RETRIES,
+        backoff_base_s: float = BACKOFF_BASE_S,
+        backoff_max_s: float = BACKOFF_MAX_S,
+        limiter: TokenBucket | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.limiter = limiter or get_limiter()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+
+        self._quota_lock = threading.Lock()
+        self._quota_remaining: float | None = None
+        self._quota_reset_at: float | None = None  # time.monotonic()
+
+    # ---------- cuota ----------
+    def _update_quota(self, headers) -> None:
+        remaining = _to_float(headers.get("x-ratelimit-remaining")) if headers else None
+        reset = _to_float(headers.get("x-ratelimit-reset")) if headers else None
+        if remaining is None:
+            return
+        with self._quota_lock:
+            self._quota_remaining = remaining
+            self._quota_reset_at = time.monotonic() + reset if reset is not None else None
+
+    def _wait_for_quota(self) -> None:
+        with self._quota_lock:
+            if self._quota_remaining is None or self._quota_remaining > 0:
+                return
+            # todos los threads esperan al mismo reset; después hay cuota de nuevo
+            wait = (self._quota_reset_at or 0.0) - time.monotonic()
+        if wait > 0:
+            print(f"[openaq] quota exhausted; waiting {wait:.1f}s for reset")
+            time.sleep(wait)
+
+    def _backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_s)
+        # full jitter: U(0, base * 2^attempt)
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt))
+
+    # ---------- requests ----------
+    def url(self, path: str) -> str:
+        return path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path: str, params: dict | None = None, headers: dict | None = None, timeout: int = 60) -> requests.Response:
+        url = self.url(path)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_quota()
+            self.limiter.acquire()
+            try:
+                resp = self.session.get(url, headers=headers, params=params, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"[openaq] {type(e).__name__} on {url}; retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._update_quota(resp.headers)
+            if resp.status_code in RETRY_STATUS and attempt < self.max_retries:
+                delay = self._backoff(attempt, _to_float(resp.headers.get("Retry-After")))
+                print(f"[openaq] HTTP {resp.status_code} on {url}; retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            resp.raise_for_status()
+            return resp
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_CLIENTS: dict[str | None, OpenAQClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(api_key: str | None = None, pool_size: int | None = None) -> OpenAQClient:
+    """
+    Cliente compartido (un pool de conexiones por API key y proceso).
+    `pool_size` sólo agranda el pool si hace falta (p.ej. multi-ciudad con más threads).
+    """
+    api_key = api_key or os.getenv("OPENAQ_API_KEY")
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(api_key)
+        if client is None or (pool_size and pool_size > client.pool_size):
+            # no se cierra el anterior: puede haber threads usándolo todavía
+            client = OpenAQClient(api_key=api_key, pool_size=max(pool_size or 0, POOL_SIZE))
+            _CLIENTS[api_key] = client
+        return client
@@ -1,41 +1,43 @@
 import os
 import json
-import time
-import requests
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 from prefect import task
+from src.api.client import get_client
 
 project_root = Path(__file__).resolve().parents[2]
 dotenv_path = project_root / ".env"
 load_dotenv(dotenv_path=dotenv_path, override=True)
 
 API_KEY = os.getenv("OPENAQ_API_KEY") 
-API_URL = "https://api.openaq.org/v3/locations"
+API_URL = "locations"
 
-@task
-def FindSensors(
-    COORDINATES: tuple = (-33.4489, -70.6693),  # Default to Plaza de Armas coordinates
-    RADIUS_METERS: int = 25000,  # Default to 25km radius around center
-    OUTPUT_FILE: str = "pollution_prediction/data/raw/sensors_metadata.json",
-    LOCATION_LABEL: str = "Santiago, Chile",
+def fetch_locations(
+    COORDINATES: tuple,
+    RADIUS_METERS: int,
     API_KEY_OVERRIDE: str | None = None,
-):
+    etag: str | None = None,
+    last_modified: str | None = None,
+    strict: bool = True,
+) -> dict:
     """
-    Devuelve la lista de 'locations' (sensors) cerca de COORDINATES.
-    Si OUTPUT_FILE es None, no escribe a disco (solo retorna).
+    Pagina /v3/locations. Con etag/last_modified manda If-None-Match /
+    If-Modified-Since en la primera página: un 304 corta sin bajar nada.
+    strict=False replica el comportamiento histórico (ante error, devuelve lo que haya).
+    Devuelve {"sensors", "etag", "last_modified", "not_modified"}.
     """
     headers = {
         "Accept": "application/json",
-        "X-API-Key": API_KEY
+        "X-API-Key": API_KEY_OVERRIDE or API_KEY
     }
-    
+    client = get_client(API_KEY_OVERRIDE or API_KEY)
+
     sensors_list = []
+    out = {"sensors": sensors_list, "etag": None, "last_modified": None, "not_modified": False}
     page = 1
     has_more = True
-    
-    print(f"Fetching sensor metadata within {RADIUS_METERS/1000}km of {LOCATION_LABEL}...")
+
     while has_more:
         params = {
             "coordinates": f"{COORDINATES[0]},{COORDINATES[1]}",
@@ -43,10 +45,21 @@ def FindSensors(
             "limit": 1000,  # Max allowed per page
             "page": page,
         }
-        
+        page_headers = dict(headers)
+        if page == 1 and etag:
+            page_headers["If-None-Match"] = etag
+        if page == 1 and last_modified:
+            page_headers["If-Modified-Since"] = last_modified
+
         try:
-            response = requests.get(API_URL, headers=headers, params=params, timeout=30)
-            response.raise_for_status()
+            response = client.get(API_URL, headers=page_headers, params=params, timeout=30)
+            if page == 1:
+                if response.status_code == 304:
+                    out["not_modified"] = True
+                    return out
+                resp_headers = response.headers or {}
+                out["etag"] = resp_headers.get("ETag")
+                out["last_modified"] = resp_headers.get("Last-Modified")
             data = response.json()
             
             sensors_list.extend(data["results"])
@@ -54,11 +67,30 @@ def FindSensors(
             page += 1
             
             print(f"Page {page-1}: Found {len(data['results'])} sensors (Total: {len(sensors_list)})")
-            time.sleep(0.1)  # Respect rate limits
             
         except Exception as e:
             print(f"Error fetching page {page}: {str(e)}")
+            if strict:
+                raise
             break
+    return out
+
+@task
+def FindSensors(
+    COORDINATES: tuple = (-33.4489, -70.6693),  # Default to Plaza de Armas coordinates
+    RADIUS_METERS: int = 25000,  # Default to 25km radius around center
+    OUTPUT_FILE: str = "pollution_prediction/data/raw/sensors_metadata.json",
+    LOCATION_LABEL: str = "Santiago, Chile",
+    API_KEY_OVERRIDE: str | None = None,
+):
+    """
+    Devuelve la lista de 'locations' (sensors) cerca de COORDINATES.
+    Si OUTPUT_FILE es None, no escribe a disco (solo retorna).
+    """
+    print(f"Fetching sensor metadata within {RADIUS_METERS/1000}km of {LOCATION_LABEL}...")
+    sensors_list = fetch_locations(
+        COORDINATES, RADIUS_METERS, API_KEY_OVERRIDE=API_KEY_OVERRIDE, strict=False
+    )["sensors"]
 
     result = {
         "metadata": {
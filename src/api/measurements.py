@@ -1,21 +1,34 @@
 import os
 import requests
 import json
-import time
+import threading
 import fsspec
 import pandas as pd
+import pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 from prefect import task
-from src.api.measurements_structure import flatten_measurement  # tu helper
+from src.api.measurements_structure import MEASUREMENT_SCHEMA, conform_table, flatten_page, page_to_batch, with_sensor_meta  # tu helper
+from src.api.client import URL_BASE, get_client
+from src.utils.io import AtomicParquetWriter, write_parquet_atomic
 
 project_root = Path(__file__).resolve().parents[2]
 dotenv_path = project_root / ".env"
 load_dotenv(dotenv_path=dotenv_path, override=True)
 
 API_KEY = os.getenv("OPENAQ_API_KEY") 
-URL_BASE = "https://api.openaq.org/v3"
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "1"))  # 1 = secuencial
+STREAM_ROW_GROUP = int(os.getenv("STREAM_ROW_GROUP", "50000"))  # filas por flush del writer
+
+DEFAULT_PARAMETERS = [
+    "pm25", "pm10", "pm1", "no2", "o3", "so2", "co",
+    "relativehumidity", "temperature", "um003",
+]
+ALLOWED_LOCATIONS = [25,45,846,852,967,2845837,2845838]
+ALLOWED_SENSORS = [9213887,9213897,1047,4445,4489,4533,4549,1044,2271,3190,4099,4100,9213871,9213876,
+        9213861,9213880,4643,9213884,9213893,9213881,9213889]
 
 def load_sensor_data(input_file: str):
     """Load sensor metadata from a JSON file."""
@@ -25,24 +38,134 @@ def load_sensor_data(input_file: str):
 def _iso_now():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-@task(retries=3,retry_delay_seconds=2,log_prints=True)
+def _parse_iso(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+def split_window(start_date: str, end_date: str, chunk: timedelta = timedelta(days=7)) -> list[tuple[str, str]]:
+    """
+    Parte [start_date, end_date) en ventanas consecutivas de tamaño `chunk`
+    (la última puede ser más corta). Fechas ISO con 'Z'.
+    """
+    if chunk <= timedelta(0):
+        raise ValueError("chunk must be positive")
+    start, end = _parse_iso(start_date), _parse_iso(end_date)
+    windows = []
+    while start < end:
+        stop = min(start + chunk, end)
+        windows.append((start.strftime("%Y-%m-%dT%H:%M:%SZ"), stop.strftime("%Y-%m-%dT%H:%M:%SZ")))
+        start = stop
+    return windows
+
+@task(log_prints=True)
 def FetchMeasurements(headers,params,API_URL):
-    """Get measurements for a specific sensor and parameter"""    
+    """
+    Get measurements for a specific sensor and parameter.
+    Reintentos (429/5xx) y rate limit los maneja el cliente compartido.
+    """    
     all_results = []
+    for results in iter_measurement_pages(headers, params, API_URL):
+        all_results.extend(results)
+    return all_results
+
+def iter_measurement_pages(headers, params, API_URL):
+    """Generador: entrega cada página de 'results' apenas llega (no acumula)."""
+    params = dict(params)  # cada thread pagina con su propia copia
+    # el cliente (y su cuota) es el de la key que va en los headers
+    client = get_client((headers or {}).get("X-API-Key") or API_KEY)
     page = 1
     while True:
         params["page"] = page
-        resp = requests.get(API_URL, headers=headers, params=params, timeout=60)
-        resp.raise_for_status()
+        resp = client.get(API_URL, headers=headers, params=params, timeout=60)
         data = resp.json()
         results = data.get("results", [])
         if not results:
             break
-        all_results.extend(results)
         print(f"Fetched page {page} with {len(results)} records.")
+        yield results
         page += 1
-        time.sleep(0.25)  # cuida rate limit
-    return all_results
+
+def _iter_sensor_jobs(sensor_data: dict, PARAMETERS, allowed_locations, allowed_sensors) -> list[dict]:
+    """Lista (en orden) de sensores a consultar: uno por estación/parámetro permitido."""
+    jobs = []
+    for i, station in enumerate(sensor_data["sensors"]):
+        location_id = station.get("id", None)
+        location_sensors = len(station['sensors'])
+        location_name = station.get('name', 'Unnamed')
+        print(f"\nProcessing station {i+1}/ Location {location_id} /  {location_sensors} sensors: {location_name}")
+        if allowed_locations and location_id not in allowed_locations:
+            print(f"Skipping station {location_id}.")
+            continue
+
+        available_measurements = { 
+            value :measurement.get("id", None)
+            for measurement in station["sensors"]
+            for key, value in measurement.get("parameter", {}).items()
+            if key == 'name' and value in PARAMETERS
+        }
+
+        if not available_measurements:
+            print("No requested parameters at this station.")
+            continue
+
+        print(f"Available measurements: {list(available_measurements.keys())}")
+        
+        for parameter in available_measurements:
+            sensor_id = available_measurements[parameter]
+            print(sensor_id)
+            if allowed_sensors and sensor_id not in allowed_sensors:
+                print(f"Skipping station {sensor_id}.")
+                continue
+            jobs.append({
+                "sensor_id": sensor_id,
+                "parameter": parameter,
+                "location_id": location_id,
+                "location_name": location_name,
+            })
+    return jobs
+
+def _sensor_meta(job: dict) -> dict:
+    return {
+        "sensor_id": job["sensor_id"],
+        "parameter_meta": job["parameter"],
+        "location_id": job["location_id"],
+        "location_name": job["location_name"],
+    }
+
+def _fetch_sensor_table(job: dict, headers: dict, start_date: str, end_date: str, limit: int, raise_errors: bool = False) -> pa.Table | None:
+    """
+    Trae y aplana las mediciones de UN sensor como pa.Table (MEASUREMENT_SCHEMA).
+    None si no hay datos, o si falla (salvo raise_errors=True, p.ej. en backfill
+    para registrar el chunk fallido).
+    """
+    sensor_id = job["sensor_id"]
+    parameter = job["parameter"]
+    api_measurements_url = f"{URL_BASE}/sensors/{sensor_id}/measurements"
+    params = {
+        "datetime_from": start_date,
+        "datetime_to": end_date,
+        "limit": limit,
+     }
+    try:
+        results = FetchMeasurements(headers, params, api_measurements_url)
+        print(f"Fetched {len(results)} records for sensor {sensor_id} ({parameter}) between {start_date} and {end_date}.")
+        if not results:
+            return None
+        # metadata como columnas constantes, sin replicar un DataFrame por fila
+        return with_sensor_meta(flatten_page(results), _sensor_meta(job))
+    except requests.exceptions.RequestException as e:
+        print(f"Request error sensor {sensor_id} ({parameter}): {e}")
+        if raise_errors:
+            raise
+    except KeyError as e:
+        print(f"KeyError for sensor {sensor_id} ({parameter}): {e}")
+        if raise_errors:
+            raise
+    return None
+
+def _fetch_sensor_frame(job: dict, headers: dict, start_date: str, end_date: str, limit: int, raise_errors: bool = False) -> pd.DataFrame | None:
+    """Igual que _fetch_sensor_table pero como DataFrame."""
+    table = _fetch_sensor_table(job, headers, start_date, end_date, limit, raise_errors=raise_errors)
+    return None if table is None else table.to_pandas()
 
 @task
 def FetchSensorData(
@@ -52,21 +175,26 @@ def FetchSensorData(
         limit: int =1000,
         INPUT_FILE: str = project_root / "data/raw/sensors_metadata.json",
         output_file:  str | None = None, # f"pollution_prediction/data/raw/sensors_measurements_{datetime.now().strftime('%y%m%d%H%M%S')}.parquet",
-        allowed_locations=[25,45,846,852,967,2845837,2845838],
-        allowed_sensors = [9213887,9213897,1047,4445,4489,4533,4549,1044,2271,3190,4099,4100,9213871,9213876,
-        9213861,9213880,4643,9213884,9213893,9213881,9213889],
+        allowed_locations=ALLOWED_LOCATIONS,
+        allowed_sensors = ALLOWED_SENSORS,
         API_KEY_OVERRIDE: str | None = None,
+        max_workers: int | None = None,
+        sensor_data: dict | None = None,
+        start_dates: dict | None = None,
 ):
     """
     Lee sensors del JSON (FindSensors), itera por parámetro y sensor permitido,
     trae mediciones y devuelve un DataFrame. Si 'output_file' se pasa, guarda parquet.
+    Con max_workers > 1 (o FETCH_WORKERS) los sensores se traen en paralelo,
+    compartiendo un único rate limiter. Si se pasa 'sensor_data' (p.ej. el
+    catálogo en memoria) no se lee INPUT_FILE.
+    'start_dates' ({sensor_id: iso}) permite que cada sensor arranque desde su
+    propio checkpoint. El resultado por sensor queda en
+    df.attrs["sensor_status"] = {sensor_id: "ok" | "error"}.
     """
     if PARAMETERS is None:
         # default multi-parámetro
-        PARAMETERS = [
-            "pm25", "pm10", "pm1", "no2", "o3", "so2", "co",
-            "relativehumidity", "temperature", "um003",
-        ]
+        PARAMETERS = DEFAULT_PARAMETERS
     # ventana por defecto (últimas 24h) si no pasan fechas
     if end_date is None:
         end_date = _iso_now()
@@ -79,83 +207,197 @@ def FetchSensorData(
         "X-API-Key": API_KEY_OVERRIDE or API_KEY,
     }
     
-    sensor_data = load_sensor_data(INPUT_FILE)
-    df_list = []
-    
-    for i, station in enumerate(sensor_data["sensors"]):
-        location_id = station.get("id", None)
-        location_sensors = len(station['sensors'])
-        location_name = station.get('name', 'Unnamed')
-        print(f"\nProcessing station {i+1}/ Location {location_id} /  {location_sensors} sensors: {location_name}")
-        if allowed_locations and location_id not in allowed_locations:
-            print(f"Skipping station {location_id}.")
-            continue
+    if sensor_data is None:
+        sensor_data = load_sensor_data(INPUT_FILE)
+    jobs = _iter_sensor_jobs(sensor_data, PARAMETERS, allowed_locations, allowed_sensors)
 
-        available_measurements = { 
-            value :measurement.get("id", None)
-            for measurement in station["sensors"]
-            for key, value in measurement.get("parameter", {}).items()
-            if key == 'name' and value in PARAMETERS
-        }
+    start_dates = start_dates or {}
+    sensor_status = {}
 
-        if not available_measurements:
-            print("No requested parameters at this station.")
-            continue
+    def _fetch(job):
+        since = start_dates.get(job["sensor_id"], start_date)
+        try:
+            table = _fetch_sensor_table(job, headers, since, end_date, limit, raise_errors=True)
+        except (requests.exceptions.RequestException, KeyError):
+            sensor_status[job["sensor_id"]] = "error"
+            return None
+        sensor_status[job["sensor_id"]] = "ok"
+        return table
 
-        print(f"Available measurements: {list(available_measurements.keys())}")
-        
-        for parameter in available_measurements:
-            sensor_id = available_measurements[parameter]
-            print(sensor_id)
-            if allowed_sensors and sensor_id not in allowed_sensors:
-                print(f"Skipping station {sensor_id}.")
-                continue
-            
-            api_measurements_url = f"{URL_BASE}/sensors/{sensor_id}/measurements"
-            df_sensor_metadata = pd.DataFrame({'sensor_id': sensor_id, 'parameter_meta': parameter, 'location_id': location_id, 'location_name': location_name}, index=[0]) 
-            params = {
-                "datetime_from": start_date,
-                "datetime_to": end_date,
-                "limit": limit,
-             }
-            try:
-                results = FetchMeasurements(headers, params, api_measurements_url)
-                print(f"Fetched {len(results)} records for sensor {sensor_id} ({parameter}) between {start_date} and {end_date}.")
-                if not results:
-                    continue
-                    
-                flattened = [flatten_measurement(m) for m in results]
-                df = pd.DataFrame(flattened)
-                if df.empty:
-                    continue
-
-                df = pd.concat([pd.concat([df_sensor_metadata] * len(flattened), ignore_index=True),df], axis=1)
-                df_list.append(df)
-            except requests.exceptions.RequestException as e:
-                print(f"Request error sensor {sensor_id} ({parameter}): {e}")
-            except KeyError as e:
-                print(f"KeyError for sensor {sensor_id} ({parameter}): {e}")
-            time.sleep(0.25)  # Sleep to avoid hitting API rate limits
+    workers = max_workers or FETCH_WORKERS
+    if workers > 1 and len(jobs) > 1:
+        # Modo concurrente: el token bucket compartido limita la tasa total;
+        # map() conserva el orden de los sensores → mismo DataFrame que en secuencial
+        print(f"Fetching {len(jobs)} sensors with {workers} workers.")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openaq") as pool:
+            tables = list(pool.map(_fetch, jobs))
+    else:
+        tables = [_fetch(job) for job in jobs]
+    tables = [t for t in tables if t is not None]
     
-    if not df_list:
+    if not tables:
         print("No data fetched.")
-        return pd.DataFrame()
+        empty = pd.DataFrame()
+        empty.attrs["sensor_status"] = sensor_status
+        return empty
     
-    combined_df = pd.concat(df_list, ignore_index=True)
+    # todas con MEASUREMENT_SCHEMA: concat sin copia; un único to_pandas al
+    # final (los diccionarios se unifican en categorías)
+    combined = pa.concat_tables(tables)
+    combined_df = combined.to_pandas()
+    combined_df.attrs["sensor_status"] = sensor_status
     
     if output_file:
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        combined_df.to_parquet(output_path, index=False)
+        # se escribe la tabla Arrow (esquema versionado), no el DataFrame:
+        # los tipos no dependen de lo que pandas infiera
+        write_parquet_atomic(conform_table(combined), str(output_file))
         print(f"Data saved to {output_file}")            
     
     return combined_df
 
+class _StreamingParquetSink:
+    """
+    Acumula RecordBatches y los vuelca a un AtomicParquetWriter cada
+    `row_group_size` filas. Thread-safe: varios sensores en paralelo escriben al
+    mismo archivo. El archivo se abre con el primer batch (sin datos → no se
+    escribe nada) y aparece en `path` recién en close(); abort() descarta el
+    temporal: un run que falla a mitad no deja un parquet truncado en la partición.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema = MEASUREMENT_SCHEMA, row_group_size: int = STREAM_ROW_GROUP):
+        self.path = str(path)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._pending: list[pa.RecordBatch] = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self.bytes = 0
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        if self._writer is None:
+            self._writer = AtomicParquetWriter(self.path, self.schema)
+        self._writer.write(pa.Table.from_batches(self._pending, schema=self.schema))
+        self._pending, self._pending_rows = [], 0
+
+    def append(self, batch: pa.RecordBatch) -> None:
+        with self._lock:
+            self._pending.append(batch)
+            self._pending_rows += batch.num_rows
+            self.rows += batch.num_rows
+            if self._pending_rows >= self.row_group_size:
+                self._flush_locked()
+
+    def close(self) -> int:
+        with self._lock:
+            self._flush_locked()
+            if self._writer is not None:
+                self.bytes = self._writer.commit().bytes
+        return self.rows
+
+    def abort(self) -> None:
+        with self._lock:
+            self._pending, self._pending_rows = [], 0
+            if self._writer is not None:
+                self._writer.abort()
+                self._writer = None
+
+def _stream_sensor(job: dict, headers: dict, start_date: str, end_date: str, limit: int, sink: _StreamingParquetSink) -> str:
+    """
+    Página → flatten → RecordBatch → sink. Memoria acotada a una página por sensor.
+    Devuelve "ok" o "error" (un error a mitad de camino deja páginas parciales).
+    """
+    sensor_id = job["sensor_id"]
+    parameter = job["parameter"]
+    sensor_meta = _sensor_meta(job)
+    params = {
+        "datetime_from": start_date,
+        "datetime_to": end_date,
+        "limit": limit,
+    }
+    rows = 0
+    status = "ok"
+    try:
+        for results in iter_measurement_pages(headers, params, f"{URL_BASE}/sensors/{sensor_id}/measurements"):
+            sink.append(page_to_batch(results, sensor_meta))
+            rows += len(results)
+    except requests.exceptions.RequestException as e:
+        print(f"Request error sensor {sensor_id} ({parameter}): {e}")
+        status = "error"
+    except KeyError as e:
+        print(f"KeyError for sensor {sensor_id} ({parameter}): {e}")
+        status = "error"
+    print(f"Streamed {rows} records for sensor {sensor_id} ({parameter}) between {start_date} and {end_date}.")
+    return status
+
+@task(log_prints=True)
+def StreamSensorData(
+        output_file: str,
+        PARAMETERS = None,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        limit: int = 1000,
+        INPUT_FILE: str = project_root / "data/raw/sensors_metadata.json",
+        allowed_locations=ALLOWED_LOCATIONS,
+        allowed_sensors=ALLOWED_SENSORS,
+        API_KEY_OVERRIDE: str | None = None,
+        max_workers: int | None = None,
+        row_group_size: int = STREAM_ROW_GROUP,
+        sensor_data: dict | None = None,
+        start_dates: dict | None = None,
+) -> dict:
+    """
+    Variante en streaming de FetchSensorData: cada página se aplana al llegar y
+    se escribe vía ParquetWriter en `output_file` (local o gs://), con el mismo
+    esquema/columnas. La memoria no crece con el largo de la ventana.
+    Devuelve {"rows": filas escritas (0 → no se crea archivo),
+              "sensor_status": {sensor_id: "ok" | "error"}}.
+    """
+    if PARAMETERS is None:
+        PARAMETERS = DEFAULT_PARAMETERS
+    if end_date is None:
+        end_date = _iso_now()
+    if start_date is None:
+        start_dt = datetime.fromisoformat(end_date.replace("Z", "+00:00")) - timedelta(hours=24)
+        start_date = start_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    headers = {
+        "Accept": "application/json",
+        "X-API-Key": API_KEY_OVERRIDE or API_KEY,
+    }
+    if sensor_data is None:
+        sensor_data = load_sensor_data(INPUT_FILE)
+    jobs = _iter_sensor_jobs(sensor_data, PARAMETERS, allowed_locations, allowed_sensors)
+    sink = _StreamingParquetSink(output_file, row_group_size=row_group_size)
+    start_dates = start_dates or {}
+
+    def _run(job):
+        since = start_dates.get(job["sensor_id"], start_date)
+        return _stream_sensor(job, headers, since, end_date, limit, sink)
+
+    workers = max_workers or FETCH_WORKERS
+    try:
+        if workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openaq") as pool:
+                statuses = list(pool.map(_run, jobs))
+        else:
+            statuses = [_run(job) for job in jobs]
+    except BaseException:
+        # sólo se publica un archivo completo: si el loop falla, nada en output_file
+        sink.abort()
+        raise
+    rows = sink.close()
+    print(f"Streamed {rows} rows → {output_file}" if rows else "No data fetched.")
+    return {"rows": rows, "sensor_status": {job["sensor_id"]: st for job, st in zip(jobs, statuses)}}
+
 if __name__ == "__main__":
+    # Para backfills largos usa el modo por chunks: python -m src.data.extract --backfill-start ...
     print("Fetching sensor data from OpenAQ...")
     PARAMETERS=["pm25", "pm10","pm1", "no2", "o3", "so2", "co","relativehumidity", "temperature","um003"]
-    start_date= "2025-01-01T00:00:00Z",  
-    end_date= "2025-08-16T00:00:00Z",  
-    output_file = f"data/raw/sensors_measurements_20250101_20250816.parquet"
+    start_date= "2025-08-01T00:00:00Z"
+    end_date= "2025-08-02T00:00:00Z"
+    output_file = f"data/raw/sensors_measurements_20250801_20250802.parquet"
     data = FetchSensorData(PARAMETERS = PARAMETERS, start_date = start_date, end_date = end_date, output_file=output_file) 
-    
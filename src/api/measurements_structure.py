@@ -2,6 +2,11 @@
 
 from __future__ import annotations
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
 def flatten_measurement(measurement: dict) -> dict:
     # parameter puede ser dict o string
     param = measurement.get("parameter")
@@ -58,3 +63,345 @@ def flatten_measurement(measurement: dict) -> dict:
         "coverage_datetime_to_utc": _get(coverage, "datetimeTo", "utc"),
         "coverage_datetime_to_local": _get(coverage, "datetimeTo", "local"),
     }
+
+
+# ----------------------------
+# Esquema fijo (Arrow) del output de flatten_measurement + metadata del sensor
+# ----------------------------
+
+UTC_TS = pa.timestamp("us", tz="UTC")
+DICT_STR = pa.dictionary(pa.int32(), pa.string())
+
+# Metadata del sensor: constante dentro de cada sensor (ver with_sensor_meta)
+SENSOR_META_FIELDS = [
+    pa.field("sensor_id", pa.int64()),
+    pa.field("parameter_meta", DICT_STR),
+    pa.field("location_id", pa.int64()),
+    pa.field("location_name", DICT_STR),
+]
+
+MEASUREMENT_FIELDS = [
+    pa.field("value", pa.float64()),
+    pa.field("parameter", DICT_STR),
+    pa.field("unit", DICT_STR),
+    pa.field("timestamp", UTC_TS),
+    pa.field("timestamp_local", pa.string()),   # offset local variable → string
+    pa.field("period_label", pa.string()),
+    pa.field("period_interval", pa.string()),
+    pa.field("datetime_from_utc", UTC_TS),
+    pa.field("datetime_from_local", pa.string()),
+    pa.field("datetime_to_utc", UTC_TS),
+    pa.field("datetime_to_local", pa.string()),
+    pa.field("coverage_expectedCount", pa.int64()),
+    pa.field("coverage_expectedInterval", pa.string()),
+    pa.field("coverage_observedCount", pa.int64()),
+    pa.field("coverage_observedInterval", pa.string()),
+    pa.field("coverage_percentComplete", pa.float64()),
+    pa.field("coverage_percentCoverage", pa.float64()),
+    pa.field("coverage_datetime_from_utc", UTC_TS),
+    pa.field("coverage_datetime_from_local", pa.string()),
+    pa.field("coverage_datetime_to_utc", UTC_TS),
+    pa.field("coverage_datetime_to_local", pa.string()),
+]
+
+# Versión del esquema raw: va en la metadata Arrow de cada archivo escrito
+# (ver SCHEMA_REGISTRY / conform_table más abajo). Subirla al cambiar tipos o columnas.
+SCHEMA_VERSION_KEY = b"openaq.measurements.schema_version"
+MEASUREMENT_SCHEMA_VERSION = 1
+
+# Mismo orden de columnas que el DataFrame de FetchSensorData
+MEASUREMENT_SCHEMA = pa.schema(
+    SENSOR_META_FIELDS + MEASUREMENT_FIELDS,
+    metadata={SCHEMA_VERSION_KEY: str(MEASUREMENT_SCHEMA_VERSION).encode()},
+)
+
+
+# ----------------------------
+# Flatten columnar (una página completa de una vez)
+# ----------------------------
+_DT = pa.struct([("utc", pa.string()), ("local", pa.string())])
+_RAW_TYPE = pa.struct([
+    ("value", pa.float64()),
+    ("date", _DT),
+    ("period", pa.struct([
+        ("label", pa.string()),
+        ("interval", pa.string()),
+        ("datetimeFrom", _DT),
+        ("datetimeTo", _DT),
+    ])),
+    ("coverage", pa.struct([
+        ("expectedCount", pa.int64()),
+        ("expectedInterval", pa.string()),
+        ("observedCount", pa.int64()),
+        ("observedInterval", pa.string()),
+        ("percentComplete", pa.float64()),
+        ("percentCoverage", pa.float64()),
+        ("datetimeFrom", _DT),
+        ("datetimeTo", _DT),
+    ])),
+])
+
+# columna de salida → ruta dentro de _RAW_TYPE
+_PATHS = {
+    "value": ["value"],
+    "timestamp": ["date", "utc"],
+    "timestamp_local": ["date", "local"],
+    "period_label": ["period", "label"],
+    "period_interval": ["period", "interval"],
+    "datetime_from_utc": ["period", "datetimeFrom", "utc"],
+    "datetime_from_local": ["period", "datetimeFrom", "local"],
+    "datetime_to_utc": ["period", "datetimeTo", "utc"],
+    "datetime_to_local": ["period", "datetimeTo", "local"],
+    "coverage_expectedCount": ["coverage", "expectedCount"],
+    "coverage_expectedInterval": ["coverage", "expectedInterval"],
+    "coverage_observedCount": ["coverage", "observedCount"],
+    "coverage_observedInterval": ["coverage", "observedInterval"],
+    "coverage_percentComplete": ["coverage", "percentComplete"],
+    "coverage_percentCoverage": ["coverage", "percentCoverage"],
+    "coverage_datetime_from_utc": ["coverage", "datetimeFrom", "utc"],
+    "coverage_datetime_from_local": ["coverage", "datetimeFrom", "local"],
+    "coverage_datetime_to_utc": ["coverage", "datetimeTo", "utc"],
+    "coverage_datetime_to_local": ["coverage", "datetimeTo", "local"],
+}
+
+
+def _to_utc_ts(arr: pa.Array) -> pa.Array:
+    try:
+        return pc.cast(arr, UTC_TS)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # strings no ISO: parse permisivo (inválidos → null), como pd.to_datetime(errors="coerce")
+        parsed = pd.to_datetime(arr.to_pandas(), utc=True, errors="coerce")
+        return pa.array(parsed, type=UTC_TS)
+
+
+def flatten_page(results: list[dict]) -> pa.Table:
+    """
+    Versión columnar de flatten_measurement para una página completa de 'results'.
+    Mismos campos, pero con tipos fijos: value float64, tiempos *_utc como
+    timestamp[us, UTC] y parameter/unit dictionary-encoded.
+    La conversión dict → StructArray se hace en C++ (pyarrow), sin un dict por fila.
+    """
+    fields = {f.name: f for f in MEASUREMENT_FIELDS}
+    try:
+        raw = pa.array(results, type=_RAW_TYPE)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # forma inesperada (p.ej. 'date' como string): camino por registro
+        rows = [flatten_measurement(m) for m in results]
+        raw = None
+
+    # parameter puede ser dict o string → lo resolvemos por separado
+    params = [m.get("parameter") for m in results]
+    names, units = [], []
+    for m, p in zip(results, params):
+        if isinstance(p, dict):
+            names.append(p.get("name"))
+            units.append(p.get("units"))
+        else:
+            names.append(p)
+            units.append(m.get("unit"))
+
+    columns = []
+    for f in MEASUREMENT_FIELDS:
+        if f.name == "parameter":
+            arr = pa.array(names, type=pa.string()).dictionary_encode()
+        elif f.name == "unit":
+            arr = pa.array(units, type=pa.string()).dictionary_encode()
+        elif raw is not None:
+            arr = pc.struct_field(raw, _PATHS[f.name])
+        else:
+            arr = pa.array([r[f.name] for r in rows], type=pa.string() if f.type == UTC_TS else None)
+        if f.type == UTC_TS:
+            arr = _to_utc_ts(arr)
+        columns.append(arr.cast(fields[f.name].type))
+    return pa.Table.from_arrays(columns, schema=pa.schema(MEASUREMENT_FIELDS))
+
+
+def _constant_array(value, n: int, type_: pa.DataType) -> pa.Array:
+    """
+    Columna constante sin replicar objetos: strings como dictionary de un
+    solo valor (índices en cero), numéricos como un único np.full.
+    """
+    if pa.types.is_dictionary(type_):
+        if value is None:
+            return pa.DictionaryArray.from_arrays(
+                pa.nulls(n, type=pa.int32()), pa.array([], type=type_.value_type)
+            )
+        indices = pa.array(np.zeros(n, dtype=np.int32))
+        return pa.DictionaryArray.from_arrays(indices, pa.array([value], type=type_.value_type))
+    if value is None:
+        return pa.nulls(n, type=type_)
+    return pa.array(np.full(n, value), type=type_)
+
+
+def with_sensor_meta(table: pa.Table, sensor_meta: dict) -> pa.Table:
+    """Antepone sensor_id/parameter_meta/location_id/location_name como columnas constantes."""
+    n = table.num_rows
+    meta = [_constant_array(sensor_meta.get(f.name), n, f.type) for f in SENSOR_META_FIELDS]
+    return pa.Table.from_arrays(meta + list(table.columns), schema=MEASUREMENT_SCHEMA)
+
+
+def page_to_batch(results: list[dict], sensor_meta: dict) -> pa.RecordBatch:
+    """
+    Aplana UNA página de la API y la convierte a RecordBatch con MEASUREMENT_SCHEMA.
+    El esquema es fijo: una página con todo null no cambia los tipos.
+    """
+    table = with_sensor_meta(flatten_page(results), sensor_meta).combine_chunks()
+    return pa.RecordBatch.from_arrays([c.combine_chunks() for c in table.columns], schema=MEASUREMENT_SCHEMA)
+
+
+# ----------------------------
+# Registro de esquemas: casts explícitos al escribir y al leer
+# ----------------------------
+
+# versión → esquema de almacenamiento. La 0 son archivos sin versión (escritos
+# vía pandas antes del registro): tipos inferidos, se leen casteando.
+SCHEMA_REGISTRY: dict[int, pa.Schema] = {MEASUREMENT_SCHEMA_VERSION: MEASUREMENT_SCHEMA}
+
+
+def schema_version(schema: pa.Schema) -> int:
+    """Versión con la que se escribió un archivo (0 = sin registrar)."""
+    try:
+        return int((schema.metadata or {}).get(SCHEMA_VERSION_KEY, b"0"))
+    except ValueError:
+        return 0
+
+
+def read_type(type_: pa.DataType) -> pa.DataType:
+    """Tipo de lectura de un tipo registrado: dictionary → string plano (igual en todos los archivos)."""
+    return type_.value_type if pa.types.is_dictionary(type_) else type_
+
+
+def registry_schema(
+    seen: pa.Schema,
+    columns: list[str] | None = None,
+    read: bool = False,
+    version: int = MEASUREMENT_SCHEMA_VERSION,
+) -> pa.Schema:
+    """
+    Esquema destino para las columnas de `seen` (∩ `columns`): las registradas
+    con su tipo del registro (read=True → tipo de lectura) en el orden del
+    registro; las de fuera del registro (archivos viejos) al final, con su tipo
+    visto. No agrega columnas que no estén en `seen`.
+    """
+    registered = SCHEMA_REGISTRY[version]
+    wanted = [n for n in seen.names if columns is None or n in columns]
+    fields = [
+        pa.field(f.name, read_type(f.type) if read else f.type)
+        for f in registered if f.name in wanted
+    ]
+    fields += [seen.field(n) for n in wanted if n not in registered.names]
+    return pa.schema(fields, metadata=registered.metadata)
+
+
+def _cast_column(col, target: pa.DataType):
+    if col.type == target:
+        return col
+    if pa.types.is_timestamp(target) and not pa.types.is_timestamp(col.type) and not pa.types.is_null(col.type):
+        # ISO string (o lo que venga): parse explícito, inválidos → null
+        col = _to_utc_ts(col.combine_chunks() if isinstance(col, pa.ChunkedArray) else col)
+        return col if col.type == target else col.cast(target)
+    if pa.types.is_dictionary(col.type) and not pa.types.is_dictionary(target):
+        col = col.cast(col.type.value_type)
+    return col.cast(target)
+
+
+def conform_table(t: pa.Table, schema: pa.Schema = MEASUREMENT_SCHEMA, errors: str = "raise") -> pa.Table:
+    """
+    Devuelve `t` exactamente con `schema` (orden, tipos y metadata): cada
+    columna se castea explícitamente a su tipo, las que faltan quedan nulas y
+    las que no están en `schema` se descartan. Tablas conformadas al mismo
+    esquema se concatenan sin copia ni promoción de tipos.
+    errors="raise" (escritura) propaga un cast imposible; errors="null" (lectura)
+    deja esa columna nula con un warning.
+    """
+    cols = []
+    for f in schema:
+        if f.name not in t.column_names:
+            cols.append(pa.nulls(t.num_rows, type=f.type))
+            continue
+        try:
+            cols.append(_cast_column(t[f.name], f.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            if errors == "raise":
+                raise ValueError(f"{f.name}: {t.schema.field(f.name).type} → {f.type}: {e}") from e
+            print(f"[schema] warning: {f.name} ({t.schema.field(f.name).type} → {f.type}) queda nula: {e}")
+            cols.append(pa.nulls(t.num_rows, type=f.type))
+    return pa.Table.from_arrays(cols, schema=schema)
+
+
+def conform_frame(df: pd.DataFrame) -> pa.Table:
+    """DataFrame de FetchSensorData/extract → pa.Table con MEASUREMENT_SCHEMA (para escribir)."""
+    extra = [c for c in df.columns if c not in MEASUREMENT_SCHEMA.names]
+    if extra:
+        print(f"[schema] warning: columnas fuera de MEASUREMENT_SCHEMA v{MEASUREMENT_SCHEMA_VERSION} no se escriben: {extra}")
+    return conform_table(pa.Table.from_pandas(df, preserve_index=False))
+
+
+# ----------------------------
+# Deduplicación por clave compacta (sensor_id, datetime_from_utc)
+# ----------------------------
+
+# Los runs se solapan (SAFETY_OVERLAP_MIN) → la misma medición llega en varios
+# archivos, a veces con campos secundarios distintos. La identidad es
+# (sensor_id, inicio del periodo), empaquetada en un int64:
+# sensor_id en los bits altos, segundos epoch en los 32 bajos (válido hasta 2106).
+DEDUP_TIME_COLUMNS = ["datetime_from_utc", "timestamp"]
+_KEY_TIME_BITS = 32
+
+
+def _pack_key(sensor_id: np.ndarray, epoch_s: np.ndarray) -> np.ndarray:
+    """sensor_id / epoch_s como float (NaN = nulo). Filas sin clave → negativos únicos (nunca duplicadas)."""
+    valid = (
+        np.isfinite(sensor_id) & (sensor_id >= 0) & (sensor_id < 2**31)
+        & np.isfinite(epoch_s) & (epoch_s >= 0) & (epoch_s < 2**_KEY_TIME_BITS)
+    )
+    key = np.empty(len(valid), dtype=np.int64)
+    key[valid] = (sensor_id[valid].astype(np.int64) << _KEY_TIME_BITS) | epoch_s[valid].astype(np.int64)
+    key[~valid] = -1 - np.flatnonzero(~valid)
+    return key
+
+
+def measurement_keys(table: pa.Table) -> np.ndarray | None:
+    """Clave int64 por fila de un pa.Table; None si faltan sensor_id o la columna de tiempo."""
+    time_col = next((c for c in DEDUP_TIME_COLUMNS if c in table.column_names), None)
+    if "sensor_id" not in table.column_names or time_col is None:
+        return None
+    ts = table[time_col]
+    if not pa.types.is_timestamp(ts.type):
+        ts = _to_utc_ts(ts.combine_chunks())
+    secs = pc.cast(pc.cast(ts, pa.timestamp("s", tz="UTC"), safe=False), pa.int64())
+    sid = pc.cast(table["sensor_id"], pa.float64(), safe=False)
+    return _pack_key(
+        np.asarray(sid.to_numpy(zero_copy_only=False), dtype=np.float64),
+        np.asarray(secs.to_numpy(zero_copy_only=False), dtype=np.float64),
+    )
+
+
+def measurement_keys_df(df: pd.DataFrame) -> np.ndarray | None:
+    """Misma clave que measurement_keys, para un DataFrame."""
+    time_col = next((c for c in DEDUP_TIME_COLUMNS if c in df.columns), None)
+    if "sensor_id" not in df.columns or time_col is None:
+        return None
+    ts = pd.to_datetime(df[time_col], utc=True, errors="coerce")
+    secs = (ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    sid = pd.to_numeric(df["sensor_id"], errors="coerce")
+    return _pack_key(sid.to_numpy(dtype=np.float64, na_value=np.nan), secs.to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def latest_record_mask(keys: np.ndarray) -> np.ndarray:
+    """
+    Filas a conservar: por clave gana la ÚLTIMA aparición. Con los archivos de
+    la partición concatenados en orden (raw_manifest.write_order: compactado
+    primero, luego por hora de escritura), es el registro del archivo escrito
+    más tarde: el último run trae el valor revisado.
+    """
+    return ~pd.Series(keys, copy=False).duplicated(keep="last").to_numpy()
+
+
+def drop_duplicate_measurements(df: pd.DataFrame) -> pd.DataFrame:
+    """Dedup por (sensor_id, datetime_from_utc) con latest_record_mask; sin esas columnas, fila completa."""
+    keys = measurement_keys_df(df)
+    if keys is None:
+        return df.drop_duplicates()
+    mask = latest_record_mask(keys)
+    return df if mask.all() else df[mask]
@@ -0,0 +1,61 @@
+# src/api/ratelimit.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+# Cuota OpenAQ v3: 60 req/min y 2000 req/hora por API key
+RATE_PER_SEC = float(os.getenv("OPENAQ_RATE_PER_SEC", "1.0"))
+BURST = int(os.getenv("OPENAQ_BURST", "5"))
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe. Cada request consume un token; los tokens se
+    recargan a `rate` por segundo hasta `capacity`. Compartido entre threads
+    para que la tasa TOTAL respete la cuota, sin importar cuántos sensores
+    se estén trayendo en paralelo.
+    """
+
+    def __init__(self, rate: float = RATE_PER_SEC, capacity: int = BURST):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Bloquea hasta tener `tokens` disponibles. Devuelve segundos esperados."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+_LIMITER: TokenBucket | None = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_limiter() -> TokenBucket:
+    """Limiter único por proceso (compartido por todas las llamadas a OpenAQ)."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = TokenBucket(RATE_PER_SEC, BURST)
+        return _LIMITER
@@ -0,0 +1,227 @@
+# src/data/compact.py
+"""
+Compactación de particiones raw: openaq/<city>/dt=<día>/measurements_*.parquet
+→ un único measurements_compacted_<ts>.parquet por día.
+
+- Sin duplicados (clave (sensor_id, datetime_from_utc), gana el archivo más
+  reciente) y ordenado por (sensor_id, datetime_from_utc).
+- zstd, dictionary encoding en los strings de MEASUREMENT_SCHEMA (versión en la
+  metadata del archivo), estadísticas por columna y row groups de
+  COMPACT_ROW_GROUP_ROWS filas.
+
+Swap sin romper lectores en curso:
+  1) io.write_parquet_atomic escribe a un temporal que no matchea
+     measurements_*.parquet y lo mueve al nombre final (aparece completo o no aparece);
+  2) recién entonces el manifest del día (raw_manifest) pasa a listar sólo el
+     compactado (más lo que llegó mientras tanto) y marca los reemplazados;
+     preprocess los ignora a partir de ahí;
+  3) los reemplazados se borran en una compactación posterior, pasado
+     COMPACT_GRACE_MIN: un lector que los listó antes todavía puede abrirlos.
+Los temporales _tmp_* de escrituras que murieron antes del commit también se
+borran acá, pasado el mismo COMPACT_GRACE_MIN desde su última modificación.
+Entre 1) y 2) un lector ve ambos; el dedup por clave deja el mismo resultado.
+No soporta dos compactaciones concurrentes del mismo día.
+
+Es la única escritura que lista el directorio: archivos que falten en el
+manifest (escritos antes de él, o una escritura perdida) se registran acá.
+
+    python -m src.data.compact --date 2025-08-17
+    python -m src.data.compact --start 2025-08-01 --end 2025-08-31
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+
+import fsspec
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.api.measurements_structure import conform_table, latest_record_mask, measurement_keys, registry_schema
+from src.data import preprocess as pre
+from src.data import raw_manifest
+from src.utils.io import write_parquet_atomic
+
+UTC = timezone.utc
+
+COMPACT_ROW_GROUP_ROWS = int(os.getenv("COMPACT_ROW_GROUP_ROWS", "131072"))
+COMPACT_ZSTD_LEVEL = int(os.getenv("COMPACT_ZSTD_LEVEL", "3"))
+COMPACT_GRACE_MIN = int(os.getenv("COMPACT_GRACE_MIN", "60"))
+
+SORT_KEY = ["sensor_id", "datetime_from_utc"]
+
+
+def _fs(path: str):
+    return fsspec.core.url_to_fs(path)[0]
+
+
+def _conform(t: pa.Table) -> pa.Table:
+    """Columnas registradas con el tipo de almacenamiento de MEASUREMENT_SCHEMA (strings → dictionary); el resto tal cual."""
+    return conform_table(t, registry_schema(t.schema))
+
+
+def _dedup_sort(t: pa.Table) -> pa.Table:
+    keys = measurement_keys(t)
+    if keys is not None:
+        mask = latest_record_mask(keys)
+        if not mask.all():
+            t = t.filter(pa.array(mask))
+    sort = [(c, "ascending") for c in SORT_KEY if c in t.column_names]
+    return t.sort_by(sort) if sort else t
+
+
+def _write_compacted(t: pa.Table, path: str):
+    dictionary_cols = [f.name for f in t.schema if pa.types.is_dictionary(f.type)]
+    sorting = [pq.SortingColumn(t.schema.get_field_index(c)) for c in SORT_KEY if c in t.column_names]
+    return write_parquet_atomic(
+        t,
+        path,
+        row_group_size=COMPACT_ROW_GROUP_ROWS,
+        compression="zstd",
+        compression_level=COMPACT_ZSTD_LEVEL,
+        use_dictionary=dictionary_cols or False,
+        write_statistics=True,
+        sorting_columns=sorting or None,
+    )
+
+
+def _purge(raw_dir: str, superseded: list[dict], now: datetime, grace_min: int) -> list[dict]:
+    """Borra los reemplazados hace más de grace_min; devuelve los que siguen pendientes."""
+    fs = _fs(raw_dir)
+    pending = []
+    for entry in superseded:
+        at = datetime.fromisoformat(entry["at"].replace("Z", "+00:00"))
+        if now - at < timedelta(minutes=grace_min):
+            pending.append(entry)
+            continue
+        path = f"{raw_dir}/{entry['file']}"
+        try:
+            if fs.exists(path):
+                fs.rm(path)
+        except Exception as e:
+            print(f"[compact] warning: no se pudo borrar {path}: {e}")
+            pending.append(entry)
+    return pending
+
+
+def _modified(info: dict) -> datetime | None:
+    value = info.get("mtime") or info.get("updated") or info.get("LastModified")
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, UTC)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def _purge_tmp(raw_dir: str, now: datetime, grace_min: int) -> int:
+    """Borra temporales de AtomicParquetWriter abandonados (más viejos que grace_min); devuelve cuántos."""
+    fs, rel = fsspec.core.url_to_fs(raw_dir)
+    try:
+        found = fs.glob(f"{rel.rstrip('/')}/_tmp_*", detail=True)
+    except FileNotFoundError:
+        return 0
+    purged = 0
+    for path, info in found.items():
+        modified = _modified(info)
+        if modified is None or now - modified < timedelta(minutes=grace_min):
+            continue  # puede ser una escritura en curso
+        try:
+            fs.rm(path)
+            purged += 1
+        except Exception as e:
+            print(f"[compact] warning: no se pudo borrar {path}: {e}")
+    if purged:
+        print(f"[compact] {raw_dir}: {purged} temporales abandonados borrados")
+    return purged
+
+
+def _reconcile(raw_dir: str, manifest: dict, live: list[str], now: datetime) -> tuple[dict, bool]:
+    """Manifest con exactamente los archivos vivos del listado; True si cambió."""
+    names = [f.rsplit("/", 1)[-1] for f in live]
+    known = {e["file"]: e for e in manifest.get("files", [])}
+    missing = [n for n in names if n not in known]
+    files = [known[n] for n in names if n in known]
+    if missing:
+        print(f"[compact] {raw_dir}: {len(missing)} archivos fuera del manifest, se registran")
+        files += raw_manifest.describe_files(raw_dir, missing, "listing", now)
+    changed = bool(missing) or len(files) != len(known) or not manifest
+    return {**manifest, "files": files}, changed
+
+
+def compact_day(proc_date: str, now: datetime | None = None, grace_min: int = COMPACT_GRACE_MIN) -> dict:
+    """
+    Compacta dt=<proc_date>. Devuelve {"day", "files", "rows", "bytes", "compacted", "purged", "tmp_purged"};
+    "compacted" es None si no había nada que compactar.
+    """
+    now = now or datetime.now(UTC)
+    raw_dir = pre._raw_partition_path(proc_date)
+    manifest = raw_manifest.read_manifest(raw_dir)
+
+    superseded = manifest.get("superseded", [])
+    pending = _purge(raw_dir, superseded, now, grace_min)
+    summary = {"day": proc_date, "files": 0, "rows": 0, "compacted": None, "purged": len(superseded) - len(pending),
+               "tmp_purged": _purge_tmp(raw_dir, now, grace_min)}
+    manifest["superseded"] = pending
+
+    files = raw_manifest.drop_superseded(raw_manifest.list_measurement_files(raw_dir), manifest)
+    files = raw_manifest.write_order(files, manifest)
+    names = [f.rsplit("/", 1)[-1] for f in files]
+    if not files or names == [manifest.get("compacted")]:
+        print(f"[compact] {raw_dir}: nada que compactar ({len(files)} archivos)")
+        manifest, changed = _reconcile(raw_dir, manifest, files, now)
+        if (changed or summary["purged"]) and (files or manifest.get("compacted")):
+            raw_manifest.write_manifest(raw_dir, manifest, now)
+        return summary
+
+    table = pre._load_concat_table(files)
+    if table is None:
+        print(f"[compact] warning: no se pudo leer ningún archivo de {raw_dir}")
+        return summary
+    rows_in = table.num_rows
+    table = _conform(_dedup_sort(table))
+
+    ts = now.strftime("%Y%m%dT%H%M%S")
+    name = f"{pre.COMPACTED_PREFIX}{ts}.parquet"
+    written = _write_compacted(table, f"{raw_dir}/{name}")
+    entry = raw_manifest.describe_file(written.path, "compaction", now)
+
+    # releído justo antes de escribir: conserva lo que el extract registró mientras tanto
+    at = now.isoformat().replace("+00:00", "Z")
+    current = raw_manifest.read_manifest(raw_dir)
+    replaced = set(names) - {name}
+    raw_manifest.write_manifest(raw_dir, {
+        **current,
+        "files": [entry] + [e for e in current.get("files", []) if e["file"] not in replaced | {name}],
+        "compacted": name,
+        "superseded": pending + [{"file": n, "at": at} for n in sorted(replaced)],
+    }, now)
+
+    print(f"[compact] {raw_dir}: {len(files)} archivos, {rows_in} → {table.num_rows} filas → {name} ({written.bytes} bytes)")
+    summary.update({"files": len(files), "rows": table.num_rows, "bytes": written.bytes, "compacted": name})
+    return summary
+
+
+def compact_range(start: str, end: str) -> dict[str, dict]:
+    """Compacta cada día de [start, end] que tenga archivos raw."""
+    by_day = pre._list_measurement_files_range(start, end)
+    results = {}
+    for day in sorted(by_day):
+        try:
+            results[day] = compact_day(day)
+        except Exception as e:
+            print(f"[compact] error en {day}: {e}")
+            results[day] = {"day": day, "error": str(e)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compacta particiones raw de OpenAQ (un día o un rango)")
+    parser.add_argument("--date", help="YYYY-MM-DD (default: ayer UTC)")
+    parser.add_argument("--start", help="YYYY-MM-DD, inicio del rango (inclusivo)")
+    parser.add_argument("--end", help="YYYY-MM-DD, fin del rango (inclusivo)")
+    args = parser.parse_args()
+    if args.start and args.end:
+        compact_range(args.start, args.end)
+    else:
+        compact_day(args.date or (datetime.now(UTC) - timedelta(days=1)).strftime("%Y-%m-%d"))
@@ -0,0 +1,310 @@
+# src/data/feature_store.py
+"""
+Feature store sobre openaq/<city>/features/ (o features_panel/).
+
+preprocess sigue escribiendo un archivo por día (dt=<día>/features.parquet);
+este módulo agrega, en el mismo árbol:
+
+- rollups mensuales: year=<YYYY>/month=<MM>/features_<ts>.parquet, un archivo
+  por mes cerrado (ordenado, zstd), rehecho si algún día del mes cambió;
+- _manifest.json: particiones (mes o día) con filas y min/max de timestamp_utc;
+- load_features(city, start, end, columns): poda con el manifest, lee en
+  paralelo sólo las columnas pedidas y arma el frame de entrenamiento.
+  Un año son ~12 archivos en vez de 365.
+
+Los diarios no se borran (son la fuente de verdad); un rollup reemplazado se
+borra en el rollup siguiente, no en el mismo (puede haber lectores con el
+manifest anterior). Días todavía no registrados en el manifest se leen del
+diario con un único glob.
+
+Los diarios se solapan: el raw se particiona por día del run y la ventana del
+extract cruza la medianoche, así que dt=<día> trae también las últimas horas
+del día anterior. Rollup y lectura dejan una fila por ([location_id,]
+timestamp_utc): la de la partición cuyo día (o mes) es el del timestamp; si
+ninguna lo es, la de la partición más nueva.
+
+    python -m src.data.feature_store --rollup [--city Santiago] [--panel]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from src.data import preprocess as pre
+from src.utils.cache import cached_path
+from src.utils.io import read_json, read_parquet, write_json, write_parquet_atomic
+
+UTC = timezone.utc
+
+READ_WORKERS = int(os.getenv("FEATURE_STORE_READ_WORKERS", "16"))
+MANIFEST = "_manifest.json"
+TS_COL = "timestamp_utc"
+
+
+# ----------------------------
+# Rutas / listado
+# ----------------------------
+def _features_root(city: str | None = None, panel: bool = False) -> str:
+    return f"{pre._city_root(city)}/{'features_panel' if panel else 'features'}"
+
+
+def _glob(root: str, pattern: str) -> dict[str, dict]:
+    """{ruta relativa a root: info} (info trae la fecha de modificación)."""
+    fs, base = fsspec.core.url_to_fs(root)
+    base = base.rstrip("/")
+    return {p[len(base) + 1:]: info for p, info in fs.glob(f"{base}/{pattern}", detail=True).items()}
+
+
+def _modified(info: dict) -> float:
+    value = info.get("mtime") or info.get("updated") or info.get("LastModified")
+    if isinstance(value, (int, float)):
+        return float(value)
+    return pd.Timestamp(value).timestamp() if value is not None else 0.0
+
+
+def _daily_files(root: str) -> dict[str, tuple[str, float]]:
+    """{día: (ruta relativa, modificado)} de los features diarios."""
+    out = {}
+    for rel, info in _glob(root, "dt=*/features.parquet").items():
+        m = pre._DT_RE.search(f"/{rel}")
+        if m:
+            out[m.group(1)] = (rel, _modified(info))
+    return out
+
+
+def _read_manifest(root: str) -> dict:
+    try:
+        return read_json(f"{root}/{MANIFEST}")
+    except FileNotFoundError:
+        return {}
+
+
+def _iso(ts) -> str | None:
+    return None if ts is None or pd.isna(ts) else pd.Timestamp(ts).isoformat().replace("+00:00", "Z")
+
+
+def _sort_keys(df: pd.DataFrame) -> list[str]:
+    return [c for c in (pre.PANEL_KEY, TS_COL) if c in df.columns]
+
+
+def _dedup_partitions(df: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    """
+    Una fila por ([location_id,] timestamp_utc) entre particiones solapadas.
+    `keys[i]` es el día (YYYY-MM-DD) o mes (YYYY-MM) de la partición de la fila
+    i: gana la fila de la partición "propia" del timestamp, si no la más nueva.
+    """
+    if df.empty or TS_COL not in df.columns:
+        return df
+    dates = pd.to_datetime(df[TS_COL], utc=True).dt.strftime("%Y-%m-%d").fillna("").to_numpy(dtype=object)
+    keys = np.asarray(keys, dtype=object)
+    month = np.fromiter((len(k) == 7 for k in keys), dtype=bool, count=len(keys))
+    own = np.where(month, [d[:7] for d in dates], dates) == keys
+    df = df.assign(_own=own, _part=keys).sort_values(["_own", "_part"], kind="stable")
+    df = df.drop_duplicates(subset=_sort_keys(df), keep="last").drop(columns=["_own", "_part"])
+    return df.sort_values(_sort_keys(df), kind="stable").reset_index(drop=True)
+
+
+def _map(fn, items, max_workers: int):
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(x) for x in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="fs-read") as pool:
+        return list(pool.map(fn, items))
+
+
+# ----------------------------
+# Rollup + manifest
+# ----------------------------
+def _dataset(path: str) -> ds.Dataset:
+    local = cached_path(path)
+    if local.startswith("gs://"):
+        fs, rel = fsspec.core.url_to_fs(local)
+        return ds.dataset(rel, format="parquet", filesystem=fs)
+    return ds.dataset(local, format="parquet")
+
+
+def _ts_range(ts: pd.Series) -> dict:
+    return {
+        "rows": int(len(ts)),
+        "min_ts": _iso(ts.min()) if len(ts) else None,
+        "max_ts": _iso(ts.max()) if len(ts) else None,
+    }
+
+
+def _day_entry(day: str, rel: str, root: str) -> dict:
+    dataset = _dataset(f"{root}/{rel}")
+    # partición vacía (_save_empty): sin timestamp_utc
+    has_ts = TS_COL in dataset.schema.names
+    ts = dataset.to_table(columns=[TS_COL])[TS_COL].to_pandas() if has_ts else pd.Series([], dtype=object)
+    return {"path": rel, "level": "day", "key": day, **_ts_range(ts)}
+
+
+def _roll_month(month: str, days: dict[str, tuple[str, float]], root: str, now: datetime, max_workers: int) -> dict:
+    paths = [f"{root}/{days[d][0]}" for d in sorted(days)]
+    frames = [(d, df) for d, df in zip(sorted(days), _map(read_parquet, paths, max_workers)) if not df.empty]
+    df = pd.concat([f for _, f in frames], ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        df = _dedup_partitions(df, np.repeat([d for d, _ in frames], [len(f) for _, f in frames]))
+
+    year, mm = month.split("-")
+    rel = f"year={year}/month={mm}/features_{now.strftime('%Y%m%dT%H%M%S%f')}.parquet"
+    written = write_parquet_atomic(df, f"{root}/{rel}")
+    print(f"[feature_store] {month}: {len(paths)} días → {rel} ({written.rows} filas, {written.bytes} bytes)")
+    ts = df[TS_COL] if TS_COL in df.columns else pd.Series([], dtype=object)
+    return {
+        "path": rel,
+        "level": "month",
+        "key": month,
+        "days": sorted(days),
+        **_ts_range(ts),
+        "rolled_at": now.timestamp(),
+    }
+
+
+def rollup_features(
+    city: str | None = None,
+    panel: bool = False,
+    now: datetime | None = None,
+    max_workers: int = READ_WORKERS,
+) -> dict:
+    """
+    Rehace los rollups de meses cerrados (anteriores al mes de `now`) que sean
+    nuevos o tengan algún diario modificado después del rollup, registra los
+    días sueltos del mes en curso y reescribe el manifest. Devuelve el manifest.
+    """
+    now = now or datetime.now(UTC)
+    root = _features_root(city, panel)
+    manifest = _read_manifest(root)
+    old = {(e["level"], e["key"]): e for e in manifest.get("partitions", [])}
+    daily = _daily_files(root)
+
+    # rollups reemplazados en la corrida anterior: ya nadie debería leerlos
+    fs = fsspec.core.url_to_fs(root)[0]
+    for rel in manifest.get("superseded", []):
+        try:
+            fs.rm(fsspec.core.url_to_fs(f"{root}/{rel}")[1])
+        except FileNotFoundError:
+            pass
+    superseded = []
+
+    by_month: dict[str, dict[str, tuple[str, float]]] = {}
+    for day, item in daily.items():
+        by_month.setdefault(day[:7], {})[day] = item
+
+    current = now.strftime("%Y-%m")
+    partitions = []
+    for month in sorted(by_month):
+        days = by_month[month]
+        if month >= current:
+            partitions += _map(lambda d: _day_entry(d, days[d][0], root), sorted(days), max_workers)
+            continue
+        prev = old.get(("month", month))
+        stale = (
+            prev is None
+            or prev.get("days") != sorted(days)
+            or any(mtime > prev.get("rolled_at", 0) for _, mtime in days.values())
+        )
+        if stale:
+            rolled = _roll_month(month, days, root, now, max_workers)
+            if prev is not None and prev["path"] != rolled["path"]:
+                superseded.append(prev["path"])
+            prev = rolled
+        partitions.append(prev)
+
+    manifest = {
+        "city": city or pre.CITY,
+        "granularity": "location" if panel else "city",
+        "updated_at": _iso(now),
+        "partitions": partitions,
+        "superseded": superseded,
+    }
+    write_json(manifest, f"{root}/{MANIFEST}")
+    n_months = sum(1 for p in partitions if p["level"] == "month")
+    print(f"[feature_store] manifest → {root}/{MANIFEST} ({n_months} meses, {len(partitions) - n_months} días)")
+    return manifest
+
+
+# ----------------------------
+# Lectura
+# ----------------------------
+def _day_range(start: str, end: str) -> list[str]:
+    days = pd.date_range(start, end, freq="D")
+    return [d.strftime("%Y-%m-%d") for d in days]
+
+
+def _read_part(path: str, columns: list[str] | None, lo: pd.Timestamp, hi: pd.Timestamp) -> pa.Table | None:
+    dataset = _dataset(path)
+    if TS_COL not in dataset.schema.names:
+        return None  # día vacío
+    ts_type = dataset.schema.field(TS_COL).type
+    expr = (ds.field(TS_COL) >= pa.scalar(lo, type=ts_type)) & (ds.field(TS_COL) < pa.scalar(hi, type=ts_type))
+    cols = None if columns is None else [c for c in dataset.schema.names if c in columns]
+    return dataset.to_table(columns=cols, filter=expr)
+
+
+def load_features(
+    city: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    columns: list[str] | None = None,
+    panel: bool = False,
+    max_workers: int = READ_WORKERS,
+) -> pd.DataFrame:
+    """
+    Features de [start, end] (días YYYY-MM-DD, inclusivo) ordenados por
+    ([location_id,] timestamp_utc). `columns` limita la lectura (timestamp_utc y
+    location_id se agregan siempre).
+    """
+    root = _features_root(city, panel)
+    manifest = _read_manifest(root)
+    partitions = manifest.get("partitions", [])
+    daily = None
+    if start is None:
+        daily = _daily_files(root)
+        start = min([*(d for p in partitions for d in p.get("days", [p["key"]])), *daily], default=None)
+        if start is None:
+            return pd.DataFrame(columns=columns or [])
+    end = end or datetime.now(UTC).strftime("%Y-%m-%d")
+    lo = pd.Timestamp(start, tz="UTC")
+    hi = pd.Timestamp(end, tz="UTC") + timedelta(days=1)
+    if columns is not None:
+        columns = list(dict.fromkeys([pre.PANEL_KEY, TS_COL, *columns]))
+
+    # poda por min/max del manifest; (ruta, día o mes de la partición)
+    parts, covered = [], set()
+    for p in partitions:
+        covered.update(p.get("days", [p["key"]]))
+        if p["rows"] and pd.Timestamp(p["max_ts"]) >= lo and pd.Timestamp(p["min_ts"]) < hi:
+            parts.append((f"{root}/{p['path']}", p["key"]))
+
+    # días posteriores al último rollup/manifest: del diario
+    missing = [d for d in _day_range(start, end) if d not in covered]
+    if missing:
+        daily = _daily_files(root) if daily is None else daily
+        parts += [(f"{root}/{daily[d][0]}", d) for d in missing if d in daily]
+
+    print(f"[feature_store] {start}..{end}: {len(parts)} archivos ({len(partitions)} particiones en manifest)")
+    tables = _map(lambda p: _read_part(p[0], columns, lo, hi), parts, max_workers)
+    read = [(key, t) for (_, key), t in zip(parts, tables) if t is not None]
+    if not read:
+        return pd.DataFrame(columns=columns or [])
+    df = pa.concat_tables([t for _, t in read], promote_options="permissive").to_pandas()
+    return _dedup_partitions(df, np.repeat([k for k, _ in read], [t.num_rows for _, t in read]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature store OpenAQ: rollups mensuales + manifest")
+    parser.add_argument("--rollup", action="store_true", help="rehace rollups y manifest")
+    parser.add_argument("--city", default=None)
+    parser.add_argument("--panel", action="store_true", help="features_panel (por estación)")
+    args = parser.parse_args()
+    if args.rollup:
+        rollup_features(args.city, panel=args.panel)
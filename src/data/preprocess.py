@@ -2,14 +2,29 @@
 from __future__ import annotations
 
 import os
-from datetime import datetime, timezone
+import re
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import pandas as pd
 import numpy as np
 
-from src.utils.io import build_path, write_parquet, read_json, write_json  # helper genérico GCS/local
+from src.utils.io import build_path, write_parquet, read_json, read_parquet, write_json  # helper genérico GCS/local
+from src.utils.cache import cache_enabled, cached_path
+from src.data import raw_manifest
+from src.api.measurements_structure import (
+    DEDUP_TIME_COLUMNS,
+    MEASUREMENT_SCHEMA_VERSION,
+    conform_table,
+    drop_duplicate_measurements,
+    registry_schema,
+    schema_version,
+)
 import fsspec
 import pyarrow as pa
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 
 UTC = timezone.utc
@@ -33,9 +48,42 @@ PARAMETERS = [
     if p.strip()
 ]
 
+# Lecturas concurrentes de archivos de una partición / días en paralelo (modo rango)
+READ_WORKERS = int(os.getenv("PREPROCESS_READ_WORKERS", "8"))
+DAY_WORKERS = int(os.getenv("PREPROCESS_DAY_WORKERS", str(os.cpu_count() or 1)))
+
+# Panel por estación: una serie horaria por (location_id, timestamp_utc) en vez
+# del promedio de toda la ciudad. Escribe en processed_panel/ y features_panel/.
+PANEL = os.getenv("PREPROCESS_PANEL", "0") == "1"
+PANEL_KEY = "location_id"
+
+# Motor para QC → unidades → agregación horaria: "pandas" o "arrow"
+# (src/data/preprocess_arrow.py, sin pasar el raw completo a pandas)
+ENGINE = os.getenv("PREPROCESS_ENGINE", "pandas").strip().lower()
+
 # Target (umbral PM2.5, µg/m³)
 THRESHOLD_PM25 = float(os.getenv("THRESHOLD_PM25", "25"))
 
+# Features temporales. El warm-up (horas del día anterior necesarias para que
+# lags/rollings del inicio del día sean correctos) se deriva de estos valores.
+LAG_PARAMS = ["pm25", "no2", "temperature", "relativehumidity"]
+LAG_HOURS = [1, 2, 3, 6]
+ROLL_WINDOWS = {"pm25": [3, 6], "no2": [3]}
+WARMUP_HOURS = max(LAG_HOURS + [w - 1 for ws in ROLL_WINDOWS.values() for w in ws])
+LOOKAHEAD_HOURS = 1  # target = pm25 de la próxima hora
+METEO = ["temperature", "relativehumidity"]  # se rellenan (meteo_fill) en la tabla horaria
+
+# Columnas que usa la cadena QC → unidades → horario (clave de dedup, panel y
+# cualquier columna de tiempo de _ensure_date_utc); el resto no se lee del raw
+READ_COLUMNS = [
+    "sensor_id", "location_id", "parameter", "unit", "value", "date_utc",
+    "period_datetime_from_utc", "datetime_from_utc", "datetime_to_utc",
+    "utc", "timestamp", "ts", "date", "time", "datetime",
+]
+
+# Contaminantes: valores negativos se descartan en QC
+POLLUTANTS = ["pm25", "pm10", "pm1", "no2", "o3", "so2", "co"]
+
 # Reglas de unidades – normalizamos todo a éstas
 CANONICAL_UNITS = {
     "pm25": "µg/m³",
@@ -50,116 +98,347 @@ CANONICAL_UNITS = {
     "um003": "count/cm³",      # ajusta según documentación
 }
 
-# Conversión simple de unidades – extiende si necesitas más
-def _convert_units(series: pd.Series, src_unit: str | None, parameter: str) -> pd.Series:
-    target = CANONICAL_UNITS.get(parameter)
-    if src_unit is None or target is None or src_unit == target:
-        return series
-    if parameter == "co" and src_unit in ("µg/m³", "ug/m3") and target == "mg/m³":
-        # 1000 µg/m³ = 1 mg/m³
-        return series / 1000.0
-    # si no conocemos la conversión, dejamos como está
-    return series
+# Conversiones (parameter, unidad de origen) → (factor, offset) hacia la unidad
+# canónica: valor_canónico = valor * factor + offset.
+# Gases: ppb → µg/m³ = ppb * PM / volumen molar (24.45 L/mol a 25 °C y 1 atm, criterio EPA/EEA)
+MOLAR_VOLUME_L = 24.45
+MOLECULAR_WEIGHTS = {"no2": 46.0055, "o3": 47.9982, "so2": 64.066, "co": 28.010}
+_MASS_UNITS = {"ng/m³": 1e-3, "µg/m³": 1.0, "mg/m³": 1e3}   # en µg/m³
+_MIXING_UNITS = {"ppb": 1.0, "ppm": 1e3}                    # en ppb
+
+def _build_unit_conversions() -> dict[tuple[str, str], tuple[float, float]]:
+    conv: dict[tuple[str, str], tuple[float, float]] = {}
+    for param, target in CANONICAL_UNITS.items():
+        conv[(param, target)] = (1.0, 0.0)
+        if target in _MASS_UNITS:
+            for unit, ug in _MASS_UNITS.items():
+                conv[(param, unit)] = (ug / _MASS_UNITS[target], 0.0)
+            if param in MOLECULAR_WEIGHTS:
+                ug_per_ppb = MOLECULAR_WEIGHTS[param] / MOLAR_VOLUME_L
+                for unit, ppb in _MIXING_UNITS.items():
+                    conv[(param, unit)] = (ppb * ug_per_ppb / _MASS_UNITS[target], 0.0)
+    conv[("temperature", "°F")] = (5 / 9, -32 * 5 / 9)
+    conv[("temperature", "K")] = (1.0, -273.15)
+    return conv
+
+UNIT_CONVERSIONS = _build_unit_conversions()
+
+# variantes de escritura que llegan de la API / archivos viejos (en minúsculas)
+_UNIT_ALIASES = {
+    "ug/m3": "µg/m³", "µg/m3": "µg/m³", "μg/m³": "µg/m³", "μg/m3": "µg/m³",
+    "mg/m3": "mg/m³", "ng/m3": "ng/m³",
+    "°c": "°C", "c": "°C", "degc": "°C", "celsius": "°C",
+    "°f": "°F", "f": "°F", "degf": "°F", "fahrenheit": "°F",
+    "k": "K", "kelvin": "K",
+    "particles/cm³": "count/cm³", "particles/cm3": "count/cm³", "count/cm3": "count/cm³",
+    "percent": "%",
+    "ppb": "ppb", "ppm": "ppm",  # "PPB" / "PPM"
+}
+
+def _unit_name(unit) -> str | None:
+    if unit is None or pd.isna(unit):
+        return None
+    unit = str(unit).strip()
+    return _UNIT_ALIASES.get(unit.lower(), unit)
+
+def _unit_table(parameters: list, units: list):
+    """
+    Tabla de conversión para los valores distintos de parameter × unit (pocos):
+    arrays planos de tamaño (P+1)*(U+1) indexados por `p * (U+1) + u`; el último
+    índice de cada eje (P / U) representa parameter / unit nulos.
+    Devuelve (factor, offset, unidad destino, conocida). Unit nula se asume ya
+    canónica; una combinación desconocida de un parámetro canónico queda sin
+    convertir, con su unidad original, y se marca como no conocida.
+    """
+    n_u = len(units) + 1
+    size = (len(parameters) + 1) * n_u
+    factor = np.ones(size)
+    offset = np.zeros(size)
+    target: list[str | None] = [None] * size
+    known = np.ones(size, dtype=bool)
+    for i, param in enumerate([*parameters, None]):
+        for j, unit in enumerate([*units, None]):
+            k = i * n_u + j
+            name = _unit_name(unit)
+            if param in CANONICAL_UNITS and name is None:
+                target[k] = CANONICAL_UNITS[param]
+            elif (param, name) in UNIT_CONVERSIONS:
+                factor[k], offset[k] = UNIT_CONVERSIONS[(param, name)]
+                target[k] = CANONICAL_UNITS[param]
+            else:
+                target[k] = name
+                known[k] = param not in CANONICAL_UNITS
+    return factor, offset, target, known
+
+def _unit_report(parameters: list, units: list, counts: np.ndarray, table) -> dict:
+    """Resumen para las stats de processed: filas convertidas y combinaciones desconocidas."""
+    factor, offset, _, known = table
+    n_u = len(units) + 1
+    names = [*parameters, None], [*units, None]
+    unknown = {}
+    for k in np.flatnonzero(~known & (counts > 0)):
+        i, j = divmod(int(k), n_u)
+        unknown[f"{names[0][i]}|{names[1][j]}"] = int(counts[k])
+    if unknown:
+        print(f"[preprocess] warning: unidades sin conversión conocida (filas): {unknown}")
+    converted = int(counts[known & ((factor != 1.0) | (offset != 0.0))].sum())
+    return {"converted_rows": converted, "unknown": unknown}
 
 def _is_gcs() -> bool:
     return bool(GCS_BUCKET)
 
-def _raw_partition_path() -> str:
-    # gs://<bucket>/openaq/<CITY>/dt=<PROC_DATE>  (o ruta local si no hay bucket)
-    rel = f"openaq/{CITY}/dt={PROC_DATE}"
+def _city_root(city: str | None = None) -> str:
+    # gs://<bucket>/openaq/<CITY>  (o ruta local si no hay bucket)
+    rel = f"openaq/{city or CITY}"
     if GCS_BUCKET:
         bucket = GCS_BUCKET.replace("gs://", "").strip("/")
         return f"gs://{bucket}/{rel}"
     return str(Path(rel))
 
-def _processed_partition_path() -> str:
-    rel = f"openaq/{CITY}/processed/dt={PROC_DATE}"
-    if GCS_BUCKET:
-        bucket = GCS_BUCKET.replace("gs://", "").strip("/")
-        return f"gs://{bucket}/{rel}"
-    return str(Path(rel))
+def _raw_partition_path(proc_date: str | None = None, city: str | None = None) -> str:
+    # <root>/dt=<PROC_DATE>
+    return f"{_city_root(city)}/dt={proc_date or PROC_DATE}"
 
-def _features_partition_path() -> str:
-    rel = f"openaq/{CITY}/features/dt={PROC_DATE}"
-    if GCS_BUCKET:
-        bucket = GCS_BUCKET.replace("gs://", "").strip("/")
-        return f"gs://{bucket}/{rel}"
-    return str(Path(rel))
+def _processed_partition_path(proc_date: str | None = None) -> str:
+    kind = "processed_panel" if PANEL else "processed"
+    return f"{_city_root()}/{kind}/dt={proc_date or PROC_DATE}"
+
+def _features_partition_path(proc_date: str | None = None) -> str:
+    kind = "features_panel" if PANEL else "features"
+    return f"{_city_root()}/{kind}/dt={proc_date or PROC_DATE}"
 
-def _list_measurement_files() -> list[str]:
-    base = _raw_partition_path()  # ej: gs://pollution-data-mlops/openaq/Santiago/dt=2025-08-17
+def _panel_keys(df: pd.DataFrame) -> list[str]:
+    """Columnas de agrupación de las series (vacío → una sola serie de ciudad)."""
+    return [PANEL_KEY] if PANEL and PANEL_KEY in df.columns else []
+
+def _id_columns(df: pd.DataFrame) -> set[str]:
+    return {"timestamp_utc", *_panel_keys(df)}
+
+def _gcs_fs():
+    # una sola instancia por proceso (fsspec la cachea; la pedimos una vez y la pasamos)
+    return fsspec.filesystem("gcs")
+
+def _list_measurement_files(proc_date: str | None = None, city: str | None = None) -> list[str]:
+    """
+    Archivos vivos de la partición según dt=<día>/_manifest.json (una lectura,
+    sin listar GCS). Un día sin manifest anterior a raw_manifest.manifests_since
+    se lista; desde `since` está vacío. `city` default: CITY.
+    """
+    proc_date = proc_date or PROC_DATE
+    base = _raw_partition_path(proc_date, city)  # ej: gs://pollution-data-mlops/openaq/Santiago/dt=2025-08-17
+    manifest = raw_manifest.read_manifest(base)
+    if manifest:
+        files = raw_manifest.live_files(base, manifest)
+        print(f"[preprocess] manifest {base}: {len(files)} files")
+        return files
+
+    since = raw_manifest.manifests_since(_city_root(city))
+    if since is not None and proc_date >= since:
+        print(f"[preprocess] {base}: sin manifest desde {since} → sin datos")
+        return []
+    return _list_partition(proc_date, city)
+
+
+def _list_partition(day: str, city: str | None = None) -> list[str]:
+    """Listado (prefijo de un solo día) de una partición anterior a los manifests."""
+    base = _raw_partition_path(day, city)
     pattern = f"{base}/measurements_*.parquet"
-    print(f"[preprocess] GCS_BUCKET={GCS_BUCKET!r}")
-    print(f"[preprocess] base={base}")
-    print(f"[preprocess] pattern={pattern}")
+    print(f"[preprocess] sin manifest; pattern={pattern}")
+    try:
+        return raw_manifest.write_order(raw_manifest.list_measurement_files(base), {})
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"[preprocess] error: glob({pattern}) falló: {e}")
+        return []
 
-    if base.startswith("gs://"):
-        fs = fsspec.filesystem("gcs")
-        try:
-            files = fs.glob(pattern)  # típicamente ['bucket/path/file.parquet', ...]
-            # Normaliza: si no trae 'gs://', prepéndelo
-            files = [f if f.startswith("gs://") else f"gs://{f}" for f in files]
-            print(f"[preprocess] glob found: {files}")
-            if not files:
-                parent = base.rstrip("/")
-                try:
-                    listing = fs.ls(parent)
-                    listing = [e.get("name", e) for e in listing]
-                    listing = [n if n.startswith("gs://") else f"gs://{n}" for n in listing]
-                    print(f"[preprocess] ls({parent}) → {listing}")
-                except Exception as e:
-                    print(f"[preprocess] warning: ls({parent}) falló: {e}")
-            return files
-        except Exception as e:
-            print(f"[preprocess] error: glob({pattern}) falló: {e}")
-            return []
-    else:
-        return [str(p) for p in Path(base).glob("measurements_*.parquet")]
 
+_DT_RE = re.compile(r"/dt=(\d{4}-\d{2}-\d{2})/")
 
-def _load_concat_measurements(files: list[str]) -> pd.DataFrame:
-    if not files:
-        return pd.DataFrame()
+def _list_measurement_files_range(start: str, end: str) -> dict[str, list[str]]:
+    """
+    Archivos de cada partición raw de [start, end] (fechas YYYY-MM-DD, inclusivo):
+    un manifest por día, leídos en paralelo. Un día sin manifest desde
+    raw_manifest.manifests_since está vacío y se saltea; antes de `since` (datos
+    de antes del manifest) se lista sólo el prefijo de ese día.
+    Devuelve {día: [archivos]} (sólo días con archivos).
+    """
+    days = [d.strftime("%Y-%m-%d") for d in pd.date_range(start, end, freq="D")]
+    workers = max(1, min(READ_WORKERS, len(days) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        manifests = dict(zip(days, pool.map(lambda d: raw_manifest.read_manifest(_raw_partition_path(d)), days)))
+
+    by_day: dict[str, list[str]] = {}
+    for day, manifest in manifests.items():
+        files = raw_manifest.live_files(_raw_partition_path(day), manifest)
+        if files:
+            by_day[day] = files
+
+    missing = sorted(d for d, m in manifests.items() if not m)
+    since = raw_manifest.manifests_since(_city_root()) if missing else None
+    listed = [d for d in missing if since is None or d < since]
+    if listed:
+        print(f"[preprocess] {len(listed)} days without manifest before {since or 'manifests'}; listing each")
+        with ThreadPoolExecutor(max_workers=max(1, min(READ_WORKERS, len(listed)))) as pool:
+            for day, files in zip(listed, pool.map(_list_partition, listed)):
+                if files:
+                    by_day[day] = files
+    print(f"[preprocess] {sum(map(len, by_day.values()))} files in {len(by_day)} partitions "
+          f"({len(days) - len(missing)} from manifest, {len(listed)} listed, "
+          f"{len(missing) - len(listed)} empty)")
+    return dict(sorted(by_day.items()))
+
+
+COMPACTED_PREFIX = raw_manifest.COMPACTED_PREFIX
+
+def _harmonize_types(t: pa.Table) -> pa.Table:
+    """
+    Archivos viejos (timestamps como string, tipos inferidos por pandas) y nuevos
+    (MEASUREMENT_SCHEMA versionado) deben poder concatenarse: cada columna
+    registrada se castea explícitamente a su tipo de lectura (registry_schema).
+    """
+    return conform_table(t, registry_schema(t.schema, read=True), errors="null")
 
-    tables: list[pa.Table] = []
-    for p in sorted(files):
-        try:
-            if p.startswith("gs://"):
-                fs = fsspec.filesystem("gcs")
-                with fs.open(p, "rb") as f:
-                    t = pq.read_table(f)
-            else:
-                t = pq.read_table(p)
-            tables.append(t)
-        except Exception as e:
-            print(f"[preprocess] warning: no se pudo leer {p}: {e}")
+def _read_measurement_file(p: str, fs=None) -> pa.Table | None:
+    try:
+        if p.startswith("gs://"):
+            with fs.open(p, "rb") as f:
+                t = pq.read_table(f)
+        else:
+            t = pq.read_table(p)
+        return _harmonize_types(t)
+    except Exception as e:
+        print(f"[preprocess] warning: no se pudo leer {p}: {e}")
+        return None
 
-    if not tables:
-        return pd.DataFrame()
+def _cached_file(p: str, fs=None) -> str | None:
+    try:
+        return cached_path(p, fs)
+    except Exception as e:
+        print(f"[preprocess] warning: no se pudo leer {p}: {e}")
+        return None
 
+def _read_file_schema(p: str, fs=None) -> pa.Schema | None:
+    # sólo el footer (range request en GCS)
     try:
-        combined = pa.concat_tables(tables, promote=True)
+        if p.startswith("gs://"):
+            with fs.open(p, "rb") as f:
+                return pq.read_schema(f)
+        return pq.read_schema(p)
     except Exception as e:
-        print(f"[preprocess] warning: concat_tables falló ({e}); fallback a columnas comunes.")
-        common = set(tables[0].schema.names)
-        for t in tables[1:]:
-            common &= set(t.schema.names)
-        if not common:
-            return pd.DataFrame()
-        tables = [t.select(list(common)) for t in tables]
-        combined = pa.concat_tables(tables, promote=True)
+        print(f"[preprocess] warning: no se pudo leer {p}: {e}")
+        return None
+
+def _scan_schema(schemas: list[pa.Schema], columns: list[str] | None) -> pa.Schema:
+    """
+    Esquema común del scan, fijo para todos los archivos: columnas presentes en
+    alguno (∩ columns) con el tipo de lectura del registro; las no registradas
+    (archivos viejos) con el primer tipo visto.
+    """
+    seen: dict[str, pa.Field] = {}
+    for s in schemas:
+        for f in s:
+            seen.setdefault(f.name, f)
+        if schema_version(s) > MEASUREMENT_SCHEMA_VERSION:
+            print(f"[preprocess] warning: archivo con schema v{schema_version(s)} > v{MEASUREMENT_SCHEMA_VERSION}; se castea al registrado")
+    return registry_schema(pa.schema(list(seen.values())), columns, read=True)
+
+def _scan_filter(schema: pa.Schema, parameters: list[str] | None, start=None, end=None):
+    """parameter IN (...) y rango [start, end) sobre datetime_from_utc, si las columnas existen."""
+    expr = None
+    def _and(e):
+        return e if expr is None else expr & e
+    if parameters and "parameter" in schema.names:
+        expr = _and(ds.field("parameter").isin(list(parameters)))
+    time_col = next((c for c in DEDUP_TIME_COLUMNS if c in schema.names), None)
+    if time_col and pa.types.is_timestamp(schema.field(time_col).type):
+        if start is not None:
+            expr = _and(ds.field(time_col) >= pa.scalar(pd.Timestamp(start, tz="UTC"), type=schema.field(time_col).type))
+        if end is not None:
+            expr = _and(ds.field(time_col) < pa.scalar(pd.Timestamp(end, tz="UTC"), type=schema.field(time_col).type))
+    return expr
+
+def _load_concat_table(
+    files: list[str],
+    max_workers: int = READ_WORKERS,
+    columns: list[str] | None = None,
+    parameters: list[str] | None = None,
+    start=None,
+    end=None,
+) -> pa.Table | None:
+    """
+    Lee y concatena los archivos con pyarrow.dataset: un esquema común (tipos de
+    MEASUREMENT_SCHEMA) y proyección de `columns` + filtro `parameter IN
+    parameters` / [start, end) empujados al scan de cada fragmento, así sólo se
+    bajan y decodifican las columnas (y row groups) necesarias.
+    Sin argumentos lee todo (compactación).
+    """
+    if not files:
+        return None
+
+    # `files` llega en orden de escritura (raw_manifest.write_order): el dedup
+    # se queda con la última aparición. Un filesystem para todos los archivos;
+    # lecturas en paralelo (I/O-bound), map() conserva el orden
+    fs = _gcs_fs() if any(p.startswith("gs://") for p in files) else None
+    workers = min(max_workers, len(files)) if max_workers > 1 and len(files) > 1 else 1
+
+    def _map(fn, items):
+        if workers == 1:
+            return [fn(x) for x in items]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pq-read") as pool:
+            return list(pool.map(fn, items))
+
+    if fs is not None and cache_enabled():
+        # caché local: se baja cada objeto una vez (validado por generation) y
+        # el scan con proyección/filtros corre contra disco
+        files = [p for p in _map(lambda p: _cached_file(p, fs), files) if p is not None]
+        fs = None
+
+    schemas = _map(lambda p: _read_file_schema(p, fs), files)
+    files = [p for p, s in zip(files, schemas) if s is not None]
+    if not files:
+        return None
+    schema = _scan_schema([s for s in schemas if s is not None], columns)
+    expr = _scan_filter(schema, parameters, start, end)
+
+    paths = [p.replace("gs://", "", 1) for p in files]
+    dataset = ds.dataset(paths, schema=schema, format="parquet", filesystem=fs)
+
+    def _scan(item):
+        path, fragment = item
+        try:
+            return fragment.to_table(schema=schema, filter=expr)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            # p.ej. timestamps string no ISO: lectura completa + cast tolerante
+            print(f"[preprocess] warning: scan de {path} falló ({e}); lectura completa")
+            t = _read_measurement_file(path, fs)
+            if t is None:
+                return None
+            t = conform_table(t, schema, errors="null")
+            return t.filter(expr) if expr is not None else t
+
+    tables = [t for t in _map(_scan, list(zip(files, dataset.get_fragments()))) if t is not None]
+    if not tables:
+        return None
+    # todas con `schema`: concat sin copia y sin negociar tipos
+    return pa.concat_tables(tables)
 
+def _load_concat_measurements(files: list[str], max_workers: int = READ_WORKERS, **scan) -> pd.DataFrame:
+    combined = _load_concat_table(files, max_workers=max_workers, **scan)
+    if combined is None:
+        return pd.DataFrame()
     return combined.to_pandas(ignore_metadata=True)
 
 def _basic_qc(df: pd.DataFrame) -> pd.DataFrame:
     before = len(df)
-    df = df.drop_duplicates()
+    # una fila por (sensor_id, datetime_from_utc): gana el archivo más reciente
+    df = drop_duplicate_measurements(df)
 
     # Esperamos estas columnas del extract:
     # ['value','parameter','unit','date_utc','location_id','sensor_id', ...]
     if "value" in df.columns:
         # descarta negativos en contaminantes
-        mask_pollutant = df["parameter"].isin(["pm25","pm10","pm1","no2","o3","so2","co"])
+        mask_pollutant = df["parameter"].isin(POLLUTANTS)
         df = df[~(mask_pollutant & (df["value"] < 0))]
     if "date_utc" in df.columns:
         df = df[~df["date_utc"].isna()]
@@ -167,17 +446,32 @@ def _basic_qc(df: pd.DataFrame) -> pd.DataFrame:
     print(f"[preprocess] QC: {before} -> {after} filas")
     return df
 
-def _normalize_units(df: pd.DataFrame) -> pd.DataFrame:
+def _normalize_units(df: pd.DataFrame, report: dict | None = None) -> pd.DataFrame:
+    """
+    Conversión fila a fila con UNIT_CONVERSIONS: factoriza parameter y unit,
+    arma la tabla para sus combinaciones distintas y la aplica con un gather
+    vectorizado (value * factor + offset). Si se pasa `report`, se completa con
+    el resumen de _unit_report.
+    """
     if not {"parameter","unit","value"}.issubset(df.columns):
         return df
-    out = []
-    for param, grp in df.groupby("parameter"):
-        src_units = grp["unit"].mode().iloc[0] if not grp["unit"].isna().all() else None
-        grp = grp.copy()
-        grp["value"] = _convert_units(grp["value"], src_units, param)
-        grp["unit"] = CANONICAL_UNITS.get(param, src_units)
-        out.append(grp)
-    return pd.concat(out, ignore_index=True) if out else df
+    p_codes, params = pd.factorize(df["parameter"])
+    u_codes, units = pd.factorize(df["unit"])
+    params, units = list(params), list(units)
+    table = _unit_table(params, units)
+    factor, offset, target, _ = table
+
+    # nulos (código -1) → último índice de cada eje
+    p_codes = np.where(p_codes < 0, len(params), p_codes)
+    u_codes = np.where(u_codes < 0, len(units), u_codes)
+    code = p_codes * (len(units) + 1) + u_codes
+
+    df = df.copy()
+    df["value"] = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype="float64") * factor[code] + offset[code]
+    df["unit"] = np.asarray(target, dtype=object)[code]
+    if report is not None:
+        report.update(_unit_report(params, units, np.bincount(code, minlength=len(factor)), table))
+    return df
 
 def _ensure_date_utc(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -215,49 +509,86 @@ def _ensure_date_utc(df: pd.DataFrame) -> pd.DataFrame:
     df["date_utc"] = pd.NaT
     return df
 
-def _resample_hourly_pivot(df: pd.DataFrame) -> pd.DataFrame:
-    # 1) quedarse con parámetros de interés
-    df = df[df["parameter"].isin(PARAMETERS)].copy()
-
-    # 2) timestamp a datetime (UTC)
-    df["ts"] = pd.to_datetime(df["date_utc"], utc=True, errors="coerce")
-    df = df.dropna(subset=["ts"])
-
-    # 3) para cada (parameter, ts), agregamos por promedio
-    agg = df.groupby([pd.Grouper(key="ts", freq="1H"), "parameter"], observed=True)["value"].mean().reset_index()
-
-    # 4) pivot ancho: una columna por parámetro
-    wide = agg.pivot(index="ts", columns="parameter", values="value").sort_index()
+def _hourly_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Promedio horario en formato largo: [location_id,] timestamp_utc, parameter, value.
+    Un único groupby para todas las series (estaciones) y parámetros.
+    """
+    if PANEL and PANEL_KEY not in df.columns:
+        raise KeyError(f"panel mode requires a '{PANEL_KEY}' column")
 
-    # 5) rellenos suaves para meteo
-    for p in ["temperature", "relativehumidity"]:
+    # 1) quedarse con parámetros de interés
+    keep = df["parameter"].isin(PARAMETERS)
+    if PANEL:
+        keep &= df[PANEL_KEY].notna()
+    df = df[keep]
+
+    # 2) timestamp a datetime (UTC), truncado a la hora
+    ts = pd.to_datetime(df["date_utc"], utc=True, errors="coerce").dt.floor("h")
+    ok = ts.notna().to_numpy()
+    df, ts = df[ok], ts[ok]
+
+    # 3) para cada ([location_id,] ts, parameter), agregamos por promedio
+    keys = [ts.rename("timestamp_utc"), df["parameter"].astype(str).rename("parameter")]
+    if PANEL:
+        keys.insert(0, df[PANEL_KEY].astype("int64").rename(PANEL_KEY))
+    return df["value"].groupby(keys, sort=True).mean().reset_index(name="value")
+
+def meteo_fill(s):
+    """Relleno suave de meteo sobre las filas horarias (también lo usa src.serving)."""
+    return s.interpolate(limit=2).ffill().bfill()
+
+def _wide_from_long(long: pd.DataFrame) -> pd.DataFrame:
+    """
+    Formato largo → tabla horaria ancha (una columna por parámetro), con
+    rellenos suaves para meteo. Común a los motores pandas y arrow.
+    """
+    if PANEL:
+        # filas (location_id, timestamp_utc): un unstack, sin pivot por estación
+        wide = long.set_index([PANEL_KEY, "timestamp_utc", "parameter"])["value"].unstack("parameter")
+        wide.columns.name = None
+        meteo = [p for p in METEO if p in wide.columns]
+        if meteo:
+            # rellenos dentro de cada estación
+            wide[meteo] = wide[meteo].groupby(level=PANEL_KEY, group_keys=False).transform(meteo_fill)
+        return wide.reset_index()
+
+    # pivot ancho: una columna por parámetro
+    wide = long.pivot(index="timestamp_utc", columns="parameter", values="value").sort_index()
+    for p in METEO:
         if p in wide.columns:
-            wide[p] = wide[p].interpolate(limit=2).ffill().bfill()
-
-    # 6) nombre claro al índice
-    wide.index.name = "timestamp_utc"
+            wide[p] = meteo_fill(wide[p])
     return wide.reset_index()
 
+def _resample_hourly_pivot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tabla horaria limpia: una fila por hora (ciudad) o por (location_id, hora)
+    en modo panel, una columna por parámetro.
+    """
+    return _wide_from_long(_hourly_long(df))
+
 def _compute_stats(df_wide: pd.DataFrame) -> dict:
     stats = {}
     if not df_wide.empty:
-        cols = [c for c in df_wide.columns if c != "timestamp_utc"]
+        cols = [c for c in df_wide.columns if c not in _id_columns(df_wide)]
         stats["na_ratio"] = {c: float(df_wide[c].isna().mean()) for c in cols}
         stats["min"] = {c: float(np.nanmin(df_wide[c])) for c in cols if not df_wide[c].isna().all()}
         stats["max"] = {c: float(np.nanmax(df_wide[c])) for c in cols if not df_wide[c].isna().all()}
     return stats
 
-def _save_processed(df_wide: pd.DataFrame, stats: dict):
-    out_dir = _processed_partition_path()
+def _save_processed(df_wide: pd.DataFrame, stats: dict, proc_date: str | None = None):
+    proc_date = proc_date or PROC_DATE
+    out_dir = _processed_partition_path(proc_date)
     main_path = f"{out_dir}/preprocessed.parquet"
     write_parquet(df_wide, main_path)
 
     meta = {
         "city": CITY,
-        "proc_date": PROC_DATE,
+        "proc_date": proc_date,
         "rows": int(len(df_wide)),
         "columns": list(df_wide.columns),
         "parameters": PARAMETERS,
+        "granularity": "location" if PANEL else "city",
         "stats": stats,
         "generated_at": datetime.now(UTC).isoformat().replace("+00:00","Z"),
         "artifact": "processed",
@@ -281,69 +612,124 @@ def _add_calendar_features(df: pd.DataFrame) -> pd.DataFrame:
     out["is_weekend"] = (out["dow"] >= 5).astype("int8")
     return out
 
+def _dense_hourly_index(ts: pd.Series, keys: pd.DataFrame | None) -> pd.Index:
+    """
+    Grilla horaria densa [min, max] de cada serie (por estación en modo panel),
+    construida vectorizada con repeat/arange (sin loop por estación).
+    """
+    hour = pd.Timedelta(hours=1)
+    if keys is None:
+        return pd.date_range(ts.min(), ts.max(), freq="h", name="timestamp_utc")
+    key = keys.columns[0]
+    naive = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    bounds = naive.groupby(keys[key].to_numpy()).agg(["min", "max"])
+    n = ((bounds["max"] - bounds["min"]) // hour).astype("int64").to_numpy() + 1
+    start = np.repeat(bounds["min"].to_numpy(), n)
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    grid_ts = pd.DatetimeIndex(start + offset * hour.to_timedelta64()).tz_localize("UTC")
+    return pd.MultiIndex.from_arrays([np.repeat(bounds.index.to_numpy(), n), grid_ts], names=[key, "timestamp_utc"])
+
 def _add_lags_and_rolls(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lags, rolling means y antigüedad del dato sobre una grilla horaria densa:
+    las horas sin lecturas existen como NaN, así "lag1" es siempre t-1h y
+    rolling(W) cubre exactamente W horas. Cada bloque (todos los lags de un
+    paso, todos los rollings, la antigüedad) se calcula de una vez y se unen
+    con un solo concat. La salida trae las filas de entrada con timestamp
+    válido (ordenadas por serie y hora, repetidas incluidas) y ninguna de relleno.
+    """
     # Si viene vacío, salimos rápido
     if df is None or df.empty:
         return df
 
     # Asegura y limpia el timestamp
-    ts = pd.to_datetime(df["timestamp_utc"], utc=True, errors="coerce")
+    ts = pd.to_datetime(df["timestamp_utc"], utc=True, errors="coerce").dt.floor("h")
     mask = ~ts.isna()
     if not mask.any():
         # no hay timestamps válidos; devolvemos igual (sin lags)
         return df.copy()
 
     out = df.loc[mask].copy()
-
-    # Trabajamos con un índice temporal pero SIN crear columna 'index'
-    out.index = ts.loc[mask]
-
-    # Lags para principales parámetros (solo si existen)
-    lag_params = ["pm25", "no2", "temperature", "relativehumidity"]
-    for p in lag_params:
-        if p in out.columns:
-            for L in [1, 2, 3, 6]:
-                out[f"{p}_lag{L}"] = out[p].shift(L)
-
-    # Rolling means (horarias)
-    if "pm25" in out.columns:
-        for W in [3, 6]:
-            out[f"pm25_roll{W}_mean"] = out["pm25"].rolling(W, min_periods=1).mean()
-
-    if "no2" in out.columns:
-        for W in [3]:
-            out[f"no2_roll{W}_mean"] = out["no2"].rolling(W, min_periods=1).mean()
-
-    # En vez de reset_index(drop=False), asignamos explícitamente y luego reseteamos
-    out["timestamp_utc"] = out.index
-    out.reset_index(drop=True, inplace=True)
-
-    return out
+    out["timestamp_utc"] = ts.loc[mask]
+    keys = _panel_keys(out)
+    index_cols = keys + ["timestamp_utc"]
+    out = out.sort_values(index_cols, kind="stable")
+
+    lag_cols = [p for p in LAG_PARAMS if p in out.columns]
+    roll_cols = [p for p in ROLL_WINDOWS if p in out.columns]
+    value_cols = list(dict.fromkeys(lag_cols + roll_cols + (["pm25"] if "pm25" in out.columns else [])))
+    if not value_cols:
+        return out.reset_index(drop=True)
+
+    # grilla densa sólo con las columnas que alimentan features, una fila por
+    # hora y serie (si hubiese repetidas gana la última)
+    values = out.drop_duplicates(subset=index_cols, keep="last").set_index(index_cols)[value_cols].astype("float64")
+    grid = values.reindex(_dense_hourly_index(out["timestamp_utc"], out[keys] if keys else None))
+    series = grid.groupby(level=keys[0], sort=False) if keys else grid
+
+    blocks = []
+    # Lags: un shift por paso para todos los parámetros a la vez
+    shifted = {L: series[lag_cols].shift(L) for L in LAG_HOURS} if lag_cols else {}
+    blocks += [shifted[L][p].rename(f"{p}_lag{L}") for p in lag_cols for L in LAG_HOURS]
+
+    # Rolling means (ventanas de W horas sobre la grilla densa)
+    for p in roll_cols:
+        for W in ROLL_WINDOWS[p]:
+            rolled = series[p].rolling(W, min_periods=1).mean()
+            if keys:
+                rolled = rolled.droplevel(0)
+            blocks.append(rolled.rename(f"{p}_roll{W}_mean"))
+
+    # Antigüedad del último pm25 observado (0 = hay lectura en esta hora)
+    if "pm25" in grid.columns:
+        grid_ts = pd.Series(grid.index.get_level_values("timestamp_utc"), index=grid.index)
+        last_seen = grid_ts.where(grid["pm25"].notna())
+        last_seen = last_seen.groupby(level=keys[0], sort=False).ffill() if keys else last_seen.ffill()
+        blocks.append(((grid_ts - last_seen) / pd.Timedelta(hours=1)).rename("pm25_age_h"))
+
+    feats = pd.concat(blocks, axis=1)
+    # volvemos a las filas originales (las horas de relleno no salen)
+    feats = feats.reindex(pd.MultiIndex.from_frame(out[index_cols]) if keys else out["timestamp_utc"])
+    return pd.concat([out.reset_index(drop=True), feats.reset_index(drop=True)], axis=1)
 
 
 def _add_target(df: pd.DataFrame) -> pd.DataFrame:
     out = df.copy()
-    # target: ¿pm25 de la próxima hora supera el umbral?
-    if "pm25" in out.columns:
-        out["pm25_next_hour"] = out["pm25"].shift(-1)
-        out["target_polluted_next_hour"] = (out["pm25_next_hour"] > THRESHOLD_PM25).astype("Int8")
+    # target: ¿pm25 de la próxima hora supera el umbral? (por tiempo, no por fila:
+    # si falta la hora siguiente el target queda NaN)
+    if "pm25" in out.columns and not out.empty:
+        keys = _panel_keys(out)
+        ts = pd.to_datetime(out["timestamp_utc"], utc=True)
+        nxt = ts + pd.Timedelta(hours=LOOKAHEAD_HOURS)
+        if keys:
+            pm25 = out.set_index([out[keys[0]], ts])["pm25"]
+            pm25 = pm25[~pm25.index.duplicated(keep="last")]
+            out["pm25_next_hour"] = pm25.reindex(pd.MultiIndex.from_arrays([out[keys[0]], nxt])).to_numpy()
+        else:
+            pm25 = pd.Series(out["pm25"].to_numpy(), index=ts)
+            pm25 = pm25[~pm25.index.duplicated(keep="last")]
+            out["pm25_next_hour"] = pm25.reindex(nxt).to_numpy()
+        target = (out["pm25_next_hour"] > THRESHOLD_PM25).astype("Int8")
+        out["target_polluted_next_hour"] = target.mask(out["pm25_next_hour"].isna())
     else:
         out["pm25_next_hour"] = np.nan
         out["target_polluted_next_hour"] = pd.Series(dtype="Int8")
     return out
 
-def _save_features(df_feat: pd.DataFrame):
-    out_dir = _features_partition_path()
+def _save_features(df_feat: pd.DataFrame, proc_date: str | None = None):
+    proc_date = proc_date or PROC_DATE
+    out_dir = _features_partition_path(proc_date)
     main_path = f"{out_dir}/features.parquet"
     write_parquet(df_feat, main_path)
 
-    cols = [c for c in df_feat.columns if c != "timestamp_utc"]
+    cols = [c for c in df_feat.columns if c not in _id_columns(df_feat)]
     meta = {
         "city": CITY,
-        "proc_date": PROC_DATE,
+        "proc_date": proc_date,
         "rows": int(len(df_feat)),
         "columns": list(df_feat.columns),
         "feature_set": "minimal_v1",
+        "granularity": "location" if PANEL else "city",
         "threshold_pm25": THRESHOLD_PM25,
         "label": "target_polluted_next_hour",
         "generated_at": datetime.now(UTC).isoformat().replace("+00:00","Z"),
@@ -362,47 +748,221 @@ def _save_features(df_feat: pd.DataFrame):
 # ----------------------------
 # Entry principal
 # ----------------------------
-def run_preprocess():
-    print(f"[preprocess] city={CITY} date={PROC_DATE} bucket={'gs://'+GCS_BUCKET if _is_gcs() else '(local)'}")
-    raw_dir = _raw_partition_path()
+def _save_empty(proc_date: str, note: str):
+    empty = pd.DataFrame(columns=["timestamp_utc"] + ([PANEL_KEY] if PANEL else []) + PARAMETERS)
+    _save_processed(empty, {"note": note}, proc_date)
+    # también escribimos features vacíos por idempotencia
+    _save_features(_add_target(_add_lags_and_rolls(_add_calendar_features(empty))), proc_date)
+
+def _process_raw_day(proc_date: str, files: list[str]) -> int:
+    """Fase 1 de un día: raw → processed (tabla horaria). Devuelve filas horarias."""
+    raw_dir = _raw_partition_path(proc_date)
 
     # 1) leer mediciones del día
-    files = _list_measurement_files()
     if not files:
         print(f"[preprocess] no hay mediciones en {raw_dir}")
-        empty = pd.DataFrame(columns=["timestamp_utc"] + PARAMETERS)
-        _save_processed(empty, {"note": "no data"})
-        # también escribimos features vacíos por idempotencia
-        _save_features(_add_target(_add_lags_and_rolls(_add_calendar_features(empty))))
-        return
-
-    df_raw = _load_concat_measurements(files)
-    if df_raw.empty:
-        print(f"[preprocess] mediciones vacías en {raw_dir}")
-        empty = pd.DataFrame(columns=["timestamp_utc"] + PARAMETERS)
-        _save_processed(empty, {"note": "empty"})
-        _save_features(_add_target(_add_lags_and_rolls(_add_calendar_features(empty))))
-        return
-
-    # 2) limpieza y normalización
-    df_qc = _basic_qc(df_raw)
-    df_norm = _normalize_units(df_qc)
-    df_norm = _ensure_date_utc(df_norm)
-
-    # 3) resample + pivot (tabla limpia por hora)
-    df_wide = _resample_hourly_pivot(df_norm)
+        _save_empty(proc_date, "no data")
+        return 0
+
+    unit_report: dict = {}
+    if ENGINE == "arrow":
+        # 2-3) QC + unidades + agregación horaria en Arrow; a pandas sólo la tabla horaria
+        from src.data import preprocess_arrow
+
+        table = _load_concat_table(files, columns=READ_COLUMNS, parameters=PARAMETERS)
+        if table is None or table.num_rows == 0:
+            print(f"[preprocess] mediciones vacías en {raw_dir}")
+            _save_empty(proc_date, "empty")
+            return 0
+        long = preprocess_arrow.hourly_long(
+            table,
+            parameters=PARAMETERS,
+            pollutants=POLLUTANTS,
+            unit_table=_unit_table,
+            panel_key=PANEL_KEY if PANEL else None,
+            unit_report=_unit_report,
+            report=unit_report,
+        )
+        df_wide = _wide_from_long(long)
+    else:
+        df_raw = _load_concat_measurements(files, columns=READ_COLUMNS, parameters=PARAMETERS)
+        if df_raw.empty:
+            print(f"[preprocess] mediciones vacías en {raw_dir}")
+            _save_empty(proc_date, "empty")
+            return 0
+
+        # 2) limpieza y normalización
+        df_qc = _basic_qc(df_raw)
+        df_norm = _normalize_units(df_qc, unit_report)
+        df_norm = _ensure_date_utc(df_norm)
+
+        # 3) resample + pivot (tabla limpia por hora)
+        df_wide = _resample_hourly_pivot(df_norm)
 
     # 4) stats + guardar processed
     stats = _compute_stats(df_wide)
-    _save_processed(df_wide, stats)
+    stats["units"] = unit_report
+    _save_processed(df_wide, stats, proc_date)
+    return len(df_wide)
+
+def _read_processed(proc_date: str, start=None, end=None) -> pd.DataFrame | None:
+    """
+    Lee processed/dt=<proc_date> filtrando timestamp_utc en [start, end] (filtro
+    pushdown de parquet: sólo se leen las filas del warm-up/lookahead).
+    None si la partición no existe o no tiene timestamps.
+    """
+    path = f"{_processed_partition_path(proc_date)}/preprocessed.parquet"
+    filters = []
+    if start is not None:
+        filters.append(("timestamp_utc", ">=", start))
+    if end is not None:
+        filters.append(("timestamp_utc", "<=", end))
+    try:
+        return read_parquet(path, filters=filters or None)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # p.ej. partición vacía (timestamp_utc sin tipo) → sin contexto
+        print(f"[preprocess] warning: no se pudo leer contexto {path}: {e}")
+        return None
 
-    # 5) construir features mínimos
-    df_feat = _add_calendar_features(df_wide)
+def _with_context(df_wide: pd.DataFrame, proc_date: str) -> pd.DataFrame:
+    """
+    Antepone las últimas WARMUP_HOURS del processed del día anterior y agrega
+    LOOKAHEAD_HOURS del día siguiente (si existen). Las filas de contexto quedan
+    marcadas con _ctx=True para descartarlas después de calcular features.
+    """
+    ts = pd.to_datetime(df_wide["timestamp_utc"], utc=True, errors="coerce")
+    if ts.isna().all():
+        return df_wide.assign(_ctx=False)
+    first, last = ts.min(), ts.max()
+    day = datetime.strptime(proc_date, "%Y-%m-%d")
+    prev_day = (day - timedelta(days=1)).strftime("%Y-%m-%d")
+    next_day = (day + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    prev = _read_processed(prev_day, start=first - pd.Timedelta(hours=WARMUP_HOURS), end=first)
+    nxt = _read_processed(next_day, start=last, end=last + pd.Timedelta(hours=LOOKAHEAD_HOURS))
+
+    parts = []
+    for ctx in (prev, nxt):
+        if ctx is None or ctx.empty:
+            continue
+        cts = pd.to_datetime(ctx["timestamp_utc"], utc=True)
+        # las particiones raw se solapan (ventana incremental): el día actual manda
+        ctx = ctx[(cts < first) | (cts > last)]
+        parts.append(ctx.reindex(columns=df_wide.columns).assign(_ctx=True))
+    if not parts:
+        return df_wide.assign(_ctx=False)
+    out = pd.concat([*parts, df_wide.assign(_ctx=False)], ignore_index=True)
+    out["timestamp_utc"] = pd.to_datetime(out["timestamp_utc"], utc=True)
+    return out.sort_values("timestamp_utc", kind="stable").reset_index(drop=True)
+
+def _build_day_features(proc_date: str) -> int:
+    """
+    Fase 2 de un día: processed (+ warm-up del día anterior y lookahead del
+    siguiente) → features. Así el inicio del día tiene lags/rollings completos y
+    la última hora tiene target, sin reprocesar días completos.
+    Devuelve filas de features (0 si no hay processed).
+    """
+    df_wide = _read_processed(proc_date)
+    if df_wide is None or df_wide.empty:
+        empty = pd.DataFrame(columns=["timestamp_utc"] + ([PANEL_KEY] if PANEL else []) + PARAMETERS)
+        _save_features(_add_target(_add_lags_and_rolls(_add_calendar_features(empty))), proc_date)
+        return 0
+
+    # 5) construir features mínimos (con contexto de los días vecinos)
+    df_feat = _with_context(df_wide, proc_date)
+    df_feat = _add_calendar_features(df_feat)
     df_feat = _add_lags_and_rolls(df_feat)
     df_feat = _add_target(df_feat)
+    df_feat = df_feat[~df_feat["_ctx"].astype(bool)].drop(columns="_ctx").reset_index(drop=True)
 
     # 6) guardar features
-    _save_features(df_feat)
+    _save_features(df_feat, proc_date)
+    return len(df_feat)
+
+def _process_day(proc_date: str, files: list[str]) -> int:
+    """Pipeline completo de un día (raw → processed → features). Devuelve filas horarias."""
+    rows = _process_raw_day(proc_date, files)
+    _build_day_features(proc_date)
+    return rows
+
+def run_preprocess(proc_date: str | None = None):
+    proc_date = proc_date or PROC_DATE
+    print(f"[preprocess] city={CITY} date={proc_date} bucket={'gs://'+GCS_BUCKET if _is_gcs() else '(local)'}")
+    _process_day(proc_date, _list_measurement_files(proc_date))
+
+    # el día anterior ya puede completar el target de su última hora (lookahead)
+    prev_day = (datetime.strptime(proc_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    if _read_processed(prev_day) is not None:
+        print(f"[preprocess] refreshing features of {prev_day} with lookahead from {proc_date}")
+        _build_day_features(prev_day)
+
+def _worker_config() -> dict:
+    return {"CITY": CITY, "GCS_BUCKET": GCS_BUCKET, "PARAMETERS": PARAMETERS, "PANEL": PANEL, "ENGINE": ENGINE}
+
+def _init_day_worker(config: dict):
+    # workers "spawn": no heredan el estado del padre (un fork con threads vivos,
+    # p.ej. de gcsfs/prefect, puede colgarse), así que copiamos la config
+    globals().update(config)
+
+def _run_days(fn, args_by_day: dict[str, tuple], max_workers: int) -> dict:
+    """Ejecuta fn(*args) por día en un pool de procesos. Devuelve {día: resultado} (sin los fallidos)."""
+    results = {}
+    if max_workers > 1 and len(args_by_day) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(args_by_day)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_day_worker,
+            initargs=(_worker_config(),),
+        ) as pool:
+            futures = {d: pool.submit(fn, *args) for d, args in args_by_day.items()}
+            for d, fut in futures.items():
+                try:
+                    results[d] = fut.result()
+                except Exception as e:
+                    print(f"[preprocess] day {d} failed: {e}")
+    else:
+        for d, args in args_by_day.items():
+            try:
+                results[d] = fn(*args)
+            except Exception as e:
+                print(f"[preprocess] day {d} failed: {e}")
+    return results
+
+def run_preprocess_range(start: str, end: str, max_workers: int = DAY_WORKERS) -> dict[str, int]:
+    """
+    Reprocesa [start, end] (YYYY-MM-DD, inclusivo): un solo listado para todo el
+    rango y un proceso por día (CPU-bound: pandas no libera el GIL).
+    Dos fases: primero todos los processed/, luego todos los features/ (cada día
+    lee el warm-up/lookahead de sus vecinos ya procesados).
+    Un día que falla no detiene al resto. Devuelve {día: filas horarias}.
+    """
+    days = [d.strftime("%Y-%m-%d") for d in pd.date_range(start, end, freq="D")]
+    print(f"[preprocess] city={CITY} range={start}..{end} ({len(days)} days) "
+          f"bucket={'gs://'+GCS_BUCKET if _is_gcs() else '(local)'}")
+    files_by_day = _list_measurement_files_range(start, end)
+
+    results = _run_days(_process_raw_day, {d: (d, files_by_day.get(d, [])) for d in days}, max_workers)
+    _run_days(_build_day_features, {d: (d,) for d in days if d in results}, max_workers)
+
+    failed = [d for d in days if d not in results]
+    print(f"[preprocess] {len(results)}/{len(days)} days ok" + (f"; failed: {failed}" if failed else ""))
+    return results
 
 if __name__ == "__main__":
-    run_preprocess()
+    parser = argparse.ArgumentParser(description="Preprocess OpenAQ (un día o un rango de días)")
+    parser.add_argument("--date", help="YYYY-MM-DD (default: PROC_DATE / hoy UTC)")
+    parser.add_argument("--start", help="YYYY-MM-DD, inicio del rango (inclusivo)")
+    parser.add_argument("--end", help="YYYY-MM-DD, fin del rango (inclusivo)")
+    parser.add_argument("--workers", type=int, default=DAY_WORKERS, help="días en paralelo")
+    parser.add_argument("--panel", action="store_true", help="serie horaria por estación (location_id)")
+    parser.add_argument("--engine", choices=["pandas", "arrow"], default=ENGINE)
+    args = parser.parse_args()
+    if args.panel:
+        PANEL = True
+    ENGINE = args.engine
+    if args.start and args.end:
+        run_preprocess_range(args.start, args.end, max_workers=args.workers)
+    else:
+        run_preprocess(args.date)
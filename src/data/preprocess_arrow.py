@@ -0,0 +1,215 @@
+# src/data/preprocess_arrow.py
+"""
+Motor Arrow para la cadena QC → normalización de unidades → agregación horaria
+de preprocess.py (PREPROCESS_ENGINE=arrow).
+
+Trabaja sobre el pa.Table concatenado de la partición con pyarrow.compute y
+sólo pasa a pandas el resultado horario (formato largo, decenas de filas por
+parámetro y día), en vez de convertir el raw completo y copiarlo en cada paso.
+La salida es la misma que la de _basic_qc/_normalize_units/_ensure_date_utc/
+_hourly_long; la config (parámetros, unidades) la pasa preprocess.py.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.api.measurements_structure import (
+    DEDUP_TIME_COLUMNS,
+    UTC_TS,
+    _to_utc_ts,
+    latest_record_mask,
+    measurement_keys,
+)
+
+# mismo orden de búsqueda que _ensure_date_utc
+TIME_CANDIDATES = [
+    "period_datetime_from_utc",
+    "datetime_from_utc",
+    "datetime_to_utc",
+    "utc",
+    "timestamp",
+    "ts",
+    "date",
+    "time",
+    "datetime",
+]
+
+
+def _full_row_dedup(t: pa.Table) -> pa.Table:
+    try:
+        return t.group_by(t.column_names, use_threads=False).aggregate([]).select(t.column_names)
+    except (pa.ArrowNotImplementedError, pa.ArrowInvalid, pa.ArrowTypeError):
+        # columnas no agrupables (listas/structs de archivos viejos)
+        return pa.Table.from_pandas(t.to_pandas().drop_duplicates(), preserve_index=False)
+
+
+def _drop_duplicates(t: pa.Table) -> pa.Table:
+    """
+    Una fila por (sensor_id, datetime_from_utc) con la clave int64 de
+    measurement_keys; gana la última aparición (latest_record_mask), igual
+    que drop_duplicate_measurements en el camino pandas. El filtro con
+    máscara conserva el orden original.
+    """
+    if t.num_rows == 0:
+        return t
+    keys = measurement_keys(t)
+    if keys is None:
+        return _full_row_dedup(t)
+    mask = latest_record_mask(keys)
+    return t if mask.all() else t.filter(pa.array(mask))
+
+
+def basic_qc(t: pa.Table, pollutants: list[str], rows_before: int | None = None) -> pa.Table:
+    """QC de _basic_qc. Con rows_before, `t` ya viene sin duplicados (y es sólo para el log)."""
+    if rows_before is None:
+        rows_before = t.num_rows
+        t = _drop_duplicates(t)
+    if "value" in t.column_names:
+        # descarta negativos en contaminantes (value nulo se conserva, como NaN < 0 en pandas)
+        negative = pc.and_(
+            pc.is_in(t["parameter"], value_set=pa.array(pollutants)),
+            pc.less(t["value"], 0),
+        )
+        t = t.filter(pc.invert(pc.fill_null(negative, False)))
+    if "date_utc" in t.column_names:
+        t = t.filter(pc.is_valid(t["date_utc"]))
+    print(f"[preprocess] QC: {rows_before} -> {t.num_rows} filas")
+    return t
+
+
+def normalize_units(
+    t: pa.Table,
+    unit_table: Callable[[list, list], tuple],
+    unit_report: Callable[..., dict] | None = None,
+    report: dict | None = None,
+) -> pa.Table:
+    """
+    Conversión fila a fila de _normalize_units: parameter y unit se codifican
+    como dictionary, `unit_table` da factor/offset/unidad para cada combinación
+    y se aplica con un take sobre el código `p * (U+1) + u` (nulos → último índice).
+    """
+    if not {"parameter", "unit", "value"}.issubset(t.column_names):
+        return t
+    if t.num_rows == 0:
+        return t
+
+    p = pc.dictionary_encode(t["parameter"]).combine_chunks()
+    u = pc.dictionary_encode(t["unit"]).combine_chunks()
+    params, units = p.dictionary.to_pylist(), u.dictionary.to_pylist()
+    table = unit_table(params, units)
+    factor, offset, target, _ = table
+
+    p_idx = pc.fill_null(pc.cast(p.indices, pa.int64()), len(params))
+    u_idx = pc.fill_null(pc.cast(u.indices, pa.int64()), len(units))
+    code = pc.add(pc.multiply(p_idx, len(units) + 1), u_idx)
+
+    value = pc.cast(t["value"], pa.float64())
+    if (factor != 1.0).any() or (offset != 0.0).any():
+        value = pc.add(
+            pc.multiply(value, pc.take(pa.array(factor), code)),
+            pc.take(pa.array(offset), code),
+        )
+    t = t.set_column(t.schema.get_field_index("value"), "value", value)
+    if report is not None and unit_report is not None:
+        counts = np.bincount(code.to_numpy(zero_copy_only=False), minlength=len(factor))
+        report.update(unit_report(params, units, counts, table))
+    # unidad destino como dictionary sobre la tabla: sin copiar strings por fila
+    # (categorías únicas y sin nulos, como exige pandas)
+    dictionary = sorted({x for x in target if x is not None})
+    remap = pa.array([dictionary.index(x) if x is not None else None for x in target], type=pa.int32())
+    unit = pa.DictionaryArray.from_arrays(pc.take(remap, code), pa.array(dictionary, type=pa.string()))
+    return t.set_column(t.schema.get_field_index("unit"), "unit", unit)
+
+
+def ensure_date_utc(t: pa.Table) -> pa.Table:
+    if "date_utc" in t.column_names:
+        return t
+    for col in TIME_CANDIDATES:
+        if col in t.column_names:
+            arr = t[col].combine_chunks()
+            if pa.types.is_timestamp(arr.type):
+                # misma resolución que la columna de origen (como pd.to_datetime)
+                arr = arr.cast(pa.timestamp(arr.type.unit, tz="UTC"))
+            else:
+                # strings: pd.to_datetime devuelve ns
+                arr = _to_utc_ts(arr).cast(pa.timestamp("ns", tz="UTC"))
+            return t.append_column("date_utc", arr)
+    print(f"[preprocess] warning: no se encontró columna de tiempo; columnas: {t.column_names}")
+    return t.append_column("date_utc", pa.nulls(t.num_rows, type=UTC_TS))
+
+
+_TICKS_PER_HOUR = {"s": 3600, "ms": 3_600_000, "us": 3_600_000_000, "ns": 3_600_000_000_000}
+
+
+def _floor_hour(ts) -> pa.ChunkedArray:
+    """Trunca un timestamp UTC a la hora con aritmética entera (floor_temporal es ~10x más lento)."""
+    raw = pc.cast(ts, pa.int64())
+    if len(raw) and (pc.min(raw).as_py() or 0) < 0:
+        return pc.floor_temporal(ts, unit="hour")  # antes de 1970: división entera no es floor
+    per_hour = _TICKS_PER_HOUR[ts.type.unit]
+    return pc.cast(pc.multiply(pc.divide(raw, per_hour), per_hour), ts.type)
+
+
+def hourly_aggregate(t: pa.Table, parameters: list[str], panel_key: str | None = None) -> pd.DataFrame:
+    """
+    Promedio por ([panel_key,] hora, parameter) con group_by de Arrow.
+    Devuelve el formato largo de preprocess._hourly_long.
+    """
+    if panel_key and panel_key not in t.column_names:
+        raise KeyError(f"panel mode requires a '{panel_key}' column")
+
+    keep = pc.is_in(t["parameter"], value_set=pa.array(parameters))
+    keep = pc.and_(keep, pc.is_valid(t["date_utc"]))
+    if panel_key:
+        keep = pc.and_(keep, pc.is_valid(t[panel_key]))
+    t = t.filter(pc.fill_null(keep, False))
+
+    value = pc.cast(t["value"], pa.float64())
+    # NaN → null: el mean de Arrow no salta NaN, el de pandas sí
+    value = pc.if_else(pc.is_nan(value), pa.scalar(None, pa.float64()), value)
+    cols = {
+        "timestamp_utc": _floor_hour(t["date_utc"]),
+        "parameter": pc.cast(t["parameter"], pa.string()),
+        "value": value,
+    }
+    keys = ["timestamp_utc", "parameter"]
+    if panel_key:
+        cols = {panel_key: pc.cast(t[panel_key], pa.int64()), **cols}
+        keys.insert(0, panel_key)
+
+    agg = pa.table(cols).group_by(keys, use_threads=False).aggregate([("value", "mean")])
+    out = agg.select([*keys, "value_mean"]).rename_columns([*keys, "value"]).to_pandas()
+    return out.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def hourly_long(
+    t: pa.Table,
+    parameters: list[str],
+    pollutants: list[str],
+    unit_table: Callable[[list, list], tuple],
+    panel_key: str | None = None,
+    unit_report: Callable[..., dict] | None = None,
+    report: dict | None = None,
+) -> pd.DataFrame:
+    """Cadena completa QC → unidades → fecha UTC → promedio horario, toda en Arrow."""
+    # sólo viajan las columnas que se usan; el dedup por clave no necesita más
+    # (sin clave cae a fila completa, que sí compara todas)
+    rows_before = t.num_rows
+    needed = {"parameter", "unit", "value", "date_utc", "sensor_id", *DEDUP_TIME_COLUMNS, *TIME_CANDIDATES, panel_key}
+    projected = [c for c in t.column_names if c in needed]
+    if "sensor_id" in projected and set(DEDUP_TIME_COLUMNS) & set(projected):
+        t = t.select(projected)
+    t = _drop_duplicates(t).select(projected)
+    if "date_utc" not in t.column_names:
+        # sólo la primera columna de tiempo presente (la que usaría ensure_date_utc)
+        first = next((c for c in TIME_CANDIDATES if c in t.column_names), None)
+        t = t.select([c for c in t.column_names if c not in TIME_CANDIDATES or c == first])
+    t = basic_qc(t, pollutants, rows_before=rows_before)
+    t = normalize_units(t, unit_table, unit_report, report)
+    t = ensure_date_utc(t)
+    return hourly_aggregate(t, parameters, panel_key)
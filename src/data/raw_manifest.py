@@ -0,0 +1,268 @@
+# src/data/raw_manifest.py
+"""
+Manifest por partición raw: openaq/<city>/dt=<día>/_manifest.json.
+
+Quien escribe un measurements_*.parquet (extract, backfill, compactación) lo
+registra acá con filas, bytes, rango de tiempo y hash de schema; los lectores
+(preprocess, compact_range) descubren los archivos del día con una lectura de
+un objeto chico en vez de listar GCS (lento y con rate limit a escala).
+
+    {
+      "version": 1,
+      "updated_at": "...Z",
+      "files": [{"file", "rows", "bytes", "min_ts", "max_ts", "schema_hash",
+                 "source", "written_at"}, ...],      # vivos
+      "compacted": "measurements_compacted_<ts>.parquet" | null,
+      "superseded": [{"file", "at"}, ...]            # reemplazados, pendientes de borrar
+    }
+
+La primera escritura de un día sin manifest lista el directorio una vez y
+registra lo que ya estaba (particiones de antes del manifest). La compactación
+lista siempre (es la única escritura que puede reconciliar) y re-registra lo
+que falte.
+
+openaq/<city>/_manifest_since.json ({"since": "<día>"}) se escribe con el
+primer manifest de la ciudad: desde `since` todo día con datos tiene manifest
+(los escritores de antes no podían escribir días futuros), así que un día sin
+manifest a partir de ahí está vacío y no hace falta listarlo.
+
+Lectura-modificación-escritura: serializado dentro del proceso; entre procesos
+se asume un escritor por partición (el extract escribe el día en curso, la
+compactación corre sobre días cerrados).
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from datetime import datetime, timezone
+
+import fsspec
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.api.measurements_structure import DEDUP_TIME_COLUMNS
+from src.utils.io import read_json, write_json
+
+UTC = timezone.utc
+
+MANIFEST = "_manifest.json"
+SINCE = "_manifest_since.json"
+VERSION = 1
+COMPACTED_PREFIX = "measurements_compacted_"
+MEASUREMENTS_GLOB = "measurements_*.parquet"
+_RUN_TS_RE = re.compile(r"^measurements_(\d{8}T\d{6})")
+
+_LOCKS: dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def _lock(raw_dir: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(raw_dir, threading.Lock())
+
+
+def _iso(ts) -> str | None:
+    if ts is None:
+        return None
+    try:
+        ts = pd.Timestamp(ts)
+    except (ValueError, TypeError):
+        return None
+    if pd.isna(ts):
+        return None
+    ts = ts.tz_localize(UTC) if ts.tzinfo is None else ts.tz_convert(UTC)
+    return ts.isoformat().replace("+00:00", "Z")
+
+
+def _name(path: str) -> str:
+    return str(path).replace("\\", "/").rstrip("/").rsplit("/", 1)[-1]
+
+
+def schema_hash(schema: pa.Schema) -> str:
+    """Hash estable de nombres + tipos (sin metadata de pandas)."""
+    text = ";".join(f"{f.name}:{f.type}" for f in schema)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def read_manifest(raw_dir: str) -> dict:
+    """Manifest del día; {} si no existe (o no se puede leer: los lectores caen al listado)."""
+    path = f"{raw_dir}/{MANIFEST}"
+    try:
+        return read_json(path)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[manifest] warning: no se pudo leer {path}: {e}")
+        return {}
+
+
+def _ts_stats(md: pq.FileMetaData) -> tuple[str | None, str | None]:
+    """min/max de la columna de tiempo de dedup sacados de las estadísticas del footer."""
+    names = [md.schema.column(j).path for j in range(md.num_columns)]
+    col = next((c for c in DEDUP_TIME_COLUMNS if c in names), None)
+    if col is None:
+        return None, None
+    j = names.index(col)
+    lo, hi = [], []
+    for i in range(md.num_row_groups):
+        stats = md.row_group(i).column(j).statistics
+        if stats is None or not stats.has_min_max:
+            return None, None
+        lo.append(_iso(stats.min))
+        hi.append(_iso(stats.max))
+    lo, hi = [x for x in lo if x], [x for x in hi if x]
+    # ISO UTC con Z: el orden lexicográfico es el cronológico
+    return (min(lo) if lo else None), (max(hi) if hi else None)
+
+
+def _city_dir(raw_dir: str) -> str:
+    return str(raw_dir).replace("\\", "/").rstrip("/").rsplit("/", 1)[0]
+
+
+def manifests_since(city_dir: str) -> str | None:
+    """Primer día (YYYY-MM-DD) desde el que todo día con datos tiene manifest; None si no se sabe."""
+    try:
+        return read_json(f"{city_dir}/{SINCE}").get("since")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[manifest] warning: no se pudo leer {city_dir}/{SINCE}: {e}")
+        return None
+
+
+def _mark_since(raw_dir: str, now: datetime) -> None:
+    """
+    Escribe el marcador de la ciudad si no existe. `since` es el día siguiente
+    a `now`: el día en curso puede tener archivos de escritores anteriores.
+    """
+    city_dir = _city_dir(raw_dir)
+    if manifests_since(city_dir) is None:
+        since = (pd.Timestamp(now).tz_convert(UTC) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        write_json({"since": since, "written_at": _iso(now)}, f"{city_dir}/{SINCE}")
+
+
+def describe_file(path: str, source: str, now: datetime | None = None) -> dict:
+    """Entrada de manifest de un parquet ya escrito (sólo lee el footer)."""
+    fs, rel = fsspec.core.url_to_fs(path)
+    with fs.open(rel, "rb") as f:
+        size = f.size
+        pf = pq.ParquetFile(f)
+        md, schema = pf.metadata, pf.schema_arrow
+    min_ts, max_ts = _ts_stats(md)
+    return {
+        "file": _name(path),
+        "rows": md.num_rows,
+        "bytes": int(size),
+        "min_ts": min_ts,
+        "max_ts": max_ts,
+        "schema_hash": schema_hash(schema),
+        "source": source,
+        "written_at": _iso(now or datetime.now(UTC)),
+    }
+
+
+def list_measurement_files(raw_dir: str) -> list[str]:
+    """Listado real del directorio (sólo para reconciliar; los lectores usan el manifest)."""
+    fs, rel = fsspec.core.url_to_fs(raw_dir)
+    prefix = "gs://" if str(raw_dir).startswith("gs://") else ""
+    found = [p if p.startswith(prefix) else f"{prefix}{p}" for p in fs.glob(f"{rel.rstrip('/')}/{MEASUREMENTS_GLOB}")]
+    return [f"{raw_dir}/{_name(p)}" for p in sorted(found)]
+
+
+def describe_files(raw_dir: str, names, source: str, now: datetime) -> list[dict]:
+    """describe_file de varios archivos del día; un footer ilegible queda registrado sin stats."""
+    out = []
+    for name in names:
+        try:
+            out.append(describe_file(f"{raw_dir}/{name}", source, now))
+        except Exception as e:
+            print(f"[manifest] warning: no se pudo leer el footer de {raw_dir}/{name}: {e}")
+            out.append({"file": name, "rows": None, "bytes": None, "min_ts": None, "max_ts": None,
+                        "schema_hash": None, "source": source, "written_at": _iso(now)})
+    return out
+
+
+def record_files(raw_dir: str, paths: list[str], source: str, now: datetime | None = None) -> dict:
+    """
+    Registra (upsert por nombre) archivos recién escritos en raw_dir. Un archivo
+    re-escrito con el mismo nombre (backfill) deja de estar marcado como reemplazado.
+    Devuelve el manifest escrito.
+    """
+    now = now or datetime.now(UTC)
+    entries = describe_files(raw_dir, [_name(p) for p in paths], source, now)
+    with _lock(raw_dir):
+        manifest = read_manifest(raw_dir)
+        if not manifest:
+            # partición sin manifest: registra lo que ya estaba escrito
+            new = {e["file"] for e in entries}
+            existing = [_name(p) for p in list_measurement_files(raw_dir) if _name(p) not in new]
+            entries = describe_files(raw_dir, existing, "listing", now) + entries
+            manifest = {"version": VERSION, "files": [], "compacted": None, "superseded": []}
+            _mark_since(raw_dir, now)
+        new = {e["file"] for e in entries}
+        manifest["files"] = [e for e in manifest.get("files", []) if e["file"] not in new] + entries
+        manifest["superseded"] = [e for e in manifest.get("superseded", []) if e["file"] not in new]
+        manifest["updated_at"] = _iso(now)
+        write_json(manifest, f"{raw_dir}/{MANIFEST}")
+    return manifest
+
+
+def write_manifest(raw_dir: str, manifest: dict, now: datetime | None = None) -> dict:
+    """Reescribe el manifest completo (compactación / reconciliación)."""
+    with _lock(raw_dir):
+        manifest = {"version": VERSION, **manifest, "updated_at": _iso(now or datetime.now(UTC))}
+        write_json(manifest, f"{raw_dir}/{MANIFEST}")
+    return manifest
+
+
+def _written_at(name: str, entries: dict[str, dict]) -> float:
+    """
+    Hora de escritura de un archivo: written_at del manifest si lo registró quien
+    lo escribió; si no (sin manifest o registrado por un listado), el run_ts de
+    measurements_<run_ts>. Un backfill sin registro no tiene fecha: va primero.
+    """
+    entry = entries.get(name)
+    if entry and entry.get("source") != "listing" and entry.get("written_at"):
+        return pd.Timestamp(entry["written_at"]).timestamp()
+    m = _RUN_TS_RE.match(name)
+    if m:
+        return datetime.strptime(m.group(1), "%Y%m%dT%H%M%S").replace(tzinfo=UTC).timestamp()
+    return 0.0
+
+
+def write_order(paths: list[str], manifest: dict) -> list[str]:
+    """
+    Orden de concatenación para el dedup (gana la última aparición): primero el
+    compactado del día (todo lo que no quedó dentro es más nuevo), después por
+    hora de escritura real, no por nombre (measurements_backfill_* ordena después
+    de cualquier measurements_<run_ts> aunque sea más viejo). Empates por nombre.
+    """
+    entries = {e["file"]: e for e in manifest.get("files", [])}
+
+    def key(path: str) -> tuple[int, float, str]:
+        name = _name(path)
+        if name.startswith(COMPACTED_PREFIX):
+            return (0, 0.0, name)
+        return (1, _written_at(name, entries), name)
+
+    return sorted(paths, key=key)
+
+
+def live_files(raw_dir: str, manifest: dict) -> list[str]:
+    """Rutas de los archivos vivos según el manifest (sin listar), en write_order."""
+    return write_order([f"{raw_dir}/{e['file']}" for e in manifest.get("files", [])], manifest)
+
+
+def drop_superseded(files: list[str], manifest: dict) -> list[str]:
+    """
+    Descarta de un listado real los archivos que la compactación ya reemplazó
+    (quedan hasta el borrado diferido). Si el compactado todavía no aparece en
+    el listado, se dejan todos: el dedup por clave absorbe el solapamiento.
+    """
+    superseded = {e["file"] for e in manifest.get("superseded", [])}
+    names = {_name(f) for f in files}
+    if not superseded or manifest.get("compacted") not in names:
+        return files
+    return [f for f in files if _name(f) not in superseded]
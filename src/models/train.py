@@ -0,0 +1,297 @@
+# src/models/train.py
+"""
+Entrenamiento del clasificador de target_polluted_next_hour sobre el feature
+store (openaq/<city>/features o features_panel).
+
+- Lee [start, end] con feature_store.load_features (rollups mensuales, lectura
+  en paralelo y sólo las columnas del modelo).
+- CV rolling-origin: los últimos TRAIN_CV_FOLDS bloques de TRAIN_CV_TEST_HOURS
+  horas son los tests; cada fold entrena con todo lo anterior a su test menos
+  un gap de LOOKAHEAD_HOURS (el target de t mira t+1: sin el gap el último
+  label de train es una lectura del test). Los folds corren en paralelo
+  (joblib, un proceso por fold).
+- Modelo final sobre todo el rango → artefacto versionado junto a los datos:
+  openaq/<city>/models[_panel]/v=<ts>/{model.joblib, metrics.json} y
+  latest.json apuntando a la última versión (se escribe al final: un lector
+  nunca ve un latest a una versión incompleta).
+
+    python -m src.models.train --start 2025-06-01 --end 2025-08-31 [--panel] [--model hgb|logreg]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime, timezone
+
+import fsspec
+import joblib
+import numpy as np
+import pandas as pd
+from prefect import flow
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import average_precision_score, brier_score_loss, f1_score, roc_auc_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from src.data import feature_store as fstore
+from src.data import preprocess as pre
+from src.utils.io import read_json, write_json
+
+UTC = timezone.utc
+
+# ----------------------------
+# Config vía envs
+# ----------------------------
+MODEL_KIND = os.getenv("TRAIN_MODEL", "hgb").strip().lower()  # "hgb" | "logreg"
+CV_FOLDS = int(os.getenv("TRAIN_CV_FOLDS", "5"))
+CV_TEST_HOURS = int(os.getenv("TRAIN_CV_TEST_HOURS", "168"))  # una semana por fold
+CV_WORKERS = int(os.getenv("TRAIN_CV_WORKERS", str(os.cpu_count() or 1)))
+DECISION_THRESHOLD = float(os.getenv("TRAIN_DECISION_THRESHOLD", "0.5"))
+# menos árboles → predicción online más rápida, a costo de calidad: con 300 el
+# GET /predict de todas las estaciones de src/serving no llega a p99 < 10ms
+# (ver src/serving/app.py); con 100 sí
+HGB_MAX_ITER = int(os.getenv("TRAIN_HGB_MAX_ITER", "300"))
+HGB_LEARNING_RATE = float(os.getenv("TRAIN_HGB_LEARNING_RATE", "0.05"))
+
+LABEL = "target_polluted_next_hour"
+TS_COL = "timestamp_utc"
+# nunca son features: ids, el label y lo que se deriva de la hora siguiente
+NON_FEATURES = {TS_COL, pre.PANEL_KEY, LABEL, "pm25_next_hour"}
+
+
+# ----------------------------
+# Datos
+# ----------------------------
+def _models_root(city: str | None = None, panel: bool = False) -> str:
+    return f"{pre._city_root(city)}/{'models_panel' if panel else 'models'}"
+
+
+def feature_columns(df: pd.DataFrame) -> list[str]:
+    """Columnas numéricas del feature set, en el orden del archivo."""
+    return [c for c in df.columns if c not in NON_FEATURES and pd.api.types.is_numeric_dtype(df[c])]
+
+
+def _training_frame(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[str]]:
+    """
+    (X float32, y int8, timestamps int64 ns, features) de las filas con label,
+    ordenado por tiempo y sin horas repetidas por serie. Sin pm25 en t+1h no hay
+    label: features escritos antes de que _add_target lo dejara NA traen un 0
+    en huecos y fines de serie.
+    """
+    labeled = df[LABEL].notna()
+    if "pm25_next_hour" in df.columns:
+        labeled &= df["pm25_next_hour"].notna()
+    # una fila por ([location_id,] hora): una hora repetida (particiones solapadas)
+    # podría caer en train y test de un mismo fold con labels opuestos
+    keys = [c for c in (pre.PANEL_KEY, TS_COL) if c in df.columns]
+    df = df[labeled].drop_duplicates(subset=keys, keep="last").sort_values(TS_COL, kind="stable")
+    features = feature_columns(df)
+    X = df[features].to_numpy(dtype=np.float32, na_value=np.nan)
+    y = df[LABEL].to_numpy(dtype=np.int8)
+    ts = pd.to_datetime(df[TS_COL], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return X, y, ts, features
+
+
+def rolling_origin_splits(
+    ts: np.ndarray,
+    n_folds: int = CV_FOLDS,
+    test_hours: int = CV_TEST_HOURS,
+    gap_hours: int = pre.LOOKAHEAD_HOURS,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    (train_idx, test_idx) por fold sobre `ts` (ns, ordenado). Los tests son
+    bloques consecutivos de `test_hours` al final del rango; el train de cada
+    fold es todo lo anterior a su test - gap (origen creciente). Folds sin
+    train o sin test se omiten.
+    """
+    if len(ts) == 0:
+        return []
+    hour = np.int64(3_600 * 10**9)
+    end = ts[-1] + hour
+    splits = []
+    for k in range(n_folds, 0, -1):
+        test_start = end - k * test_hours * hour
+        test_end = test_start + test_hours * hour
+        train_end = test_start - gap_hours * hour
+        train_idx = np.flatnonzero(ts < train_end)
+        test_idx = np.flatnonzero((ts >= test_start) & (ts < test_end))
+        if len(train_idx) and len(test_idx):
+            splits.append((train_idx, test_idx))
+    return splits
+
+
+# ----------------------------
+# Modelo
+# ----------------------------
+def make_model(kind: str = MODEL_KIND):
+    if kind == "hgb":
+        # NaN nativos (horas sin lectura, lags al borde de la serie)
+        return HistGradientBoostingClassifier(
+            max_iter=HGB_MAX_ITER, learning_rate=HGB_LEARNING_RATE, early_stopping=False, random_state=0
+        )
+    if kind == "logreg":
+        return make_pipeline(SimpleImputer(strategy="median"), StandardScaler(), LogisticRegression(max_iter=1000))
+    raise ValueError(f"TRAIN_MODEL desconocido: {kind!r} (hgb | logreg)")
+
+
+def _scores(y: np.ndarray, proba: np.ndarray, threshold: float) -> dict:
+    both = len(np.unique(y)) == 2  # AUC/AP no están definidos con una sola clase
+    return {
+        "roc_auc": float(roc_auc_score(y, proba)) if both else None,
+        "average_precision": float(average_precision_score(y, proba)) if both else None,
+        "brier": float(brier_score_loss(y, proba, pos_label=1)),
+        "f1": float(f1_score(y, proba >= threshold, zero_division=0)),
+        "positive_rate": float(y.mean()),
+    }
+
+
+def _fit(kind: str, X: np.ndarray, y: np.ndarray):
+    model = make_model(kind)
+    if len(np.unique(y)) < 2:
+        raise ValueError("el train tiene una sola clase")
+    return model.fit(X, y)
+
+
+def _run_fold(fold: int, kind: str, X, y, train_idx, test_idx, persistence, threshold: float) -> dict:
+    result = {"fold": fold, "n_train": int(len(train_idx)), "n_test": int(len(test_idx))}
+    try:
+        model = _fit(kind, X[train_idx], y[train_idx])
+    except ValueError as e:
+        print(f"[train] fold {fold}: se omite ({e})")
+        return {**result, "skipped": str(e)}
+    proba = model.predict_proba(X[test_idx])[:, 1]
+    result.update(_scores(y[test_idx], proba, threshold))
+    if persistence is not None:
+        # baseline: "la próxima hora supera el umbral si esta hora lo supera"
+        result["f1_persistence"] = float(f1_score(y[test_idx], persistence[test_idx], zero_division=0))
+    return result
+
+
+def cross_validate(
+    X: np.ndarray,
+    y: np.ndarray,
+    ts: np.ndarray,
+    kind: str = MODEL_KIND,
+    n_folds: int = CV_FOLDS,
+    test_hours: int = CV_TEST_HOURS,
+    n_jobs: int = CV_WORKERS,
+    persistence: np.ndarray | None = None,
+    threshold: float = DECISION_THRESHOLD,
+) -> list[dict]:
+    """Métricas por fold; los folds se entrenan en paralelo (un proceso por fold)."""
+    splits = rolling_origin_splits(ts, n_folds, test_hours)
+    jobs = max(1, min(n_jobs, len(splits)))
+    # X/y grandes viajan memmapeados (joblib), no copiados por fold
+    return joblib.Parallel(n_jobs=jobs)(
+        joblib.delayed(_run_fold)(i, kind, X, y, tr, te, persistence, threshold)
+        for i, (tr, te) in enumerate(splits)
+    )
+
+
+def _summary(folds: list[dict]) -> dict:
+    done = [f for f in folds if "skipped" not in f]
+    keys = ["roc_auc", "average_precision", "brier", "f1", "f1_persistence"]
+    out = {"folds": len(folds), "folds_ok": len(done)}
+    for k in keys:
+        values = [f[k] for f in done if f.get(k) is not None]
+        out[f"{k}_mean"] = float(np.mean(values)) if values else None
+    return out
+
+
+# ----------------------------
+# Artefactos
+# ----------------------------
+def _dump(obj, path: str) -> str:
+    fs, rel = fsspec.core.url_to_fs(path)
+    fs.makedirs(rel.rsplit("/", 1)[0], exist_ok=True)
+    with fs.open(rel, "wb") as f:
+        joblib.dump(obj, f)
+    return path
+
+
+def load_latest(city: str | None = None, panel: bool = False) -> dict:
+    """Bundle del último modelo ({"model", "features", "threshold", ...}) según latest.json."""
+    root = _models_root(city, panel)
+    latest = read_json(f"{root}/latest.json")
+    with fsspec.open(f"{root}/{latest['path']}", "rb") as f:
+        return joblib.load(f)
+
+
+@flow(name="train-openaq", log_prints=True)
+def TrainFlow(
+    start: str | None = None,
+    end: str | None = None,
+    city: str | None = None,
+    panel: bool = False,
+    kind: str = MODEL_KIND,
+    n_folds: int = CV_FOLDS,
+    test_hours: int = CV_TEST_HOURS,
+    n_jobs: int = CV_WORKERS,
+    now: datetime | None = None,
+) -> dict:
+    """
+    CV rolling-origin + modelo final sobre features de [start, end]. Escribe
+    v=<ts>/model.joblib, v=<ts>/metrics.json y latest.json. Devuelve las métricas.
+    """
+    now = now or datetime.now(UTC)
+    df = fstore.load_features(city, start, end, panel=panel)
+    if df.empty or LABEL not in df.columns:
+        raise ValueError(f"sin features con {LABEL} en {start}..{end}")
+    X, y, ts, features = _training_frame(df)
+    print(f"[train] {len(y)} filas con label, {len(features)} features, positivos={y.mean():.3f}")
+
+    persistence = None
+    if "pm25" in features:
+        persistence = (np.nan_to_num(X[:, features.index("pm25")], nan=-np.inf) > pre.THRESHOLD_PM25).astype(np.int8)
+    folds = cross_validate(X, y, ts, kind, n_folds, test_hours, n_jobs, persistence)
+    summary = _summary(folds)
+    print(f"[train] CV {summary}")
+
+    model = _fit(kind, X, y)
+    version = now.strftime("%Y%m%dT%H%M%S")
+    root = _models_root(city, panel)
+    bundle = {
+        "model": model,
+        "kind": kind,
+        "features": features,
+        "label": LABEL,
+        "threshold": DECISION_THRESHOLD,
+        "threshold_pm25": pre.THRESHOLD_PM25,
+        "granularity": "location" if panel else "city",
+        "version": version,
+    }
+    metrics = {
+        "version": version,
+        "kind": kind,
+        "city": city or pre.CITY,
+        "granularity": bundle["granularity"],
+        "range": {"start": start, "end": end},
+        "rows": int(len(y)),
+        "features": features,
+        "cv": {"folds": n_folds, "test_hours": test_hours, "gap_hours": pre.LOOKAHEAD_HOURS},
+        "summary": summary,
+        "folds": folds,
+        "trained_at": now.isoformat().replace("+00:00", "Z"),
+    }
+    _dump(bundle, f"{root}/v={version}/model.joblib")
+    write_json(metrics, f"{root}/v={version}/metrics.json")
+    write_json({"version": version, "path": f"v={version}/model.joblib", "summary": summary,
+                "trained_at": metrics["trained_at"]}, f"{root}/latest.json")
+    print(f"[train] modelo → {root}/v={version}/ (latest.json actualizado)")
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena el clasificador de PM2.5 de la próxima hora")
+    parser.add_argument("--start", help="YYYY-MM-DD (default: primer día del feature store)")
+    parser.add_argument("--end", help="YYYY-MM-DD (default: hoy UTC)")
+    parser.add_argument("--city", default=None)
+    parser.add_argument("--panel", action="store_true", help="features_panel (por estación)")
+    parser.add_argument("--model", choices=["hgb", "logreg"], default=MODEL_KIND)
+    parser.add_argument("--folds", type=int, default=CV_FOLDS)
+    parser.add_argument("--workers", type=int, default=CV_WORKERS, help="folds en paralelo")
+    args = parser.parse_args()
+    TrainFlow(args.start, args.end, city=args.city, panel=args.panel, kind=args.model,
+              n_folds=args.folds, n_jobs=args.workers)
@@ -0,0 +1,141 @@
+# src/serving/app.py
+"""
+Servicio de predicción online: ¿pm25 de la próxima hora supera THRESHOLD_PM25?
+
+- Al arrancar carga una vez el último modelo (src.models.train, latest.json)
+  y precalienta los buffers con el raw de hoy y ayer (manifest del extract).
+- POST /ingest recibe mediciones con el formato del extract y actualiza el
+  ring buffer de cada serie (online_features).
+- GET /predict/{location_id} puntúa una serie; GET /predict todas a la vez
+  con un único predict_proba. Ninguno arma DataFrames ni lee storage.
+  En modo ciudad (default) hay una sola serie, con location_id 0; con
+  SERVE_PANEL=1 (modelo de train --panel) una por estación.
+
+Latencia (benchmarks/bench_serving.py, 1 CPU, 300 estaciones; objetivo p99 < 10ms):
+con el modelo default de src.models.train (TRAIN_HGB_MAX_ITER=300)
+/predict/{location_id} cumple (~8ms) pero GET /predict de todas NO (~19ms: el
+costo es predict_proba y crece con los árboles). Entrenar con
+TRAIN_HGB_MAX_ITER=100 deja ambos bajo el objetivo (~4 / ~8ms), a costo de
+calidad del modelo.
+
+    uvicorn src.serving.app:app --host 0.0.0.0 --port 8080
+"""
+from __future__ import annotations
+
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import sklearn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from src.data import preprocess as pre
+from src.models import train
+from src.serving.online_features import OnlineFeatureStore, hour_to_datetime
+
+UTC = timezone.utc
+
+SERVE_CITY = os.getenv("SERVE_CITY", pre.CITY)
+# mismo default que TrainFlow (modelo de ciudad); "1" sirve el de train --panel
+SERVE_PANEL = os.getenv("SERVE_PANEL", "0") == "1"
+# días de raw (hasta hoy) para precalentar los buffers; 0 = arranca vacío
+WARM_DAYS = int(os.getenv("SERVE_WARM_DAYS", "2"))
+
+
+class Measurement(BaseModel):
+    sensor_id: int | None = None
+    location_id: int | None = None
+    parameter: str
+    unit: str | None = None
+    value: float | None = None
+    datetime_from_utc: datetime
+
+
+class Prediction(BaseModel):
+    location_id: int
+    timestamp_utc: datetime
+    probability: float
+    polluted_next_hour: bool
+    model_version: str
+
+
+def _warm_start(store: OnlineFeatureStore, days: int = WARM_DAYS) -> int:
+    """Carga el raw de los últimos `days` días (listado por manifest) en los buffers."""
+    today = datetime.now(UTC).date()
+    applied = 0
+    for k in range(days - 1, -1, -1):
+        day = (today - timedelta(days=k)).strftime("%Y-%m-%d")
+        files = pre._list_measurement_files(day, city=SERVE_CITY)
+        if files:
+            df = pre._load_concat_measurements(files, columns=pre.READ_COLUMNS, parameters=store.parameters)
+            applied += store.ingest(df)
+    print(f"[serving] warm start: {applied} lecturas de {days} días")
+    return applied
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    bundle = train.load_latest(SERVE_CITY, panel=SERVE_PANEL)
+    app.state.bundle = bundle
+    app.state.store = OnlineFeatureStore(bundle["features"], panel=bundle["granularity"] == "location")
+    print(f"[serving] modelo {bundle['version']} ({bundle['kind']}, {len(bundle['features'])} features)")
+    if WARM_DAYS > 0:
+        try:
+            _warm_start(app.state.store)
+        except Exception as e:
+            print(f"[serving] warning: warm start falló, buffers vacíos: {e}")
+    yield
+
+
+app = FastAPI(title="pollution-prediction", lifespan=lifespan)
+
+
+def _score(ids: list[int] | None) -> list[dict]:
+    bundle, store = app.state.bundle, app.state.store
+    ids, X, hours = store.matrix(ids)
+    if not ids:
+        return []
+    # NaN es válido para el modelo (hgb nativo / imputer): se salta el chequeo de finitos
+    with sklearn.config_context(assume_finite=True):
+        proba = bundle["model"].predict_proba(X)[:, 1]
+    threshold, version = bundle["threshold"], bundle["version"]
+    return [
+        {"location_id": i, "timestamp_utc": hour_to_datetime(h).isoformat(), "probability": float(p),
+         "polluted_next_hour": bool(p >= threshold), "model_version": version}
+        for i, h, p in zip(ids, hours.tolist(), proba.tolist())
+    ]
+
+
+@app.get("/health")
+def health() -> dict:
+    return {"model_version": app.state.bundle["version"], "series": len(app.state.store.series_ids())}
+
+
+@app.post("/ingest")
+def ingest(measurements: list[Measurement]) -> dict:
+    if not measurements:
+        return {"applied": 0}
+    df = pd.DataFrame([m.model_dump() for m in measurements])
+    try:
+        applied = app.state.store.ingest(df)
+    except KeyError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"applied": applied}
+
+
+# Las respuestas se arman como dicts y van directo a JSONResponse: el
+# response_model documenta el contrato sin re-validar cada fila por request.
+@app.get("/predict", response_model=list[Prediction])
+def predict_all() -> JSONResponse:
+    return JSONResponse(_score(None))
+
+
+@app.get("/predict/{location_id}", response_model=Prediction)
+def predict(location_id: int) -> JSONResponse:
+    out = _score([location_id])
+    if not out:
+        raise HTTPException(status_code=404, detail=f"sin lecturas para location_id={location_id}")
+    return JSONResponse(out[0])
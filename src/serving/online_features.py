@@ -0,0 +1,277 @@
+# src/serving/online_features.py
+"""
+Features online para el servicio de predicción: mismo vector que
+preprocess._add_calendar_features + _add_lags_and_rolls para la última hora
+de cada serie (ciudad o estación), sin armar un DataFrame por request.
+
+Cada serie es una fila de un ring buffer de WARMUP_HOURS + 1 horas (lo máximo
+que miran los lags y rollings): slot = hora % N, con suma/conteo por
+parámetro para el promedio horario. Todas las series viven en los mismos
+arrays ([series, slot, parámetro]), así el vector de una estación o la matriz
+de todas salen con unos pocos gathers de numpy; el costo no depende de cuánta
+historia se ingirió.
+
+Las lecturas se identifican con la clave de dedup del raw (sensor_id,
+datetime_from_utc): un run que vuelve a traer una medición (solape del
+extract) reemplaza su valor en vez de contarla dos veces.
+
+Meteo (preprocess.METEO) se rellena como en la tabla horaria offline
+(preprocess.meteo_fill sobre las horas con alguna lectura), partiendo de la
+última lectura anterior a la ventana que se guarda por serie.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from src.api.measurements_structure import measurement_keys_df
+from src.data import preprocess as pre
+
+UTC = timezone.utc
+
+N_SLOTS = pre.WARMUP_HOURS + 1
+_EPOCH_DOW = 3  # 1970-01-01 fue jueves (lunes = 0, como dt.weekday)
+
+_LAG_RE = re.compile(r"^(?P<p>.+)_lag(?P<n>\d+)$")
+_ROLL_RE = re.compile(r"^(?P<p>.+)_roll(?P<n>\d+)_mean$")
+CALENDAR = ("hour", "dow", "is_weekend")
+
+
+class OnlineFeatureStore:
+    """
+    Ring buffers de todas las series + plan de features del modelo (`features`
+    del bundle de src.models.train), resuelto una vez al construir.
+    """
+
+    def __init__(self, features: list[str], panel: bool = False, parameters: list[str] | None = None):
+        self.features = list(features)
+        self.panel = panel
+        self.parameters = list(parameters or pre.PARAMETERS)
+        self._pidx = {p: i for i, p in enumerate(self.parameters)}
+        self._lock = threading.Lock()
+
+        # una fila por serie; crecen al doble cuando se llenan
+        self._row: dict[int, int] = {}
+        self._ids = np.empty(0, dtype=np.int64)
+        self._hours = np.full((0, N_SLOTS), -1, dtype=np.int64)
+        self._sums = np.zeros((0, N_SLOTS, len(self.parameters)))
+        self._counts = np.zeros((0, N_SLOTS, len(self.parameters)), dtype=np.int64)
+        self._last = np.full(0, -1, dtype=np.int64)
+        self._pm25_seen = np.full(0, -1, dtype=np.int64)
+        self._readings: dict[tuple[int, int], dict[int, tuple[int, float]]] = {}
+
+        self._plan = [self._compile(f) for f in self.features]
+        # meteo que usa el modelo: última lectura (hora, promedio) que ya salió del ring buffer
+        used = {p for kind, p, _ in self._plan if kind == "lag"}
+        self._meteo = [self._pidx[p] for p in pre.METEO if self._pidx.get(p) in used]
+        self._carry_hours = np.full((0, len(self._meteo)), -1, dtype=np.int64)
+        self._carry_values = np.full((0, len(self._meteo)), np.nan)
+        unknown = [f for f, step in zip(self.features, self._plan) if step[0] == "nan"]
+        if unknown:
+            print(f"[serving] warning: features sin cálculo online (quedan NaN): {unknown}")
+
+    def _compile(self, name: str) -> tuple[str, int, int]:
+        if name in self._pidx:
+            return ("lag", self._pidx[name], 0)  # valor de la hora actual = lag 0
+        if name in CALENDAR:
+            return (name, 0, 0)
+        if name == "pm25_age_h":
+            return ("age", 0, 0)
+        for kind, rx in (("lag", _LAG_RE), ("roll", _ROLL_RE)):
+            m = rx.match(name)
+            if m and m.group("p") in self._pidx and int(m.group("n")) < N_SLOTS + (kind == "roll"):
+                return (kind, self._pidx[m.group("p")], int(m.group("n")))
+        return ("nan", 0, 0)
+
+    # ----------------------------
+    # Ingesta
+    # ----------------------------
+    def _series_row(self, sid: int) -> int:
+        row = self._row.get(sid)
+        if row is not None:
+            return row
+        row = self._row[sid] = len(self._row)
+        if row >= len(self._ids):
+            grow = max(8, len(self._ids))
+            self._ids = np.concatenate([self._ids, np.zeros(grow, dtype=np.int64)])
+            self._hours = np.concatenate([self._hours, np.full((grow, N_SLOTS), -1, dtype=np.int64)])
+            self._sums = np.concatenate([self._sums, np.zeros((grow, *self._sums.shape[1:]))])
+            self._counts = np.concatenate([self._counts, np.zeros((grow, *self._counts.shape[1:]), dtype=np.int64)])
+            self._last = np.concatenate([self._last, np.full(grow, -1, dtype=np.int64)])
+            self._pm25_seen = np.concatenate([self._pm25_seen, np.full(grow, -1, dtype=np.int64)])
+            self._carry_hours = np.concatenate([self._carry_hours, np.full((grow, len(self._meteo)), -1, dtype=np.int64)])
+            self._carry_values = np.concatenate([self._carry_values, np.full((grow, len(self._meteo)), np.nan)])
+        self._ids[row] = sid
+        return row
+
+    def _add(self, row: int, hour: int, param: int, value: float, key: int) -> None:
+        slot = hour % N_SLOTS
+        if self._hours[row, slot] != hour:
+            if self._hours[row, slot] > hour:
+                return  # más vieja que lo que cubre el buffer
+            self._evict(row, slot)
+            self._hours[row, slot] = hour
+            self._sums[row, slot] = 0.0
+            self._counts[row, slot] = 0
+            self._readings.pop((row, slot), None)
+        if key >= 0:
+            seen = self._readings.setdefault((row, slot), {})
+            old = seen.get(key)
+            if old is not None:
+                # misma medición re-enviada: gana la última
+                self._sums[row, slot, old[0]] -= old[1]
+                self._counts[row, slot, old[0]] -= 1
+            seen[key] = (param, value)
+        self._sums[row, slot, param] += value
+        self._counts[row, slot, param] += 1
+        if hour > self._last[row]:
+            self._last[row] = hour
+
+    def _evict(self, row: int, slot: int) -> None:
+        """Antes de reusar un slot, guarda su meteo si es la lectura más nueva que sale del buffer."""
+        old = self._hours[row, slot]
+        for j, p in enumerate(self._meteo):
+            n = self._counts[row, slot, p]
+            if old >= 0 and n > 0 and old > self._carry_hours[row, j]:
+                self._carry_hours[row, j] = old
+                self._carry_values[row, j] = self._sums[row, slot, p] / n
+
+    def ingest(self, df: pd.DataFrame) -> int:
+        """
+        Mediciones raw (formato del extract: parameter, unit, value, tiempo,
+        sensor_id[, location_id]): QC, unidades y hora como en preprocess.
+        Devuelve las lecturas aplicadas.
+        """
+        if df.empty:
+            return 0
+        df = pre._ensure_date_utc(pre._normalize_units(pre._basic_qc(df)))
+        keep = df["parameter"].isin(self._pidx) & df["date_utc"].notna() & df["value"].notna()
+        if self.panel:
+            if pre.PANEL_KEY not in df.columns:
+                raise KeyError(f"panel mode requires a '{pre.PANEL_KEY}' column")
+            keep &= df[pre.PANEL_KEY].notna()
+        df = df[keep]
+        if df.empty:
+            return 0
+
+        keys = measurement_keys_df(df)
+        keys = np.full(len(df), -1, dtype=np.int64) if keys is None else keys
+        hours = ((pd.to_datetime(df["date_utc"], utc=True) - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(hours=1))
+        hours = hours.to_numpy(dtype=np.int64)
+        params = df["parameter"].map(self._pidx).to_numpy(dtype=np.int64)
+        series = df[pre.PANEL_KEY].to_numpy(dtype=np.int64) if self.panel else np.zeros(len(df), dtype=np.int64)
+        values = df["value"].to_numpy(dtype=np.float64)
+        pm25 = self._pidx.get("pm25", -1)
+
+        with self._lock:
+            for sid, hour, param, value, key in zip(series.tolist(), hours.tolist(), params.tolist(),
+                                                    values.tolist(), keys.tolist()):
+                row = self._series_row(sid)
+                self._add(row, hour, param, value, key)
+                if param == pm25 and hour > self._pm25_seen[row]:
+                    self._pm25_seen[row] = hour
+        return len(df)
+
+    # ----------------------------
+    # Vector de features
+    # ----------------------------
+    def series_ids(self) -> list[int]:
+        with self._lock:
+            return sorted(self._row)
+
+    def _hourly_means(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (t por serie, promedio horario [serie, k horas atrás, parámetro] con NaN
+        si no hay lectura, hora con alguna lectura [serie, k]: fila de la tabla horaria).
+        """
+        t = self._last[rows]
+        back = t[:, None] - np.arange(N_SLOTS)[None, :]          # [S, k]
+        slot = back % N_SLOTS
+        valid = self._hours[rows[:, None], slot] == back
+        sums = self._sums[rows[:, None], slot]                  # [S, k, P]
+        counts = self._counts[rows[:, None], slot]
+        ok = valid[:, :, None] & (counts > 0)
+        means = np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=ok)
+        return t, means, ok.any(axis=2)
+
+    def _meteo_seed(self, rows: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """Última lectura meteo anterior a la ventana [serie, meteo]: la ya desalojada o un slot viejo."""
+        hours = self._hours[rows]                                 # [S, N]
+        counts = self._counts[rows][:, :, self._meteo]            # [S, N, M]
+        before = (hours >= 0) & (hours <= (t - N_SLOTS)[:, None])
+        cand = np.where(before[:, :, None] & (counts > 0), hours[:, :, None], -1)
+        best = cand.argmax(axis=1)[:, None, :]                    # [S, 1, M]
+        best_hours = np.take_along_axis(cand, best, axis=1)[:, 0]
+        sums = np.take_along_axis(self._sums[rows][:, :, self._meteo], best, axis=1)[:, 0]
+        n = np.take_along_axis(counts, best, axis=1)[:, 0]
+        values = np.divide(sums, n, out=np.full(sums.shape, np.nan), where=n > 0)
+        newer = best_hours > self._carry_hours[rows]
+        return np.where(newer, values, self._carry_values[rows])
+
+    def _fill_meteo(self, means: np.ndarray, rows_mask: np.ndarray, seed: np.ndarray) -> np.ndarray:
+        """
+        preprocess.meteo_fill por serie sobre [semilla, horas con fila de la
+        ventana] en orden cronológico (las horas sin fila no cuentan como
+        posición, igual que en la tabla horaria); las horas sin fila quedan NaN.
+        """
+        n_series, n_meteo = len(means), len(self._meteo)
+        chrono = means[:, ::-1]                                   # j = 0 la hora más vieja
+        exists = rows_mask[:, ::-1]
+        order = np.argsort(~exists, axis=1, kind="stable")        # filas primero, en orden
+        values = np.take_along_axis(chrono[:, :, self._meteo], order[:, :, None], axis=1)  # [S, N, M]
+        block = np.concatenate([seed[:, None, :], values], axis=1)                         # [S, N+1, M]
+        block = block.transpose(1, 0, 2).reshape(N_SLOTS + 1, n_series * n_meteo)
+        # sólo las columnas con algo que rellenar (algún hueco en una fila y algún dato)
+        n_rows = np.repeat(exists.sum(axis=1), n_meteo)
+        gaps = np.isnan(block[1:]) & (np.arange(N_SLOTS)[:, None] < n_rows[None, :])
+        todo = np.flatnonzero(gaps.any(axis=0) & ~np.isnan(block).all(axis=0))
+        if len(todo):
+            block[:, todo] = pre.meteo_fill(pd.DataFrame(block[:, todo])).to_numpy()
+        filled = block[1:].reshape(N_SLOTS, n_series, n_meteo).transpose(1, 0, 2)
+        out = np.empty_like(filled)
+        np.put_along_axis(out, order[:, :, None], filled, axis=1)
+        chrono[:, :, self._meteo] = np.where(exists[:, :, None], out, np.nan)
+        return chrono[:, ::-1]
+
+    def matrix(self, ids: list[int] | None = None) -> tuple[list[int], np.ndarray, np.ndarray]:
+        """
+        (ids, X float32 [n, features], hora de cada fila en horas epoch) de las
+        series pedidas (todas si None; las desconocidas se omiten).
+        """
+        with self._lock:
+            ids = sorted(self._row) if ids is None else [i for i in ids if i in self._row]
+            rows = np.fromiter((self._row[i] for i in ids), dtype=np.int64, count=len(ids))
+            t, means, has_row = self._hourly_means(rows)
+            seen = self._pm25_seen[rows]
+            seed = self._meteo_seed(rows, t) if self._meteo else None
+        if self._meteo and len(ids):
+            means = self._fill_meteo(means, has_row, seed)
+
+        X = np.empty((len(ids), len(self._plan)), dtype=np.float32)
+        for j, (kind, p, n) in enumerate(self._plan):
+            if kind == "lag":
+                X[:, j] = means[:, n, p]
+            elif kind == "roll":
+                window = means[:, :n, p]
+                count = (~np.isnan(window)).sum(axis=1)
+                total = np.nansum(window, axis=1)
+                X[:, j] = np.divide(total, count, out=np.full(len(ids), np.nan), where=count > 0)
+            elif kind == "hour":
+                X[:, j] = t % 24
+            elif kind == "dow":
+                X[:, j] = (t // 24 + _EPOCH_DOW) % 7
+            elif kind == "is_weekend":
+                X[:, j] = (t // 24 + _EPOCH_DOW) % 7 >= 5
+            elif kind == "age":
+                X[:, j] = np.where((seen >= 0) & (seen <= t), t - seen, np.nan)
+            else:
+                X[:, j] = np.nan
+        return ids, X, t
+
+
+def hour_to_datetime(hour: int) -> datetime:
+    return datetime.fromtimestamp(int(hour) * 3600, UTC)
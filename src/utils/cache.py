@@ -0,0 +1,105 @@
+# src/utils/cache.py
+"""
+Caché local read-through para objetos de GCS (opt-in: LOCAL_CACHE_DIR).
+
+Cada objeto se guarda entero en LOCAL_CACHE_DIR/<k[:2]>/<k>-<nombre>, con
+k = sha256(ruta + versión del objeto). La versión es la `generation` de GCS
+(o etag/md5 si no viene): un objeto sobrescrito cambia de clave, así que nunca
+se sirve una copia vieja. Validar cuesta un HEAD (fs.info), no la descarga.
+
+Tamaño acotado por LOCAL_CACHE_MAX_MB con desalojo LRU (mtime = último uso).
+Las entradas usadas en los últimos _MIN_AGE_S no se desalojan: otro thread
+o proceso puede estar por abrirlas.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import fsspec
+
+LOCAL_CACHE_DIR = os.getenv("LOCAL_CACHE_DIR", "").strip()
+LOCAL_CACHE_MAX_MB = float(os.getenv("LOCAL_CACHE_MAX_MB", "2048"))
+
+_MIN_AGE_S = 60
+_EVICT_LOCK = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return bool(LOCAL_CACHE_DIR)
+
+
+def _object_version(info: dict) -> str:
+    for k in ("generation", "etag", "ETag", "md5Hash"):
+        if info.get(k):
+            return str(info[k])
+    # sin versión explícita: tamaño + última modificación
+    return f"{info.get('size')}-{info.get('updated') or info.get('mtime')}"
+
+
+def _entry_path(path: str, version: str) -> Path:
+    key = hashlib.sha256(f"{path}#{version}".encode()).hexdigest()
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+    return Path(LOCAL_CACHE_DIR) / key[:2] / f"{key}-{name}"
+
+
+def _entries() -> list[tuple[float, int, Path]]:
+    out = []
+    for p in Path(LOCAL_CACHE_DIR).glob("*/*"):
+        if ".tmp-" in p.name:
+            continue
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        out.append((st.st_mtime, st.st_size, p))
+    return out
+
+
+def evict(max_bytes: float | None = None) -> int:
+    """Desaloja las entradas menos usadas hasta quedar bajo el límite. Devuelve bytes liberados."""
+    max_bytes = LOCAL_CACHE_MAX_MB * 1024**2 if max_bytes is None else max_bytes
+    with _EVICT_LOCK:
+        entries = sorted(_entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        now = time.time()
+        for mtime, size, p in entries:
+            if total - freed <= max_bytes:
+                break
+            if now - mtime < _MIN_AGE_S:
+                continue
+            try:
+                p.unlink()
+                freed += size
+            except FileNotFoundError:
+                pass
+    return freed
+
+
+def cached_path(path: str, fs=None) -> str:
+    """
+    Ruta local de una copia validada de `path` (gs://...). Sin caché habilitada,
+    o si la ruta ya es local, devuelve `path` tal cual. Propaga FileNotFoundError
+    si el objeto no existe.
+    """
+    if not cache_enabled() or not str(path).startswith("gs://"):
+        return path
+    fs = fs or fsspec.filesystem("gcs")
+    local = _entry_path(path, _object_version(fs.info(path)))
+    if local.exists():
+        os.utime(local)  # LRU: marca uso
+        return str(local)
+
+    local.parent.mkdir(parents=True, exist_ok=True)
+    tmp = local.with_name(f"{local.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        fs.get_file(path, str(tmp))
+        os.replace(tmp, local)  # atómico: nadie ve una copia a medias
+    finally:
+        tmp.unlink(missing_ok=True)
+    evict()
+    return str(local)
@@ -1,6 +1,18 @@
 from __future__ import annotations
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
+import json
 import os
+import fsspec
+
+def _split_params(v) -> list[str]:
+    if not v:
+        v = os.getenv(
+            "PARAMETERS",
+            "pm25,pm10,pm1,no2,o3,so2,co,relativehumidity,temperature,um003",
+        )
+    if isinstance(v, str):
+        return [p.strip() for p in v.split(",") if p.strip()]
+    return v
 
 class Settings(BaseModel):
     # OpenAQ
@@ -21,13 +33,54 @@ class Settings(BaseModel):
     @field_validator("parameters", mode="before")
     @classmethod
     def _parse_params(cls, v):
-        if not v:
-            v = os.getenv(
-                "PARAMETERS",
-                "pm25,pm10,pm1,no2,o3,so2,co,relativehumidity,temperature,um003",
-            )
-        if isinstance(v, str):
-            return [p.strip() for p in v.split(",") if p.strip()]
-        return v
+        return _split_params(v)
 
 SETTINGS = Settings()
+
+
+class CityConfig(BaseModel):
+    """Una ciudad a extraer. Varias de estas se leen desde un archivo (ver load_city_configs)."""
+    city: str
+    coordinates: str  # "lat,lon"
+    radius_m: int = 25000
+    parameters: list[str] = Field(default_factory=list, validate_default=True)
+    allowed_locations: list[int] | None = None  # None → todas las del catálogo
+    allowed_sensors: list[int] | None = None
+    state_blob: str | None = None  # None → state/<city>/openaq_extract_state.json
+
+    @field_validator("parameters", mode="before")
+    @classmethod
+    def _parse_params(cls, v):
+        # vacío → PARAMETERS del entorno (mismo default que Settings)
+        return _split_params(v)
+
+    @field_validator("coordinates", mode="before")
+    @classmethod
+    def _parse_coords(cls, v):
+        if isinstance(v, (list, tuple)):
+            return f"{float(v[0])},{float(v[1])}"
+        return v
+
+    def coordinates_tuple(self) -> tuple[float, float]:
+        lat_s, lon_s = self.coordinates.split(",")
+        return float(lat_s), float(lon_s)
+
+    def state_key(self) -> str:
+        return self.state_blob or f"state/{self.city}/openaq_extract_state.json"
+
+
+def load_city_configs(path: str) -> list[CityConfig]:
+    """
+    Lee una lista de ciudades desde JSON o YAML (local o gs://). Acepta una
+    lista en la raíz o {"cities": [...]}.
+    """
+    with fsspec.open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if str(path).endswith((".yaml", ".yml")):
+        import yaml
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("cities", [])
+    return [CityConfig(**c) for c in data]
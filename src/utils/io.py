@@ -1,9 +1,19 @@
 # src/utils/io_generic.py
 from __future__ import annotations
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterable
 import json
+import os
+import uuid
 import fsspec
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils.cache import cached_path
+
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
 
 
 def is_gcs_path(path: str) -> bool:
@@ -28,8 +38,8 @@ def build_path(rel_key: str, gcs_bucket: str | None = None) -> str:
 # JSON
 # -----------------------
 def read_json(path: str) -> dict:
-    """Lee JSON desde gs:// o local."""
-    with fsspec.open(path, "r") as f:
+    """Lee JSON desde gs:// o local (gs:// pasa por la caché local si LOCAL_CACHE_DIR)."""
+    with fsspec.open(cached_path(path), "r") as f:
         return json.load(f)
 
 
@@ -41,19 +51,160 @@ def write_json(obj: dict, path: str) -> str:
     else:
         p = Path(path)
         p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+        # temporal + rename: un lector concurrente (manifests) nunca ve JSON a medias
+        tmp = p.with_name(f"_tmp_{uuid.uuid4().hex}_{p.name}")
+        try:
+            tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, p)
+        finally:
+            tmp.unlink(missing_ok=True)
     return path
 
 
 # -----------------------
 # Parquet
 # -----------------------
+def read_parquet(path: str, **kwargs) -> pd.DataFrame:
+    """Lee Parquet desde gs:// o local (gs:// pasa por la caché local si LOCAL_CACHE_DIR)."""
+    return pd.read_parquet(cached_path(path), **kwargs)
+
+
+@dataclass
+class ParquetWriteResult:
+    path: str
+    rows: int
+    bytes: int
+
+
+class AtomicParquetWriter:
+    """
+    pq.ParquetWriter sobre un temporal junto al destino (_tmp_<id>_<nombre>,
+    fuera de los globs measurements_*.parquet); commit() lo mueve al nombre
+    final: rename en local, copia server-side (rewrite) en GCS. Un job que
+    muere a mitad deja sólo el temporal, nunca un objeto final a medias.
+
+    Con row_group_size, los batches se acumulan hasta ese tamaño antes de
+    escribirse (batches chicos no generan row groups chicos).
+    Uso: `with AtomicParquetWriter(path, schema) as w: w.write(batch)`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: pa.Schema | None = None,
+        compression: str | None = PARQUET_COMPRESSION,
+        compression_level: int | None = None,
+        row_group_size: int | None = None,
+        sorting_columns=None,
+        use_dictionary=True,
+        **writer_kwargs,
+    ):
+        self.path = str(path)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._options = dict(
+            compression=compression,
+            compression_level=compression_level,
+            sorting_columns=sorting_columns,
+            use_dictionary=use_dictionary,
+            **writer_kwargs,
+        )
+        self._fs, fs_path = fsspec.core.url_to_fs(self.path)
+        parent, name = fs_path.rsplit("/", 1) if "/" in fs_path else ("", fs_path)
+        tmp_name = f"_tmp_{uuid.uuid4().hex[:12]}_{name}"
+        self._tmp = f"{parent}/{tmp_name}" if parent else tmp_name
+        self._final = fs_path
+        self._file = None
+        self._writer = None
+        self._pending: list[pa.Table] = []
+        self._pending_rows = 0
+
+    def _open(self):
+        if not is_gcs_path(self.path):
+            Path(self._final).parent.mkdir(parents=True, exist_ok=True)
+        self._file = self._fs.open(self._tmp, "wb")
+        self._writer = pq.ParquetWriter(self._file, self.schema, **self._options)
+
+    def _flush(self):
+        if self._writer is None:
+            self._open()
+        if self._pending:
+            table = pa.concat_tables(self._pending) if len(self._pending) > 1 else self._pending[0]
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, data: pd.DataFrame | pa.Table | pa.RecordBatch) -> None:
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, schema=self.schema, preserve_index=False)
+        elif isinstance(data, pa.RecordBatch):
+            data = pa.Table.from_batches([data])
+        if self.schema is None:
+            self.schema = data.schema
+        elif data.schema != self.schema:
+            data = data.cast(self.schema)
+        self.rows += data.num_rows
+        self._pending.append(data)
+        self._pending_rows += data.num_rows
+        if not self.row_group_size or self._pending_rows >= self.row_group_size:
+            self._flush()
+
+    def commit(self) -> ParquetWriteResult:
+        if self.schema is None:
+            raise ValueError(f"nada que escribir en {self.path} y sin schema")
+        self._flush()
+        self._writer.close()
+        size = self._file.tell()
+        self._file.close()
+        if is_gcs_path(self.path):
+            self._fs.mv(self._tmp, self._final)
+        else:
+            os.replace(self._tmp, self._final)
+        return ParquetWriteResult(path=self.path, rows=self.rows, bytes=size)
+
+    def abort(self) -> None:
+        try:
+            if self._writer is not None:
+                self._writer.close()
+            if self._file is not None:
+                self._file.close()
+            if self._fs.exists(self._tmp):
+                self._fs.rm(self._tmp)
+        except Exception as e:
+            print(f"[io] warning: no se pudo limpiar {self._tmp}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.result = self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def write_parquet_atomic(
+    data: pd.DataFrame | pa.Table | Iterable[pa.RecordBatch],
+    path: str,
+    schema: pa.Schema | None = None,
+    **options,
+) -> ParquetWriteResult:
+    """
+    Escribe un DataFrame, un pa.Table o un iterador de RecordBatch en streaming
+    (memoria acotada a un row group) y hace commit atómico. `options` van a
+    AtomicParquetWriter (compression, compression_level, row_group_size,
+    sorting_columns, use_dictionary, ...). Devuelve ruta, filas y bytes.
+    """
+    with AtomicParquetWriter(path, schema=schema, **options) as w:
+        if isinstance(data, (pd.DataFrame, pa.Table, pa.RecordBatch)):
+            w.write(data)
+        else:
+            for batch in data:
+                w.write(batch)
+    return w.result
+
+
 def write_parquet(df: pd.DataFrame, path: str) -> str:
-    """Escribe Parquet en gs:// (vía gcsfs) o local."""
-    if is_gcs_path(path):
-        df.to_parquet(path, index=False)
-    else:
-        p = Path(path)
-        p.parent.mkdir(parents=True, exist_ok=True)
-        df.to_parquet(p, index=False)
-    return path
+    """Escribe Parquet en gs:// (vía gcsfs) o local, con commit atómico."""
+    return write_parquet_atomic(df, path).path
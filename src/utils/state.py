@@ -1,5 +1,5 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 import json
 import fsspec
@@ -7,14 +7,57 @@ from src.utils.config import SETTINGS
 
 UTC = timezone.utc
 
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(UTC).isoformat().replace("+00:00", "Z")
+
+def _parse(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(UTC)
+
 @dataclass
 class ExtractState:
+    """
+    Checkpoint del extract. `sensors` guarda, por sensor_id, el último
+    datetime_to ingerido con éxito; `last_success_utc` es el default para
+    sensores sin checkpoint propio (nuevos en el catálogo).
+    """
     last_success_utc: datetime | None
+    sensors: dict[int, datetime] = field(default_factory=dict)
 
     @staticmethod
     def default(hours_back: int = 24) -> "ExtractState":
         return ExtractState(last_success_utc=datetime.now(UTC) - timedelta(hours=hours_back))
 
+    def sensor_since(self, sensor_id: int) -> datetime | None:
+        return self.sensors.get(sensor_id, self.last_success_utc)
+
+    def advance(self, sensor_status: dict[int, str], end_utc: datetime) -> None:
+        """
+        Avanza a `end_utc` sólo los sensores "ok". Los fallidos conservan su
+        checkpoint; si no tenían uno, se fija el default actual para que el
+        próximo run no se salte su rango pendiente.
+        """
+        for sensor_id, status in sensor_status.items():
+            if status == "ok":
+                self.sensors[sensor_id] = end_utc
+            elif sensor_id not in self.sensors and self.last_success_utc is not None:
+                self.sensors[sensor_id] = self.last_success_utc
+        if any(status == "ok" for status in sensor_status.values()) or not sensor_status:
+            self.last_success_utc = end_utc
+
+    def to_payload(self) -> dict:
+        return {
+            "last_success_utc": _iso(self.last_success_utc) if self.last_success_utc else None,
+            "sensors": {str(k): _iso(v) for k, v in sorted(self.sensors.items())},
+        }
+
+    @staticmethod
+    def from_payload(data: dict) -> "ExtractState":
+        ts = data.get("last_success_utc")
+        return ExtractState(
+            last_success_utc=_parse(ts) if ts else None,
+            sensors={int(k): _parse(v) for k, v in (data.get("sensors") or {}).items()},
+        )
+
 def _state_path() -> str:
     return f"gs://{SETTINGS.gcs_bucket}/{SETTINGS.state_blob}"
 
@@ -22,22 +65,26 @@ def load_state() -> ExtractState:
     try:
         with fsspec.open(_state_path(), "r") as f:
             data = json.load(f)
-        ts = data.get("last_success_utc")
-        if ts:
-            return ExtractState(last_success_utc=datetime.fromisoformat(ts.replace("Z", "+00:00")))
+        if data.get("last_success_utc"):
+            return ExtractState.from_payload(data)
     except FileNotFoundError:
         pass
     return ExtractState.default()
 
 def save_state(state: ExtractState) -> None:
-    payload = {
-        "last_success_utc": state.last_success_utc.astimezone(UTC).isoformat().replace("+00:00", "Z")
-    }
     with fsspec.open(_state_path(), "w") as f:
-        json.dump(payload, f)
+        json.dump(state.to_payload(), f)
 
 def compute_window(now: datetime, cadence_hours: int, safety_overlap_min: int, state: ExtractState) -> tuple[str, str]:
     start_ts = (state.last_success_utc or now) - timedelta(minutes=safety_overlap_min)
     end_ts = now
     to_iso = lambda dt: dt.astimezone(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
     return to_iso(start_ts), to_iso(end_ts)
+
+def compute_sensor_windows(now: datetime, safety_overlap_min: int, state: ExtractState, sensor_ids) -> dict[int, tuple[str, str]]:
+    """Ventana propia por sensor: [checkpoint del sensor - overlap, now]."""
+    to_iso = lambda dt: dt.astimezone(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        sid: (to_iso((state.sensor_since(sid) or now) - timedelta(minutes=safety_overlap_min)), to_iso(now))
+        for sid in sensor_ids
+    }
@@ -1,6 +1,7 @@
 import os
 from unittest.mock import patch
 import pandas as pd
+from src.api.catalog import SensorCatalog
 from src.data.extract import DataExtractionFlow
 
 @patch.dict(os.environ, {
@@ -13,12 +14,16 @@ from src.data.extract import DataExtractionFlow
     "BOOTSTRAP_HOURS": "1",
     "SAFETY_OVERLAP_MIN": "1",
 }, clear=False)
-@patch("src.api.locations.FindSensors.fn", return_value=[{"id": 1, "name": "L1", "sensors": []}])
+@patch("src.data.extract.GCS_BUCKET", "")  # .env se carga al importar; forzamos modo local
+@patch("src.data.extract._sensor_catalog",
+       return_value=SensorCatalog([{"id": 1, "name": "L1", "sensors": []}], None, (-33.4, -70.6), 5000))
 @patch("src.api.measurements.FetchSensorData.fn")
-def test_flow_runs_and_writes_local(mock_fetch, _find):
+def test_flow_runs_and_writes_local(mock_fetch, _catalog, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     # simula un dataframe pequeño
     mock_fetch.return_value = pd.DataFrame(
         {"timestamp": ["2025-08-01T00:00:00Z"], "parameter": ["pm25"], "value": [12]}
     )
     # no debe lanzar excepción
     DataExtractionFlow()
+    assert list((tmp_path / "data/raw").rglob("measurements_*.parquet"))
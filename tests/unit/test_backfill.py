@@ -0,0 +1,44 @@
+from unittest.mock import patch
+import pandas as pd
+import requests
+import src.data.extract as extract
+from src.data import raw_manifest
+from src.api.catalog import SensorCatalog
+
+SENSORS = [{"id": 1, "name": "L1", "sensors": [{"id": 11, "parameter": {"name": "pm25"}}]}]
+
+def _frame(start, end):
+    ts = pd.date_range(start, end, freq="12h", inclusive="left", tz="UTC")
+    return pd.DataFrame({
+        "sensor_id": 11, "parameter": "pm25", "value": 1.0,
+        "datetime_from_utc": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+
+def test_backfill_writes_daily_partitions_and_reports_failed_chunks(tmp_path):
+    def _fake_fetch(job, headers, start, end, limit, raise_errors=False):
+        if start.startswith("2025-01-03"):
+            raise requests.exceptions.HTTPError("503")
+        return _frame(start, end)
+
+    with patch.object(extract, "GCS_BUCKET", ""), \
+         patch.object(extract, "LOCAL_RAW_DIR", tmp_path), \
+         patch.object(extract, "ALLOWED_LOCATIONS", None), \
+         patch.object(extract, "ALLOWED_SENSORS", None), \
+         patch.object(extract, "_sensor_catalog", return_value=SensorCatalog(SENSORS, None, (0, 0), 1)), \
+         patch.object(extract, "_fetch_sensor_frame", side_effect=_fake_fetch):
+        summary = extract.BackfillFlow.fn("2025-01-01T00:00:00Z", "2025-01-05T00:00:00Z", chunk_days=2)
+
+    assert summary["chunks"] == 2
+    assert summary["failed"] == [
+        {"sensor_id": 11, "datetime_from": "2025-01-03T00:00:00Z", "datetime_to": "2025-01-05T00:00:00Z"}
+    ]
+    files = sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*.parquet"))
+    assert files == [
+        f"openaq/{extract.CITY}/dt=2025-01-01/measurements_backfill_11_20250101.parquet",
+        f"openaq/{extract.CITY}/dt=2025-01-02/measurements_backfill_11_20250101.parquet",
+    ]
+    assert len(pd.read_parquet(tmp_path / files[0])) == 2
+    manifest = raw_manifest.read_manifest(str(tmp_path / f"openaq/{extract.CITY}/dt=2025-01-01"))
+    assert [(e["file"], e["rows"], e["source"]) for e in manifest["files"]] == [
+        ("measurements_backfill_11_20250101.parquet", 2, "backfill")
+    ]
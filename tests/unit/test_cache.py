@@ -0,0 +1,59 @@
+import os
+from unittest.mock import patch
+import fsspec
+import pandas as pd
+from src.utils import cache, io
+
+class _FakeGCS:
+    """Memory filesystem con 'generation' por objeto y conteo de descargas."""
+    def __init__(self):
+        self.mem = fsspec.filesystem("memory", skip_instance_cache=True)
+        self.generation, self.downloads = {}, 0
+
+    def put(self, path, data: bytes):
+        with self.mem.open(path.replace("gs://", "memory://"), "wb") as f:
+            f.write(data)
+        self.generation[path] = self.generation.get(path, 0) + 1
+
+    def info(self, path):
+        if path not in self.generation:
+            raise FileNotFoundError(path)
+        return {"name": path, "generation": str(self.generation[path])}
+
+    def get_file(self, path, local):
+        self.downloads += 1
+        self.mem.get_file(path.replace("gs://", "memory://"), local)
+
+def test_read_through_hits_disk_and_revalidates_by_generation(tmp_path):
+    gcs = _FakeGCS()
+    gcs.put("gs://b/state.json", b'{"v": 1}')
+    with patch.object(cache, "LOCAL_CACHE_DIR", str(tmp_path)), \
+         patch.object(cache.fsspec, "filesystem", return_value=gcs):
+        assert io.read_json("gs://b/state.json") == {"v": 1}
+        assert io.read_json("gs://b/state.json") == {"v": 1}
+        assert gcs.downloads == 1
+        gcs.put("gs://b/state.json", b'{"v": 2}')  # sobrescrito → nueva generation
+        assert io.read_json("gs://b/state.json") == {"v": 2}
+        assert gcs.downloads == 2
+
+def test_disabled_cache_and_local_paths_pass_through(tmp_path):
+    assert cache.cached_path("gs://b/x.parquet") == "gs://b/x.parquet"  # LOCAL_CACHE_DIR vacío
+    pd.DataFrame({"a": [1]}).to_parquet(tmp_path / "x.parquet")
+    with patch.object(cache, "LOCAL_CACHE_DIR", str(tmp_path / "cache")):
+        assert cache.cached_path(str(tmp_path / "x.parquet")) == str(tmp_path / "x.parquet")
+        assert io.read_parquet(str(tmp_path / "x.parquet"))["a"].tolist() == [1]
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    gcs = _FakeGCS()
+    for name in "abc":
+        gcs.put(f"gs://b/{name}", b"x" * 1000)
+    with patch.object(cache, "LOCAL_CACHE_DIR", str(tmp_path)), patch.object(cache, "_MIN_AGE_S", 0), \
+         patch.object(cache, "LOCAL_CACHE_MAX_MB", 2500 / 1024**2):
+        a = cache.cached_path("gs://b/a", gcs)
+        b = cache.cached_path("gs://b/b", gcs)
+        os.utime(b, (0, 0))  # b es el menos usado
+        os.utime(a, None)
+        c = cache.cached_path("gs://b/c", gcs)
+
+    remaining = {p.name.split("-", 1)[1] for p in tmp_path.glob("*/*")}
+    assert remaining == {"a", "c"} and os.path.exists(a) and os.path.exists(c)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import pytest
+import src.api.catalog as catalog_mod
+from src.api.catalog import load_sensor_catalog
+
+NOW = datetime(2025, 8, 1, tzinfo=timezone.utc)
+LOCATIONS = [
+    {"id": 1, "name": "L1", "sensors": [{"id": 11, "parameter": {"name": "pm25"}}, {"id": 12, "parameter": {"name": "no2"}}]},
+    {"id": 2, "name": "L2", "sensors": [{"id": 21, "parameter": {"name": "pm25"}}]},
+]
+
+def _fresh(sensors=LOCATIONS, etag='"v1"'):
+    return {"sensors": sensors, "etag": etag, "last_modified": None, "not_modified": False}
+
+@pytest.fixture(autouse=True)
+def _clear_memo():
+    catalog_mod._MEMO.clear()
+    yield
+    catalog_mod._MEMO.clear()
+
+def test_catalog_builds_indexes_and_persists(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    with patch.object(catalog_mod, "fetch_locations", return_value=_fresh()) as fetch:
+        cat = load_sensor_catalog(path, (-33.4, -70.6), 25000, now=NOW)
+    assert fetch.call_count == 1
+    assert cat.by_parameter["pm25"] == [11, 21]
+    assert cat.by_sensor[12]["location_id"] == 1
+    assert cat.by_location[2]["name"] == "L2"
+    assert (tmp_path / "catalog.json").exists()
+
+def test_catalog_within_ttl_makes_no_calls(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    with patch.object(catalog_mod, "fetch_locations", return_value=_fresh()):
+        load_sensor_catalog(path, (-33.4, -70.6), 25000, now=NOW)
+    catalog_mod._MEMO.clear()  # fuerza lectura desde disco
+    with patch.object(catalog_mod, "fetch_locations") as fetch:
+        cat = load_sensor_catalog(path, (-33.4, -70.6), 25000, now=NOW + timedelta(hours=1))
+    fetch.assert_not_called()
+    assert len(cat.by_sensor) == 3
+
+def test_catalog_revalidates_with_etag_after_ttl(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    with patch.object(catalog_mod, "fetch_locations", return_value=_fresh()):
+        load_sensor_catalog(path, (-33.4, -70.6), 25000, ttl_hours=1, now=NOW)
+    later = NOW + timedelta(hours=2)
+    not_modified = {"sensors": [], "etag": None, "last_modified": None, "not_modified": True}
+    with patch.object(catalog_mod, "fetch_locations", return_value=not_modified) as fetch:
+        cat = load_sensor_catalog(path, (-33.4, -70.6), 25000, ttl_hours=1, now=later)
+    assert fetch.call_args.kwargs["etag"] == '"v1"'
+    assert cat.fetched_at == later
+    assert len(cat.by_sensor) == 3
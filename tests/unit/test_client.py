@@ -0,0 +1,53 @@
+from unittest.mock import patch, Mock
+import pytest
+import requests
+from src.api.client import OpenAQClient
+from src.api.ratelimit import TokenBucket
+
+def _resp(status, headers=None, payload=None):
+    m = Mock()
+    m.status_code = status
+    m.headers = headers or {}
+    m.json.return_value = payload or {}
+    if status >= 400:
+        m.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status}")
+    else:
+        m.raise_for_status.return_value = None
+    return m
+
+def _client(**kw):
+    return OpenAQClient(api_key="fake", limiter=TokenBucket(rate=1000, capacity=1000), **kw)
+
+@patch("src.api.client.time.sleep")
+@patch("requests.Session.get")
+def test_retries_429_honouring_retry_after(mock_get, mock_sleep):
+    mock_get.side_effect = [_resp(429, {"Retry-After": "3"}), _resp(200, payload={"results": [1]})]
+    resp = _client().get("sensors/1/measurements")
+    assert resp.json() == {"results": [1]}
+    assert mock_get.call_count == 2
+    mock_sleep.assert_called_once_with(3.0)
+
+@patch("src.api.client.time.sleep")
+@patch("requests.Session.get")
+def test_hard_errors_are_not_retried(mock_get, mock_sleep):
+    mock_get.return_value = _resp(404)
+    with pytest.raises(requests.exceptions.HTTPError):
+        _client().get("sensors/1/measurements")
+    assert mock_get.call_count == 1
+    mock_sleep.assert_not_called()
+
+@patch("src.api.client.time.sleep")
+@patch("requests.Session.get")
+def test_waits_for_reset_only_when_quota_exhausted(mock_get, mock_sleep):
+    mock_get.side_effect = [
+        _resp(200, {"x-ratelimit-remaining": "5", "x-ratelimit-reset": "30"}),
+        _resp(200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "30"}),
+        _resp(200),
+    ]
+    client = _client()
+    client.get("locations")
+    client.get("locations")
+    mock_sleep.assert_not_called()
+    client.get("locations")
+    assert mock_sleep.call_count == 1
+    assert 0 < mock_sleep.call_args[0][0] <= 30
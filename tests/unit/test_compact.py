@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import pandas as pd
+import pyarrow.parquet as pq
+import src.data.preprocess as pre
+from src.data import compact, raw_manifest
+
+NOW = datetime(2025, 1, 2, 3, 0, tzinfo=timezone.utc)
+
+def _write_run(root, name, sensor_id, hours, value):
+    df = pd.DataFrame({
+        "sensor_id": sensor_id, "location_id": 1, "parameter": "pm25", "unit": "µg/m³", "value": value,
+        "datetime_from_utc": pd.date_range("2025-01-01T00:00:00Z", periods=hours, freq="h"),
+    })
+    path = root / f"openaq/{pre.CITY}/dt=2025-01-01"
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / name, index=False)
+    return path
+
+def _processed(root):
+    return pd.read_parquet(root / f"openaq/{pre.CITY}/processed/dt=2025-01-01/preprocessed.parquet")
+
+def test_compaction_dedups_sorts_and_swaps_without_changing_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    day = _write_run(tmp_path, "measurements_20250101T060000.parquet", 12, 6, 20.0)
+    _write_run(tmp_path, "measurements_20250101T030000.parquet", 11, 3, 10.0)
+    _write_run(tmp_path, "measurements_20250101T090000.parquet", 11, 6, 30.0)  # solapa y revisa 00-02
+
+    with patch.object(pre, "GCS_BUCKET", ""):
+        pre.run_preprocess("2025-01-01")
+        before = _processed(tmp_path)
+        summary = compact.compact_day("2025-01-01", now=NOW)
+        live = pre._list_measurement_files("2025-01-01")  # del manifest
+        assert [p.rsplit("/", 1)[-1] for p in live] == [summary["compacted"]]
+        pre.run_preprocess("2025-01-01")
+        pd.testing.assert_frame_equal(_processed(tmp_path), before)
+
+    assert summary["files"] == 3 and summary["rows"] == 12
+    f = pq.ParquetFile(day / summary["compacted"])
+    assert f.metadata.row_group(0).column(0).compression == "ZSTD"
+    assert f.metadata.row_group(0).column(0).statistics.has_min_max
+    t = f.read().to_pandas()
+    assert t["sensor_id"].tolist() == [11] * 6 + [12] * 6
+    assert t["value"].tolist() == [30.0] * 6 + [20.0] * 6
+    pd.testing.assert_frame_equal(t, t.sort_values(["sensor_id", "datetime_from_utc"]))
+    assert len(list(day.glob("measurements_*.parquet"))) == 4  # reemplazados siguen hasta el grace
+
+def test_superseded_files_are_deleted_after_grace_and_newer_runs_win(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    day = _write_run(tmp_path, "measurements_20250101T030000.parquet", 11, 3, 10.0)
+    _write_run(tmp_path, "measurements_20250101T060000.parquet", 11, 3, 20.0)
+
+    with patch.object(pre, "GCS_BUCKET", ""):
+        first = compact.compact_day("2025-01-01", now=NOW)
+        assert compact.compact_day("2025-01-01", now=NOW)["compacted"] is None  # ya compactado
+        # un run posterior revisa la hora 00: le gana al compactado
+        _write_run(tmp_path, "measurements_20250102T040000.parquet", 11, 1, 50.0)
+        second = compact.compact_day("2025-01-01", now=NOW + timedelta(minutes=compact.COMPACT_GRACE_MIN + 1))
+
+    assert second["purged"] == 2 and not (day / "measurements_20250101T030000.parquet").exists()
+    assert (day / first["compacted"]).exists()  # reemplazado recién ahora: espera otro grace
+    log = json.loads((day / raw_manifest.MANIFEST).read_text())
+    assert log["compacted"] == second["compacted"]
+    assert [e["file"] for e in log["files"]] == [second["compacted"]]
+    assert log["files"][0]["rows"] == 3 and log["files"][0]["min_ts"] == "2025-01-01T00:00:00Z"
+    assert {e["file"] for e in log["superseded"]} == {first["compacted"], "measurements_20250102T040000.parquet"}
+    values = pd.read_parquet(day / second["compacted"])["value"].tolist()
+    assert values == [50.0, 20.0, 20.0]
+
+def test_compaction_purges_stale_tmp_files(tmp_path, monkeypatch):
+    import os
+    monkeypatch.chdir(tmp_path)
+    day = _write_run(tmp_path, "measurements_20250101T030000.parquet", 11, 3, 10.0)
+    stale, fresh = day / "_tmp_aaaa_measurements_x.parquet", day / "_tmp_bbbb_measurements_y.parquet"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = (NOW - timedelta(minutes=compact.COMPACT_GRACE_MIN + 1)).timestamp()
+    os.utime(stale, (old, old))
+    os.utime(fresh, (NOW.timestamp(), NOW.timestamp()))
+
+    with patch.object(pre, "GCS_BUCKET", ""):
+        summary = compact.compact_day("2025-01-01", now=NOW)
+
+    assert summary["tmp_purged"] == 1
+    assert not stale.exists() and fresh.exists()
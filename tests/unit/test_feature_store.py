@@ -0,0 +1,76 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pandas as pd
+import src.data.preprocess as pre
+from src.data import feature_store as fstore
+
+def _write_day(day, value):
+    df = pd.DataFrame({
+        "timestamp_utc": pd.date_range(f"{day}T00:00:00Z", periods=24, freq="h"),
+        "pm25": value, "no2": 1.0, "target_polluted_next_hour": 0,
+    })
+    pre._save_features(df, day)
+    return df
+
+def test_rollup_manifest_and_pruned_parallel_reads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    root = tmp_path / f"openaq/{pre.CITY}/features"
+    with patch.object(pre, "GCS_BUCKET", ""):
+        for day, v in [("2025-01-30", 1.0), ("2025-01-31", 2.0), ("2025-02-01", 3.0), (today, 4.0)]:
+            _write_day(day, v)
+        manifest = fstore.rollup_features()
+
+        levels = {(p["level"], p["key"]): p for p in manifest["partitions"]}
+        assert set(levels) == {("month", "2025-01"), ("month", "2025-02"), ("day", today)}
+        jan = levels["month", "2025-01"]
+        assert jan["rows"] == 48 and jan["min_ts"] == "2025-01-30T00:00:00Z" and jan["max_ts"] == "2025-01-31T23:00:00Z"
+
+        df = fstore.load_features(start="2025-01-31", end="2025-02-01", columns=["pm25"])
+        assert list(df.columns) == ["timestamp_utc", "pm25"]
+        assert df["pm25"].tolist() == [2.0] * 24 + [3.0] * 24 and df["timestamp_utc"].is_monotonic_increasing
+
+        # día nuevo sin rollup: se lee del diario
+        _write_day("2025-02-02", 5.0)
+        assert fstore.load_features(start="2025-02-02", end="2025-02-02")["pm25"].tolist() == [5.0] * 24
+
+        # día reescrito → se rehace sólo ese mes; el rollup viejo se borra en la corrida siguiente
+        _write_day("2025-01-31", 9.0)
+        second = fstore.rollup_features()
+        new_jan = next(p for p in second["partitions"] if p["key"] == "2025-01")
+        feb = levels["month", "2025-02"]["path"]
+        assert second["superseded"] == [jan["path"], feb] and (root / jan["path"]).exists()  # feb: día nuevo
+        assert fstore.load_features(start="2025-01-31", end="2025-01-31")["pm25"].tolist() == [9.0] * 24
+        third = fstore.rollup_features()
+        assert not (root / jan["path"]).exists() and (root / new_jan["path"]).exists()
+        assert third["superseded"] == []
+
+    assert json.loads((root / fstore.MANIFEST).read_text())["partitions"] == third["partitions"]
+
+def _write_raw(root, day, start, hours, value):
+    df = pd.DataFrame({
+        "sensor_id": 11, "location_id": 1, "parameter": "pm25", "unit": "µg/m³", "value": value,
+        "datetime_from_utc": pd.date_range(start, periods=hours, freq="h"),
+    })
+    path = root / f"openaq/{pre.CITY}/dt={day}"
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / "measurements_a.parquet", index=False)
+
+def test_overlapping_daily_partitions_keep_one_row_per_hour(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # el run del 02 trae también 21-23h del 01 (ventana que cruza la medianoche)
+    _write_raw(tmp_path, "2025-01-31", "2025-01-31T00:00:00Z", 24, 10.0)
+    _write_raw(tmp_path, "2025-02-01", "2025-01-31T21:00:00Z", 27, 30.0)
+    with patch.object(pre, "GCS_BUCKET", ""):
+        pre.run_preprocess("2025-01-31")
+        pre.run_preprocess("2025-02-01")
+        daily = fstore.load_features(start="2025-01-31", end="2025-02-01")
+        fstore.rollup_features(now=datetime(2025, 3, 1, tzinfo=timezone.utc))
+        rolled = fstore.load_features(start="2025-01-31", end="2025-02-01")
+
+    for df in (daily, rolled):
+        assert len(df) == 48 and df["timestamp_utc"].is_unique
+        jan = df[df["timestamp_utc"] < pd.Timestamp("2025-02-01", tz="UTC")]
+        assert jan["pm25"].tolist() == [10.0] * 24  # la fila del dt propio
+    pd.testing.assert_frame_equal(daily, rolled)
@@ -0,0 +1,33 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src.utils.io import AtomicParquetWriter, write_parquet, write_parquet_atomic
+
+def test_streamed_batches_are_buffered_into_row_groups(tmp_path):
+    schema = pa.schema([("a", pa.int64())])
+    batches = (pa.record_batch([pa.array(range(i * 10, i * 10 + 10))], schema=schema) for i in range(10))
+    out = write_parquet_atomic(batches, str(tmp_path / "x.parquet"), schema=schema, row_group_size=40)
+
+    assert out.rows == 100 and out.bytes == (tmp_path / "x.parquet").stat().st_size
+    meta = pq.ParquetFile(tmp_path / "x.parquet").metadata
+    assert [meta.row_group(i).num_rows for i in range(meta.num_row_groups)] == [40, 40, 20]
+    assert meta.row_group(0).column(0).compression == "ZSTD"
+    assert [p.name for p in tmp_path.iterdir()] == ["x.parquet"]
+
+def test_failed_write_leaves_no_final_or_temp_object(tmp_path):
+    def batches():
+        yield pa.record_batch([pa.array([1])], names=["a"])
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        write_parquet_atomic(batches(), str(tmp_path / "x.parquet"))
+    assert list(tmp_path.iterdir()) == []
+
+def test_write_parquet_roundtrips_dataframe(tmp_path):
+    df = pd.DataFrame({"ts": pd.date_range("2025-01-01", periods=3, freq="h", tz="UTC"), "v": [1.0, None, 3.0]})
+    path = write_parquet(df, str(tmp_path / "sub/df.parquet"))
+    pd.testing.assert_frame_equal(pd.read_parquet(path), df)
+    with AtomicParquetWriter(str(tmp_path / "sub/df.parquet")) as w:  # sobrescribe
+        w.write(df.iloc[:1])
+    assert w.result.rows == 1 and len(pd.read_parquet(path)) == 1
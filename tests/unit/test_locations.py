@@ -8,16 +8,18 @@ def _fake_resp(results, found=2, limit=1000):
         "meta": {"found": found, "limit": limit}
     }
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_find_sensors_paginates_and_returns_list(mock_get):
     # page 1
     r1 = Mock()
     r1.json.return_value = _fake_resp([{"id": 1}, {"id": 2}], found=2, limit=1000)
     r1.raise_for_status.return_value = None
+    r1.status_code, r1.headers = 200, {}
     # page 2 (empty)
     r2 = Mock()
     r2.json.return_value = _fake_resp([], found=2, limit=1000)
     r2.raise_for_status.return_value = None
+    r2.status_code, r2.headers = 200, {}
     mock_get.side_effect = [r1, r2]
 
     sensors = FindSensors.fn(
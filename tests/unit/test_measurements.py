@@ -18,10 +18,11 @@ def _mk_resp(rows):
     m = Mock()
     m.json.return_value = {"results": rows}
     m.raise_for_status.return_value = None
+    m.status_code, m.headers = 200, {}
     return m
 
 @patch("src.api.measurements.load_sensor_data", return_value=SENSORS_DOC)
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_fetch_sensor_data_multi_param(mock_get, _load):
     # two pages then stop for pm25
     pm25_p1 = _mk_resp([
@@ -51,3 +52,139 @@ def test_fetch_sensor_data_multi_param(mock_get, _load):
     assert isinstance(df, pd.DataFrame)
     assert set(df["parameter"].unique()) == {"pm25", "no2"}
     assert {"sensor_id", "parameter", "location_id", "timestamp"}.issubset(df.columns)
+
+@patch("src.api.measurements.load_sensor_data", return_value=SENSORS_DOC)
+@patch("requests.Session.get")
+def test_fetch_sensor_data_concurrent_matches_sequential(mock_get, _load):
+    rows = {
+        9001: [{"date": {"utc": "2025-08-01T00:00:00Z"}, "value": 10, "unit": "µg/m³", "parameter": "pm25"}],
+        9002: [{"date": {"utc": "2025-08-01T00:05:00Z"}, "value": 20, "unit": "µg/m³", "parameter": "no2"}],
+    }
+
+    def _by_url(url, headers=None, params=None, timeout=None):
+        sensor_id = int(url.rstrip("/").split("/")[-2])
+        return _mk_resp(rows[sensor_id] if params["page"] == 1 else [])
+
+    mock_get.side_effect = _by_url
+    kwargs = dict(
+        PARAMETERS=["pm25", "no2"],
+        start_date="2025-08-01T00:00:00Z",
+        end_date="2025-08-01T01:00:00Z",
+        INPUT_FILE="ignored.json",
+        allowed_locations=None,
+        allowed_sensors=None,
+        API_KEY_OVERRIDE="fake",
+    )
+    seq = FetchSensorData.fn(max_workers=1, **kwargs)
+    par = FetchSensorData.fn(max_workers=4, **kwargs)
+    pd.testing.assert_frame_equal(seq, par)
+    assert list(par["sensor_id"]) == [9001, 9002]
+
+def test_split_window_fixed_chunks_with_short_tail():
+    from src.api.measurements import split_window
+    from datetime import timedelta
+    windows = split_window("2025-01-01T00:00:00Z", "2025-01-20T06:00:00Z", timedelta(days=7))
+    assert windows == [
+        ("2025-01-01T00:00:00Z", "2025-01-08T00:00:00Z"),
+        ("2025-01-08T00:00:00Z", "2025-01-15T00:00:00Z"),
+        ("2025-01-15T00:00:00Z", "2025-01-20T06:00:00Z"),
+    ]
+
+@patch("src.api.measurements.load_sensor_data", return_value=SENSORS_DOC)
+@patch("requests.Session.get")
+def test_stream_sensor_data_writes_same_rows_as_fetch(mock_get, _load, tmp_path):
+    from src.api.measurements import StreamSensorData
+    pages = {
+        9001: [[{"date": {"utc": f"2025-08-01T0{i}:00:00Z"}, "value": i, "unit": "µg/m³", "parameter": "pm25"}] for i in range(3)],
+        9002: [[{"date": {"utc": "2025-08-01T00:05:00Z"}, "value": 20, "unit": "µg/m³", "parameter": "no2"}]],
+    }
+
+    def _by_url(url, headers=None, params=None, timeout=None):
+        sensor_pages = pages[int(url.rstrip("/").split("/")[-2])]
+        page = params["page"]
+        return _mk_resp(sensor_pages[page - 1] if page <= len(sensor_pages) else [])
+
+    mock_get.side_effect = _by_url
+    kwargs = dict(
+        PARAMETERS=["pm25", "no2"],
+        start_date="2025-08-01T00:00:00Z",
+        end_date="2025-08-01T04:00:00Z",
+        INPUT_FILE="ignored.json",
+        allowed_locations=None,
+        allowed_sensors=None,
+        API_KEY_OVERRIDE="fake",
+    )
+    out = tmp_path / "dt=2025-08-01" / "measurements.parquet"
+    rows = StreamSensorData.fn(output_file=str(out), row_group_size=2, **kwargs)
+    expected = FetchSensorData.fn(**kwargs)
+
+    streamed = pd.read_parquet(out)
+    assert rows["rows"] == len(expected) == 4
+    assert rows["sensor_status"] == {9001: "ok", 9002: "ok"}
+    assert list(streamed.columns) == list(expected.columns)
+    assert streamed["value"].tolist() == expected["value"].astype(float).tolist()
+    assert streamed["timestamp"].tolist() == expected["timestamp"].tolist()
+
+@patch("src.api.measurements.load_sensor_data", return_value=SENSORS_DOC)
+@patch("requests.Session.get")
+def test_fetch_sensor_data_per_sensor_start_and_status(mock_get, _load):
+    import requests
+    seen = {}
+
+    def _by_url(url, headers=None, params=None, timeout=None):
+        sensor_id = int(url.rstrip("/").split("/")[-2])
+        seen[sensor_id] = params["datetime_from"]
+        if sensor_id == 9002:
+            m = _mk_resp([])
+            m.status_code = 404
+            m.raise_for_status.side_effect = requests.exceptions.HTTPError("404")
+            return m
+        return _mk_resp([{"date": {"utc": "2025-08-01T00:00:00Z"}, "value": 1, "parameter": "pm25"}]
+                        if params["page"] == 1 else [])
+
+    mock_get.side_effect = _by_url
+    df = FetchSensorData.fn(
+        PARAMETERS=["pm25", "no2"],
+        start_date="2025-08-01T00:00:00Z",
+        end_date="2025-08-01T03:00:00Z",
+        INPUT_FILE="ignored.json",
+        allowed_locations=None,
+        allowed_sensors=None,
+        API_KEY_OVERRIDE="fake",
+        start_dates={9001: "2025-07-31T18:00:00Z"},
+    )
+    assert seen == {9001: "2025-07-31T18:00:00Z", 9002: "2025-08-01T00:00:00Z"}
+    assert df.attrs["sensor_status"] == {9001: "ok", 9002: "error"}
+    assert len(df) == 1
+
+@patch("src.api.measurements.get_client")
+def test_pages_use_client_of_override_key(mock_client):
+    from src.api.measurements import iter_measurement_pages
+    mock_client.return_value.get.return_value = _mk_resp([])
+    list(iter_measurement_pages({"X-API-Key": "override"}, {}, "http://x"))
+    mock_client.assert_called_once_with("override")
+
+@patch("src.api.measurements.load_sensor_data", return_value=SENSORS_DOC)
+@patch("requests.Session.get")
+def test_stream_sensor_data_failure_leaves_no_file(mock_get, _load, tmp_path):
+    from src.api.measurements import StreamSensorData
+    row = {"date": {"utc": "2025-08-01T00:00:00Z"}, "value": 1, "unit": "µg/m³", "parameter": "pm25"}
+
+    def _by_url(url, headers=None, params=None, timeout=None):
+        if int(url.rstrip("/").split("/")[-2]) == 9002:
+            raise RuntimeError("boom")
+        return _mk_resp([row] if params["page"] == 1 else [])
+
+    mock_get.side_effect = _by_url
+    out = tmp_path / "dt=2025-08-01" / "measurements.parquet"
+    try:
+        StreamSensorData.fn(
+            output_file=str(out), PARAMETERS=["pm25", "no2"], start_date="2025-08-01T00:00:00Z",
+            end_date="2025-08-01T04:00:00Z", INPUT_FILE="ignored.json", allowed_locations=None,
+            allowed_sensors=None, API_KEY_OVERRIDE="fake", max_workers=1, row_group_size=1,
+        )
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected RuntimeError")
+    assert not out.exists() and not list(out.parent.glob("_tmp_*"))
@@ -0,0 +1,76 @@
+import pandas as pd
+import pyarrow as pa
+from src.api.measurements_structure import MEASUREMENT_FIELDS, flatten_measurement, flatten_page
+
+RECORDS = [
+    {
+        "value": 12,
+        "parameter": {"id": 2, "name": "pm25", "units": "µg/m³"},
+        "date": {"utc": "2025-08-01T00:00:00Z", "local": "2025-07-31T20:00:00-04:00"},
+        "period": {
+            "label": "raw", "interval": "01:00:00",
+            "datetimeFrom": {"utc": "2025-08-01T00:00:00Z", "local": "2025-07-31T20:00:00-04:00"},
+            "datetimeTo": {"utc": "2025-08-01T01:00:00Z", "local": "2025-07-31T21:00:00-04:00"},
+        },
+        "coverage": {"expectedCount": 1, "observedCount": 1, "percentComplete": 100},
+    },
+    {"date": {"utc": "2025-08-01T01:00:00Z"}, "value": 0.4, "unit": "ppm", "parameter": "co"},
+    {"value": None, "parameter": None},
+]
+
+def test_flatten_page_matches_per_record_flatten():
+    table = flatten_page(RECORDS)
+    assert table.schema == pa.schema(MEASUREMENT_FIELDS)
+
+    got = table.to_pandas()
+    want = pd.DataFrame([flatten_measurement(m) for m in RECORDS])
+    assert list(got.columns) == list(want.columns)
+    for col in want.columns:
+        expected = want[col]
+        if pa.types.is_timestamp(table.schema.field(col).type):
+            expected = pd.to_datetime(expected, utc=True)
+        pd.testing.assert_series_equal(
+            got[col].astype(object).where(got[col].notna(), None),
+            expected.astype(object).where(expected.notna(), None),
+            check_names=False, check_dtype=False,
+        )
+
+def test_flatten_page_fixed_types_for_empty_page():
+    table = flatten_page([])
+    assert table.num_rows == 0
+    assert table.schema.field("timestamp").type == pa.timestamp("us", tz="UTC")
+    assert pa.types.is_dictionary(table.schema.field("parameter").type)
+
+def test_with_sensor_meta_adds_constant_columns_without_replication():
+    from src.api.measurements_structure import MEASUREMENT_SCHEMA, with_sensor_meta
+    table = with_sensor_meta(flatten_page(RECORDS), {
+        "sensor_id": 9001, "parameter_meta": "pm25", "location_id": 7, "location_name": "Loc A",
+    })
+    assert table.schema == MEASUREMENT_SCHEMA
+    assert table.column("sensor_id").to_pylist() == [9001] * 3
+    name = table.column("location_name").combine_chunks()
+    assert pa.types.is_dictionary(name.type)
+    assert len(name.dictionary) == 1 and name.to_pylist() == ["Loc A"] * 3
+
+def test_writes_conform_to_versioned_schema_and_concat_without_promotion(tmp_path):
+    from unittest.mock import patch
+    import pyarrow.parquet as pq
+    import src.data.extract as extract
+    import src.data.preprocess as pre
+    from src.api.measurements_structure import MEASUREMENT_SCHEMA, MEASUREMENT_SCHEMA_VERSION, schema_version
+
+    # dos runs cuyos frames pandas infieren tipos distintos (columna toda nula, categoría, strings)
+    run_a = pd.DataFrame({"sensor_id": [1], "parameter": pd.Categorical(["pm25"]), "value": [1.0],
+                          "datetime_from_utc": pd.to_datetime(["2025-01-01T00:00Z"]), "period_label": [None]})
+    run_b = pd.DataFrame({"sensor_id": [2], "parameter": ["pm25"], "value": [2.0],
+                          "datetime_from_utc": ["2025-01-01T01:00:00Z"], "period_label": ["raw"]})
+    with patch.object(extract, "GCS_BUCKET", ""), patch.object(extract, "LOCAL_RAW_DIR", tmp_path):
+        files = [extract._write_parquet(df, f"dt=2025-01-01/measurements_{i}.parquet") for i, df in enumerate([run_a, run_b])]
+
+    for f in files:
+        schema = pq.read_schema(f)
+        assert schema.equals(MEASUREMENT_SCHEMA) and schema_version(schema) == MEASUREMENT_SCHEMA_VERSION
+    t = pre._load_concat_table(files)
+    assert t.num_rows == 2 and t.column_names == MEASUREMENT_SCHEMA.names
+    assert t["datetime_from_utc"].type == pa.timestamp("us", tz="UTC") and t["parameter"].type == pa.string()
+    assert t["period_label"].to_pylist() == [None, "raw"]
@@ -0,0 +1,56 @@
+import json
+from unittest.mock import patch
+import pandas as pd
+import src.data.extract as extract
+from src.api.catalog import SensorCatalog
+from src.utils.config import load_city_configs
+
+CITIES = [
+    {"city": "A", "coordinates": "1,2", "parameters": "pm25"},
+    {"city": "B", "coordinates": [3, 4], "parameters": ["pm25"], "state_blob": "state/b.json"},
+]
+
+def _catalog(cfg=None):
+    sid = 11 if cfg.city == "A" else 22
+    return SensorCatalog([{"id": sid, "name": cfg.city, "sensors": [{"id": sid, "parameter": {"name": "pm25"}}]}],
+                         None, cfg.coordinates_tuple(), cfg.radius_m)
+
+def _fetch(output_file=None, sensor_data=None, **kwargs):
+    sid = sensor_data["sensors"][0]["id"]
+    if sid == 22:
+        raise RuntimeError("boom")
+    df = pd.DataFrame({"sensor_id": [sid], "parameter": ["pm25"], "value": [1.0]})
+    df.attrs["sensor_status"] = {sid: "ok"}
+    return df
+
+def test_load_city_configs(tmp_path):
+    path = tmp_path / "cities.json"
+    path.write_text(json.dumps({"cities": CITIES}))
+    a, b = load_city_configs(str(path))
+    assert a.coordinates_tuple() == (1.0, 2.0) and b.coordinates == "3.0,4.0"
+    assert a.parameters == ["pm25"] and a.allowed_sensors is None
+    assert a.state_key() == "state/A/openaq_extract_state.json" and b.state_key() == "state/b.json"
+
+def test_plan_concurrency_follows_quota():
+    assert extract._plan_concurrency(10, rate_per_sec=1.0, latency_s=1.5) == (2, 1)
+    assert extract._plan_concurrency(3, rate_per_sec=10.0, latency_s=1.0) == (3, 3)
+    assert extract._plan_concurrency(1, rate_per_sec=100.0, latency_s=1.0, max_workers=8) == (1, 8)
+
+def test_multi_city_keeps_partitions_and_state_per_city(tmp_path):
+    path = tmp_path / "cities.json"
+    path.write_text(json.dumps(CITIES))
+    with patch.object(extract, "GCS_BUCKET", ""), \
+         patch.object(extract, "LOCAL_RAW_DIR", tmp_path / "raw"), \
+         patch.object(extract, "STATE_BLOB", str(tmp_path / "state.json")), \
+         patch.object(extract, "_sensor_catalog", side_effect=_catalog), \
+         patch.object(extract.FetchSensorData, "fn", side_effect=_fetch), \
+         patch("src.data.extract.build_path", side_effect=lambda key, bucket=None: str(tmp_path / key)):
+        results = extract.MultiCityExtractionFlow.fn(str(path))
+
+    assert results["A"]["rows"] == 1 and results["A"]["sensor_status"] == {11: "ok"}
+    assert "boom" in results["B"]["error"]
+    assert list((tmp_path / "raw/openaq/A").rglob("measurements_*.parquet"))
+    assert not (tmp_path / "raw/openaq/B").exists()
+    state = json.loads((tmp_path / "state/A/openaq_extract_state.json").read_text())
+    assert "11" in state["sensors"]
+    assert not (tmp_path / "state/b.json").exists()
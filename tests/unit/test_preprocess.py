@@ -0,0 +1,228 @@
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import src.data.preprocess as pre
+
+def _write_raw(root, day, name, hours=3, value=10.0, sensor_id=11):
+    ts = pd.date_range(f"{day}T00:00:00Z", periods=hours, freq="h")
+    df = pd.DataFrame({
+        "sensor_id": sensor_id, "location_id": 1, "parameter": "pm25", "unit": "µg/m³",
+        "value": value, "datetime_from_utc": ts,
+    })
+    path = root / f"openaq/{pre.CITY}/dt={day}"
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / name, index=False)
+
+def test_range_lists_once_and_writes_one_partition_per_day(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_raw(tmp_path, "2025-01-01", "measurements_a.parquet")
+    _write_raw(tmp_path, "2025-01-01", "measurements_b.parquet", value=20.0, sensor_id=12)
+    _write_raw(tmp_path, "2025-01-02", "measurements_a.parquet", hours=5)
+    _write_raw(tmp_path, "2025-01-05", "measurements_a.parquet")  # fuera del rango
+
+    with patch.object(pre, "GCS_BUCKET", ""):
+        by_day = pre._list_measurement_files_range("2025-01-01", "2025-01-03")
+        assert {d: len(f) for d, f in by_day.items()} == {"2025-01-01": 2, "2025-01-02": 1}
+        results = pre.run_preprocess_range("2025-01-01", "2025-01-03", max_workers=2)
+
+    assert results == {"2025-01-01": 3, "2025-01-02": 5, "2025-01-03": 0}
+    for day in ["2025-01-01", "2025-01-02", "2025-01-03"]:
+        assert (tmp_path / f"openaq/{pre.CITY}/features/dt={day}/features.parquet").exists()
+    day1 = pd.read_parquet(tmp_path / f"openaq/{pre.CITY}/processed/dt=2025-01-01/preprocessed.parquet")
+    assert day1["pm25"].tolist() == [15.0, 15.0, 15.0]
+
+def test_parallel_reads_match_sequential(tmp_path):
+    for i in range(4):
+        _write_raw(tmp_path, "2025-01-01", f"measurements_{i}.parquet", value=float(i))
+    files = [str(p) for p in tmp_path.rglob("*.parquet")]
+    seq = pre._load_concat_measurements(files, max_workers=1)
+    par = pre._load_concat_measurements(files, max_workers=4)
+    pd.testing.assert_frame_equal(seq, par)
+
+def test_features_use_warmup_and_lookahead_across_midnight(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_raw(tmp_path, "2025-01-01", "measurements_a.parquet", hours=24, value=10.0)
+    _write_raw(tmp_path, "2025-01-02", "measurements_a.parquet", hours=24, value=30.0)
+
+    with patch.object(pre, "GCS_BUCKET", ""):
+        pre.run_preprocess("2025-01-01")
+        pre.run_preprocess("2025-01-02")  # además completa el target de la última hora del 01
+
+    feats = lambda d: pd.read_parquet(tmp_path / f"openaq/{pre.CITY}/features/dt={d}/features.parquet")
+    day1, day2 = feats("2025-01-01"), feats("2025-01-02")
+    assert len(day1) == 24 and len(day2) == 24
+    assert day1["pm25_next_hour"].iloc[-1] == 30.0
+    assert day1["target_polluted_next_hour"].iloc[-1] == 1
+    first = day2.iloc[0]
+    assert first["pm25_lag1"] == 10.0 and first["pm25_lag6"] == 10.0
+    assert first["pm25_roll3_mean"] == (10.0 + 10.0 + 30.0) / 3
+    assert day2["pm25_next_hour"].iloc[-1] != day2["pm25_next_hour"].iloc[-1]  # NaN: no hay día siguiente
+
+def test_panel_mode_keeps_one_series_per_location(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ts = pd.date_range("2025-01-01T00:00:00Z", periods=8, freq="h")
+    raw = pd.concat([
+        pd.DataFrame({"location_id": loc, "sensor_id": loc * 10, "parameter": "pm25", "unit": "µg/m³",
+                      "value": [float(loc * 100 + i) for i in range(8)], "datetime_from_utc": ts})
+        for loc in (1, 2)
+    ])
+    path = tmp_path / f"openaq/{pre.CITY}/dt=2025-01-01"
+    path.mkdir(parents=True)
+    raw.sample(frac=1, random_state=0).to_parquet(path / "measurements_a.parquet", index=False)
+
+    with patch.object(pre, "GCS_BUCKET", ""), patch.object(pre, "PANEL", True):
+        pre.run_preprocess("2025-01-01")
+
+    feat = pd.read_parquet(tmp_path / f"openaq/{pre.CITY}/features_panel/dt=2025-01-01/features.parquet")
+    assert len(feat) == 16 and set(feat["location_id"]) == {1, 2}
+    for loc, g in feat.groupby("location_id"):
+        g = g.sort_values("timestamp_utc")
+        expected = g["pm25"]
+        pd.testing.assert_series_equal(g["pm25_lag1"], expected.shift(1), check_names=False)
+        pd.testing.assert_series_equal(g["pm25_roll3_mean"], expected.rolling(3, min_periods=1).mean(), check_names=False)
+        pd.testing.assert_series_equal(g["pm25_next_hour"], expected.shift(-1), check_names=False)
+    assert not (tmp_path / f"openaq/{pre.CITY}/features").exists()
+
+def test_lags_are_time_based_over_gaps():
+    ts = pd.to_datetime(["2025-01-01T00:00Z", "2025-01-01T01:00Z", "2025-01-01T02:00Z",
+                         "2025-01-01T04:00Z", "2025-01-01T05:00Z"])
+    wide = pd.DataFrame({"timestamp_utc": ts, "pm25": [1.0, 2.0, 3.0, None, 5.0], "no2": 1.0})
+    feat = pre._add_target(pre._add_lags_and_rolls(wide))
+
+    assert len(feat) == 5
+    last = feat.iloc[-1]
+    assert pd.isna(last["pm25_lag1"]) and last["pm25_lag3"] == 3.0 and pd.isna(last["pm25_lag6"])
+    assert last["pm25_roll3_mean"] == 5.0  # horas 03-05: sólo hay lectura a las 05
+    assert feat["pm25_age_h"].tolist() == [0.0, 0.0, 0.0, 2.0, 0.0]
+    assert feat["pm25_next_hour"].iloc[1] == 3.0
+    assert pd.isna(feat["pm25_next_hour"].iloc[2])  # 03:00 no existe
+    # sin pm25 en t+1h no hay label (ni en el hueco ni al final de la serie)
+    assert feat["target_polluted_next_hour"].isna().tolist() == [False, False, True, False, True]
+
+def test_lags_keep_repeated_rows():
+    ts = pd.to_datetime(["2025-01-01T00:00Z", "2025-01-01T01:00Z", "2025-01-01T01:00Z"])
+    wide = pd.DataFrame({"timestamp_utc": ts, "pm25": [1.0, 2.0, 4.0]})
+    feat = pre._add_lags_and_rolls(wide)
+
+    assert len(feat) == 3
+    assert feat["pm25_lag1"].tolist()[1:] == [1.0, 1.0]
+
+def test_arrow_engine_matches_pandas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    n = 3000
+    raw = pd.DataFrame({
+        "location_id": rng.integers(1, 4, n),
+        "sensor_id": rng.integers(1, 30, n),
+        "parameter": rng.choice(["pm25", "co", "no2", "temperature", "relativehumidity", "other"], n),
+        "unit": rng.choice(["µg/m³", "ug/m3", None], n),
+        "value": rng.normal(10, 15, n),
+        "datetime_from_utc": pd.Timestamp("2025-01-01", tz="UTC")
+                             + pd.to_timedelta(rng.integers(0, 24 * 60, n), unit="min"),
+    })
+    raw.loc[::50, "value"] = np.nan
+    path = tmp_path / f"openaq/{pre.CITY}/dt=2025-01-01"
+    path.mkdir(parents=True)
+    raw.to_parquet(path / "measurements_a.parquet", index=False)
+    raw.iloc[:400].to_parquet(path / "measurements_b.parquet", index=False)  # solapado → duplicados
+
+    out = {}
+    for panel in (False, True):
+        for engine in ("pandas", "arrow"):
+            with patch.object(pre, "GCS_BUCKET", ""), patch.object(pre, "PANEL", panel), \
+                 patch.object(pre, "ENGINE", engine):
+                pre.run_preprocess("2025-01-01")
+                out[panel, engine] = pd.read_parquet(f"{pre._processed_partition_path('2025-01-01')}/preprocessed.parquet")
+        pd.testing.assert_frame_equal(out[panel, "pandas"], out[panel, "arrow"])
+    assert len(out[True, "arrow"]) > len(out[False, "arrow"])
+
+def test_units_are_converted_per_row_and_unknown_counted():
+    df = pd.DataFrame({
+        "parameter": ["no2", "no2", "co", "co", "temperature", "pm25", "pm25", "other"],
+        "unit": ["ppb", "µg/m³", "ppm", "ug/m3", "°F", None, "ppm", "x"],
+        "value": [10.0, 10.0, 1.0, 500.0, 212.0, 7.0, 1.0, 3.0],
+    })
+    report = {}
+    out = pre._normalize_units(df, report)
+
+    np.testing.assert_allclose(out["value"].iloc[:5], [10 * 46.0055 / 24.45, 10.0, 28.010 / 24.45, 0.5, 100.0])
+    assert out["unit"].tolist()[:6] == ["µg/m³", "µg/m³", "mg/m³", "mg/m³", "°C", "µg/m³"]
+    assert out["value"].iloc[6] == 1.0 and out["unit"].iloc[6] == "ppm"  # pm25 en ppm: sin conversión
+    assert report == {"converted_rows": 4, "unknown": {"pm25|ppm": 1}}
+
+def test_mixing_ratio_units_are_case_insensitive():
+    df = pd.DataFrame({"parameter": ["no2", "co"], "unit": ["PPB", "PPM"], "value": [10.0, 1.0]})
+    report = {}
+    out = pre._normalize_units(df, report)
+
+    np.testing.assert_allclose(out["value"], [10 * 46.0055 / 24.45, 28.010 / 24.45])
+    assert out["unit"].tolist() == ["µg/m³", "mg/m³"] and report["unknown"] == {}
+
+def test_arrow_unit_conversion_matches_pandas():
+    import pyarrow as pa
+    from src.data import preprocess_arrow
+
+    rng = np.random.default_rng(1)
+    n = 500
+    df = pd.DataFrame({
+        "parameter": rng.choice(["no2", "o3", "co", "temperature", "pm25", None], n),
+        "unit": rng.choice(["ppb", "ppm", "µg/m³", "mg/m3", "°F", "K", "?", None], n),
+        "value": rng.normal(10, 5, n),
+    })
+    report_pd, report_pa = {}, {}
+    expected = pre._normalize_units(df, report_pd)
+    got = preprocess_arrow.normalize_units(
+        pa.Table.from_pandas(df), pre._unit_table, pre._unit_report, report_pa
+    ).to_pandas()
+    np.testing.assert_allclose(got["value"], expected["value"])
+    pd.testing.assert_series_equal(got["unit"].astype(object), expected["unit"], check_dtype=False)
+    assert report_pa == report_pd and report_pd["unknown"]
+
+def test_dedup_keeps_latest_record_per_sensor_and_timestamp(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_raw(tmp_path, "2025-01-01", "measurements_20250101T030000Z.parquet", hours=3, value=10.0)
+    _write_raw(tmp_path, "2025-01-01", "measurements_20250101T060000Z.parquet", hours=6, value=30.0)  # solapa 00-02
+
+    for engine in ("pandas", "arrow"):
+        with patch.object(pre, "GCS_BUCKET", ""), patch.object(pre, "ENGINE", engine):
+            pre.run_preprocess("2025-01-01")
+        day = pd.read_parquet(tmp_path / f"openaq/{pre.CITY}/processed/dt=2025-01-01/preprocessed.parquet")
+        assert day["pm25"].tolist() == [30.0] * 6, engine
+
+def test_measurement_keys_match_between_pandas_and_arrow():
+    import pyarrow as pa
+    from src.api.measurements_structure import measurement_keys, measurement_keys_df
+
+    df = pd.DataFrame({
+        "sensor_id": [1, 1, 2, None],
+        "datetime_from_utc": ["2025-01-01T00:00:00Z", "2025-01-01T00:00:00Z", None, "2025-01-01T00:00:00Z"],
+    })
+    keys = measurement_keys_df(df)
+    assert keys[0] == keys[1] == (1 << 32) + 1735689600
+    assert keys[2] < 0 and keys[3] < 0 and keys[2] != keys[3]
+    np.testing.assert_array_equal(measurement_keys(pa.Table.from_pandas(df)), keys)
+
+def test_loader_projects_columns_and_pushes_filters(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    old = pd.DataFrame({  # archivo viejo: timestamps string, columna extra
+        "sensor_id": [1, 2], "parameter": ["pm25", "so2"], "unit": "µg/m³", "value": [1.0, 2.0],
+        "datetime_from_utc": ["2025-01-01T00:00:00Z", "2025-01-01T01:00:00Z"], "coverage_percentComplete": 100.0,
+    })
+    new = pa.table({
+        "sensor_id": [3, 3], "parameter": pa.array(["pm25", "pm25"]).dictionary_encode(),
+        "value": [3.0, 4.0],
+        "datetime_from_utc": pa.array(pd.to_datetime(["2025-01-01T02:00Z", "2025-01-02T00:00Z"]),
+                                      type=pa.timestamp("us", tz="UTC")),
+    })
+    old.to_parquet(tmp_path / "measurements_a.parquet", index=False)
+    pq.write_table(new, tmp_path / "measurements_b.parquet")
+    files = [str(tmp_path / "measurements_a.parquet"), str(tmp_path / "measurements_b.parquet")]
+
+    t = pre._load_concat_table(files, columns=pre.READ_COLUMNS, parameters=["pm25"],
+                               start="2025-01-01", end="2025-01-02")
+    assert t.column_names == ["sensor_id", "value", "parameter", "unit", "datetime_from_utc"]  # orden del registro
+    assert t["value"].to_pylist() == [1.0, 3.0] and t["unit"].to_pylist() == ["µg/m³", None]
+    assert t.schema.field("datetime_from_utc").type == pa.timestamp("us", tz="UTC")
+    assert pre._load_concat_table(files).num_rows == 4  # sin argumentos: todo
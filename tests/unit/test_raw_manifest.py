@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pandas as pd
+import src.data.preprocess as pre
+from src.data import raw_manifest
+
+NOW = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+def _write(day_dir, name, hours, value=10.0):
+    df = pd.DataFrame({
+        "sensor_id": 11, "location_id": 1, "parameter": "pm25", "unit": "µg/m³", "value": value,
+        "datetime_from_utc": pd.date_range("2025-01-01T00:00:00Z", periods=hours, freq="h"),
+    })
+    day_dir.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(day_dir / name, index=False)
+    return str(day_dir / name)
+
+def test_first_record_bootstraps_existing_files_and_upserts(tmp_path):
+    day = tmp_path / "dt=2025-01-01"
+    _write(day, "measurements_old.parquet", 2)  # anterior al manifest
+    new = _write(day, "measurements_new.parquet", 3)
+
+    manifest = raw_manifest.record_files(str(day), [new], "extract", now=NOW)
+    entries = {e["file"]: e for e in manifest["files"]}
+    assert entries["measurements_old.parquet"]["source"] == "listing"
+    e = entries["measurements_new.parquet"]
+    assert (e["rows"], e["min_ts"], e["max_ts"]) == (3, "2025-01-01T00:00:00Z", "2025-01-01T02:00:00Z")
+    assert e["bytes"] == (day / "measurements_new.parquet").stat().st_size and len(e["schema_hash"]) == 16
+
+    _write(day, "measurements_new.parquet", 5)  # re-escrito con el mismo nombre
+    manifest = raw_manifest.record_files(str(day), [new], "backfill", now=NOW)
+    assert [(e["file"], e["rows"]) for e in manifest["files"]] == [
+        ("measurements_old.parquet", 2), ("measurements_new.parquet", 5)
+    ]
+
+def test_preprocess_discovers_files_from_manifest_without_listing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    day = tmp_path / f"openaq/{pre.CITY}/dt=2025-01-01"
+    path = _write(day, "measurements_a.parquet", 3)
+    raw_manifest.record_files(f"openaq/{pre.CITY}/dt=2025-01-01", [path], "extract", now=NOW)
+    _write(day, "measurements_unregistered.parquet", 3, value=99.0)  # fuera del manifest: no se lee
+
+    with patch.object(pre, "GCS_BUCKET", ""), \
+         patch.object(raw_manifest, "list_measurement_files", side_effect=AssertionError("listed")):
+        assert [f.rsplit("/", 1)[-1] for f in pre._list_measurement_files("2025-01-01")] == ["measurements_a.parquet"]
+        by_day = pre._list_measurement_files_range("2025-01-01", "2025-01-01")
+        assert list(by_day) == ["2025-01-01"] and len(by_day["2025-01-01"]) == 1
+        pre.run_preprocess("2025-01-01")
+
+    out = pd.read_parquet(tmp_path / f"openaq/{pre.CITY}/processed/dt=2025-01-01/preprocessed.parquet")
+    assert out["pm25"].tolist() == [10.0, 10.0, 10.0]
+
+def test_range_falls_back_to_glob_for_days_without_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write(tmp_path / f"openaq/{pre.CITY}/dt=2025-01-02", "measurements_a.parquet", 2)
+    with patch.object(pre, "GCS_BUCKET", ""):
+        by_day = pre._list_measurement_files_range("2025-01-01", "2025-01-03")
+    assert {d: len(f) for d, f in by_day.items()} == {"2025-01-02": 1}
+
+def test_write_order_follows_write_time_not_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rel = f"openaq/{pre.CITY}/dt=2025-01-01"
+    day = tmp_path / rel
+    t = lambda h: datetime(2025, 1, 1, h, tzinfo=timezone.utc)
+    backfill = _write(day, "measurements_backfill_11_20250101.parquet", 3, value=10.0)
+    raw_manifest.record_files(rel, [backfill], "backfill", now=t(1))
+    run = _write(day, "measurements_20250101T020000.parquet", 3, value=30.0)
+    raw_manifest.record_files(rel, [run], "extract", now=t(2))
+
+    def processed():
+        with patch.object(pre, "GCS_BUCKET", ""):
+            pre.run_preprocess("2025-01-01")
+        return pd.read_parquet(day.parent / "processed/dt=2025-01-01/preprocessed.parquet")["pm25"].tolist()
+
+    assert processed() == [30.0] * 3  # el run incremental es posterior al backfill
+    raw_manifest.record_files(rel, [backfill], "backfill", now=t(3))  # backfill re-ejecutado
+    assert processed() == [10.0] * 3
+    # sin manifest: el backfill no tiene fecha, los runs ordenan por run_ts
+    assert [p.rsplit("/", 1)[-1] for p in raw_manifest.write_order([run, backfill], {})] == [
+        "measurements_backfill_11_20250101.parquet", "measurements_20250101T020000.parquet"
+    ]
+
+def test_range_lists_only_pre_manifest_days(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = f"openaq/{pre.CITY}"
+    _write(tmp_path / root / "dt=2024-12-30", "measurements_old.parquet", 2)  # anterior a los manifests
+    path = _write(tmp_path / root / "dt=2025-01-01", "measurements_a.parquet", 3)
+    raw_manifest.record_files(f"{root}/dt=2025-01-01", [path], "extract", now=NOW)
+    assert raw_manifest.manifests_since(root) == "2025-01-02"
+
+    listed = []
+    real = raw_manifest.list_measurement_files
+    def _list(raw_dir):
+        listed.append(raw_dir.rsplit("=", 1)[-1])
+        return real(raw_dir)
+
+    with patch.object(pre, "GCS_BUCKET", ""), patch.object(raw_manifest, "list_measurement_files", side_effect=_list):
+        by_day = pre._list_measurement_files_range("2024-12-30", "2025-01-05")
+        assert pre._list_measurement_files("2025-01-04") == []
+    assert {d: len(f) for d, f in by_day.items()} == {"2024-12-30": 1, "2025-01-01": 1}
+    assert listed == ["2024-12-30", "2024-12-31"]  # desde el 02 sin manifest = vacío
@@ -0,0 +1,103 @@
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from sklearn.linear_model import LogisticRegression
+import src.data.preprocess as pre
+from src.serving import app as serving
+from src.serving.online_features import OnlineFeatureStore, hour_to_datetime
+
+def _raw(hours=10):
+    rng = np.random.default_rng(1)
+    rows = []
+    for loc in (1, 2):
+        for h in range(hours):
+            if loc == 2 and h in (3, 4):
+                continue  # huecos: los lags son por tiempo, no por fila
+            ts = pd.Timestamp("2025-01-04T20:00:00Z") + pd.Timedelta(hours=h)  # cruza a domingo
+            for sensor, param in ((10 * loc, "pm25"), (10 * loc + 1, "no2")):
+                for minute in (0, 30):
+                    rows.append({"sensor_id": sensor, "location_id": loc, "parameter": param, "unit": "µg/m³",
+                                 "value": float(rng.uniform(5, 40)), "datetime_from_utc": ts + pd.Timedelta(minutes=minute)})
+    return pd.DataFrame(rows)
+
+def test_online_features_match_offline_pipeline():
+    raw = _raw()
+    with patch.object(pre, "PANEL", True):
+        wide = pre._resample_hourly_pivot(pre._ensure_date_utc(pre._normalize_units(pre._basic_qc(raw))))
+        offline = pre._add_lags_and_rolls(pre._add_calendar_features(wide))
+    features = [c for c in offline.columns if c not in ("timestamp_utc", "location_id")]
+
+    store = OnlineFeatureStore(features, panel=True)
+    store.ingest(raw.iloc[: len(raw) // 2])
+    store.ingest(raw.iloc[len(raw) // 3:])  # solapa: lo re-enviado no se cuenta dos veces
+    ids, X, hours = store.matrix()
+
+    last = offline.sort_values("timestamp_utc").groupby("location_id").tail(1).set_index("location_id")
+    assert ids == [1, 2]
+    np.testing.assert_allclose(X, last.loc[ids, features].to_numpy(dtype=np.float32), rtol=1e-5, equal_nan=True)
+    assert [hour_to_datetime(h).isoformat() for h in hours] == [pd.Timestamp(last.loc[i, "timestamp_utc"]).isoformat() for i in ids]
+
+def test_app_loads_model_once_and_scores_batch_and_single():
+    features = ["pm25", "pm25_lag1", "pm25_roll3_mean", "hour"]
+    model = LogisticRegression().fit(np.array([[5, 5, 5, 0], [50, 50, 50, 12]] * 5, dtype=np.float32), [0, 1] * 5)
+    bundle = {"model": model, "kind": "logreg", "features": features, "threshold": 0.5,
+              "granularity": "location", "version": "20250201T000000"}
+    records = _raw(4).assign(datetime_from_utc=lambda d: d["datetime_from_utc"].map(pd.Timestamp.isoformat))
+    with patch.object(serving.train, "load_latest", return_value=bundle) as load, \
+         patch.object(serving, "WARM_DAYS", 0), TestClient(serving.app) as client:
+        assert client.post("/ingest", json=records.to_dict("records")).json()["applied"] == len(records)
+        batch = client.get("/predict").json()
+        single = client.get("/predict/2").json()
+        assert client.get("/predict/99").status_code == 404
+        assert client.get("/health").json() == {"model_version": "20250201T000000", "series": 2}
+    load.assert_called_once()
+    assert [p["location_id"] for p in batch] == [1, 2] and single == batch[1]
+    assert batch[0]["timestamp_utc"].startswith("2025-01-04T23:00:00")
+    assert 0.0 <= batch[0]["probability"] <= 1.0 and batch[0]["model_version"] == "20250201T000000"
+
+def test_warm_start_reads_serve_city(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    now = pd.Timestamp.now(tz="UTC").floor("h")
+    for city, value in (("Other", 7.0), (pre.CITY, 99.0)):
+        path = tmp_path / f"openaq/{city}/dt={now.strftime('%Y-%m-%d')}"
+        path.mkdir(parents=True)
+        pd.DataFrame({"sensor_id": [1], "location_id": [1], "parameter": ["pm25"], "unit": ["µg/m³"],
+                      "value": [value], "datetime_from_utc": [now]}).to_parquet(path / "measurements_a.parquet")
+
+    store = OnlineFeatureStore(["pm25"])
+    with patch.object(pre, "GCS_BUCKET", ""), patch.object(serving, "SERVE_CITY", "Other"):
+        assert serving._warm_start(store, days=1) == 1
+    assert store.matrix()[1].tolist() == [[7.0]]
+
+def test_online_meteo_fill_matches_offline_table():
+    start = pd.Timestamp("2025-01-04T00:00:00Z")
+    meteo = {1: {"temperature": (0, 1, 2, 6, 7)},              # hueco interpolado (3-4) + arrastre (5, 8-9)
+             2: {"temperature": (0, 5), "relativehumidity": (9,)}}
+    rows = []
+    for loc, params in meteo.items():
+        for h in range(10):
+            if loc == 2 and h == 4:
+                continue  # hora sin fila: no cuenta como posición para la interpolación
+            hour = {"pm25": True, **{p: h in hs for p, hs in params.items()}}
+            for i, (param, present) in enumerate(hour.items()):
+                if present:
+                    rows.append({"sensor_id": 10 * loc + i, "location_id": loc, "parameter": param,
+                                 "unit": "°C" if param == "temperature" else ("%" if param == "relativehumidity" else "µg/m³"),
+                                 "value": float(10 * loc + h * (i + 1)), "datetime_from_utc": start + pd.Timedelta(hours=h)})
+    raw = pd.DataFrame(rows)
+    with patch.object(pre, "PANEL", True):
+        wide = pre._wide_from_long(pre._hourly_long(pre._ensure_date_utc(pre._normalize_units(pre._basic_qc(raw)))))
+        offline = pre._add_lags_and_rolls(pre._add_calendar_features(wide))
+    features = [c for c in offline.columns if c.startswith(("temperature", "relativehumidity"))]
+
+    store = OnlineFeatureStore(features, panel=True)
+    for h in range(10):  # en orden, hora a hora: las primeras salen del buffer
+        store.ingest(raw[raw["datetime_from_utc"] == start + pd.Timedelta(hours=h)])
+    ids, X, _ = store.matrix()
+
+    last = offline.sort_values("timestamp_utc").groupby("location_id").tail(1).set_index("location_id")
+    expected = last.loc[ids, features].to_numpy(dtype=np.float32)
+    temp = [j for j, f in enumerate(features) if f.startswith("temperature")]
+    assert not np.isnan(expected[0, temp]).any()  # la serie 1 tiene todos sus lags de temperatura rellenos
+    np.testing.assert_allclose(X, expected, rtol=1e-5, equal_nan=True)
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+from src.utils.state import ExtractState, compute_sensor_windows
+
+UTC = timezone.utc
+T0 = datetime(2025, 8, 1, 0, 0, tzinfo=UTC)
+T1 = T0 + timedelta(hours=3)
+
+def test_only_successful_sensors_advance():
+    state = ExtractState(last_success_utc=T0, sensors={1: T0 - timedelta(hours=6)})
+    state.advance({1: "ok", 2: "error", 3: "ok"}, T1)
+    assert state.sensors[1] == T1
+    assert state.sensors[3] == T1
+    # el sensor nuevo que falló queda fijado al default previo, no al nuevo
+    assert state.sensors[2] == T0
+    assert state.last_success_utc == T1
+
+def test_sensor_windows_start_from_own_checkpoint():
+    state = ExtractState(last_success_utc=T0, sensors={1: T0 - timedelta(hours=6)})
+    windows = compute_sensor_windows(T1, 15, state, [1, 2])
+    assert windows[1] == ("2025-07-31T17:45:00Z", "2025-08-01T03:00:00Z")
+    assert windows[2] == ("2025-07-31T23:45:00Z", "2025-08-01T03:00:00Z")
+
+def test_payload_roundtrip_and_legacy_format():
+    state = ExtractState(last_success_utc=T0, sensors={9001: T1})
+    assert ExtractState.from_payload(state.to_payload()) == state
+    legacy = ExtractState.from_payload({"last_success_utc": "2025-08-01T00:00:00Z"})
+    assert legacy.last_success_utc == T0 and legacy.sensors == {}
@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import src.data.preprocess as pre
+from src.models import train
+
+def _features(days=20):
+    ts = pd.date_range("2025-01-01T00:00:00Z", periods=24 * days, freq="h")
+    rng = np.random.default_rng(0)
+    pm25 = 20 + 10 * np.sin(np.arange(len(ts)) / 5) + rng.normal(0, 1, len(ts))
+    df = pd.DataFrame({"timestamp_utc": ts, "pm25": pm25, "no2": rng.normal(size=len(ts))})
+    return pre._add_target(pre._add_lags_and_rolls(pre._add_calendar_features(df)))
+
+def test_rolling_origin_splits_are_time_ordered_with_gap():
+    ts = pd.date_range("2025-01-01", periods=100, freq="h").asi8
+    splits = train.rolling_origin_splits(ts, n_folds=3, test_hours=10, gap_hours=1)
+    assert [len(te) for _, te in splits] == [10, 10, 10]
+    for k, (tr, te) in enumerate(splits):
+        assert ts[tr].max() < ts[te].min() - 3_600 * 10**9  # gap de una hora sin train
+        assert te[0] == 70 + 10 * k and len(tr) == 69 + 10 * k  # origen creciente
+
+def test_train_flow_writes_versioned_artifacts_and_latest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = _features()
+    now = datetime(2025, 2, 1, tzinfo=timezone.utc)
+    with patch.object(pre, "GCS_BUCKET", ""), \
+         patch.object(train.fstore, "load_features", return_value=df) as load:
+        metrics = train.TrainFlow.fn("2025-01-01", "2025-01-20", n_folds=3, test_hours=48, n_jobs=2, now=now)
+        bundle = train.load_latest()
+
+    assert load.call_args.kwargs["panel"] is False
+    assert metrics["summary"]["folds_ok"] == 3 and metrics["summary"]["roc_auc_mean"] > 0.8
+    assert [f["n_test"] for f in metrics["folds"]] == [48, 48, 48]
+    root = tmp_path / f"openaq/{pre.CITY}/models"
+    assert json.loads((root / "latest.json").read_text())["path"] == "v=20250201T000000/model.joblib"
+    assert (root / "v=20250201T000000/metrics.json").exists()
+    assert "pm25_lag1" in bundle["features"] and "pm25_next_hour" not in bundle["features"]
+    X = df[bundle["features"]].to_numpy(dtype=np.float32)
+    assert bundle["model"].predict_proba(X[:5]).shape == (5, 2)
+
+def test_training_frame_drops_rows_without_next_hour():
+    df = _features(days=2)
+    df = df[~df["timestamp_utc"].dt.hour.isin([5, 6])].reset_index(drop=True)  # hueco de dos horas
+    df = pre._add_target(df)
+    assert df["target_polluted_next_hour"].isna().sum() == 3  # 04:00 de cada día (antes del hueco) y la última hora
+    old = df.assign(target_polluted_next_hour=df["target_polluted_next_hour"].fillna(0))  # features viejos
+    for frame in (df, old):
+        X, y, ts, _ = train._training_frame(frame)
+        assert len(y) == len(df) - 3
+
+def test_training_frame_has_one_row_per_series_hour():
+    df = _features(days=2)
+    dup = df.iloc[10:14].assign(target_polluted_next_hour=1 - df["target_polluted_next_hour"].iloc[10:14])
+    for frame in (pd.concat([df, dup]), pd.concat([df.assign(location_id=1), df.assign(location_id=2)])):
+        X, y, ts, _ = train._training_frame(frame)
+        keys = frame.loc[frame["target_polluted_next_hour"].notna()].drop_duplicates(
+            [c for c in ("location_id", "timestamp_utc") if c in frame.columns])
+        assert len(y) == len(X) == len(keys)
+    X, y, ts, _ = train._training_frame(pd.concat([df, dup]))
+    assert len(np.unique(ts)) == len(ts)